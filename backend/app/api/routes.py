@@ -1,11 +1,23 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 import logging
+import os
+import re
+import pandas as pd
 
 from app.core.config import settings
-from app.storage.db import get_latest_run, list_runs, get_run
-from app.jobs.pipeline import run_all
+from app.core.telemetry import registry
+from app.storage.db import (
+    get_latest_run, list_runs, run_cursor, get_run, get_job, get_run_diagnostics, list_stage_diagnostics,
+    query_alerts, alert_counts, kpi_series, SECTIONS
+)
+from app.jobs.pipeline import run_all, run_range, run_scenarios, pipeline_stats
+from app.jobs.job_queue import JobQueue, QueueFull
+from app.ingest.loaders import append_ventas
+from app.ingest.sales_store import resolve_periodo, periodos_entre
+from app.rules.dsl import load_rules
 from app.llm.openai_provider import OpenAIProvider
 from app.llm.gemini_provider import GeminiProvider
 from app.demo.demo_routes import demo_router
@@ -14,8 +26,50 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 
 class RunRequest(BaseModel):
-    periodo: str  # "YYYY-MM"
+    periodo: str  # "YYYY-MM" | "YYYY-Qn" | "YYYY-MM:YTD" | "YYYY-MM:Tn" (últimos n meses)
     llm: Optional[str] = None  # "openai" | "gemini" | None
+    reglas: Optional[str] = None  # nombre de reglas por tenant (RULES_DIR/<nombre>.json)
+    force: bool = False  # true = recalcular aunque exista un resultado en caché
+    diagnostics: bool = False  # true = incluir tiempos/memoria por etapa en la respuesta
+
+class RunBatchRequest(BaseModel):
+    inicio: str  # "YYYY-MM"
+    fin: str  # "YYYY-MM" (inclusive)
+    reglas: Optional[str] = None
+    force: bool = False
+
+class Scenario(BaseModel):
+    # Variaciones relativas: 0.1 = +10%, -0.05 = -5%
+    nombre: Optional[str] = None
+    insumos_pct: Dict[str, float] = {}  # insumo_id o nombre_insumo -> variación del costo
+    precios_pct: Dict[str, float] = {}  # producto_id o categoria -> variación del precio
+    precio_pct: float = 0.0  # variación del precio de todos los productos
+    gastos_pct: float = 0.0  # variación de los gastos generales
+    valor_minuto: Optional[float] = None  # None = VALOR_MINUTO
+
+class ScenariosRequest(BaseModel):
+    periodo: str
+    escenarios: List[Scenario]
+    reglas: Optional[str] = None
+    productos: Optional[List[str]] = None  # producto_ids con detalle de margen por escenario
+
+class VentaRow(BaseModel):
+    fecha: str  # "YYYY-MM-DD"
+    producto_id: str
+    cantidad_vendida: float
+
+class VentasBatch(BaseModel):
+    rows: List[VentaRow]
+
+def _rules_path(nombre: Optional[str]) -> Optional[str]:
+    if not nombre:
+        return settings.RULES_PATH or None
+    if not re.fullmatch(r"[A-Za-z0-9_-]+", nombre):
+        raise HTTPException(status_code=400, detail="Nombre de reglas inválido")
+    path = os.path.join(settings.RULES_DIR, f"{nombre}.json")
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail=f"No existen reglas '{nombre}'")
+    return path
 
 @router.get("/health")
 def health():
@@ -33,7 +87,25 @@ def gemini_models() -> Dict[str, Any]:
 @router.post("/run")
 def run(req: RunRequest) -> Dict[str, Any]:
     logger.info(f"=== POST /run - periodo: {req.periodo}, llm: {req.llm} ===")
-    
+    rules_path = _validate_run(req)
+    try:
+        output = _execute_run(req, rules_path)
+    except ValueError as e:
+        # Datos inválidos (p.ej. validación de CSV o ciclo en recetas)
+        raise HTTPException(status_code=400, detail=str(e))
+    logger.info(f"Pipeline ejecutado - Alertas generadas: {len(output.get('alerts', []))}")
+    return output
+
+def _validate_run(req: RunRequest) -> Optional[str]:
+    rules_path = _rules_path(req.reglas)
+    try:
+        resolve_periodo(req.periodo)
+        load_rules(rules_path)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return rules_path
+
+def _execute_run(req: RunRequest, rules_path: Optional[str]) -> Dict[str, Any]:
     llm_provider = None
     if req.llm == "openai":
         logger.info("Creando OpenAIProvider...")
@@ -45,8 +117,8 @@ def run(req: RunRequest) -> Dict[str, Any]:
         logger.info("No se solicitó LLM")
 
     logger.info(f"LLM Provider creado: {type(llm_provider).__name__ if llm_provider else 'None'}")
-    
-    output = run_all(
+
+    return run_all(
         data_dir=settings.DATA_DIR,
         db_path=settings.DB_PATH,
         periodo=req.periodo,
@@ -55,26 +127,221 @@ def run(req: RunRequest) -> Dict[str, Any]:
         margen_objetivo_pct=settings.MARGEN_OBJETIVO_PCT,
         esfuerzo_alto_min=settings.ESFUERZO_ALTO_MIN,
         top_drivers=settings.TOP_DRIVERS,
-        llm_provider=llm_provider
+        llm_provider=llm_provider,
+        rules_path=rules_path,
+        force=req.force,
+        diagnostics=req.diagnostics
     )
-    
-    logger.info(f"Pipeline ejecutado - Alertas generadas: {len(output.get('alerts', []))}")
-    return output
+
+def _run_job(request: Dict[str, Any]) -> Dict[str, Any]:
+    req = RunRequest(**request)
+    return _execute_run(req, _rules_path(req.reglas))
+
+job_queue = JobQueue(
+    settings.DB_PATH,
+    handler=_run_job,
+    workers=settings.JOB_WORKERS,
+    max_queued=settings.JOB_QUEUE_MAX
+)
+registry.callback("sabia_job_queue_depth", "Jobs esperando en la cola de POST /jobs", job_queue.depth)
+
+@router.post("/jobs", status_code=202)
+def submit_job(req: RunRequest) -> Dict[str, Any]:
+    logger.info(f"=== POST /jobs - periodo: {req.periodo}, llm: {req.llm} ===")
+    _validate_run(req)
+    try:
+        job_id = job_queue.submit(req.model_dump())
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return {"job_id": job_id, "status": "queued"}
+
+@router.get("/jobs/{job_id}")
+def job_status(job_id: str) -> Dict[str, Any]:
+    job = get_job(settings.DB_PATH, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="job_id no encontrado")
+    result = get_run(settings.DB_PATH, job["run_id"]) if job["status"] == "done" else None
+    return {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "error": job["error"],
+        "result": result,
+    }
+
+@router.post("/run/batch")
+def run_batch(req: RunBatchRequest) -> Dict[str, Any]:
+    logger.info(f"=== POST /run/batch - {req.inicio}..{req.fin} ===")
+
+    rules_path = _rules_path(req.reglas)
+    try:
+        if len(periodos_entre(req.inicio, req.fin)) > settings.BATCH_MAX_PERIODOS:
+            raise HTTPException(status_code=400, detail=f"Máximo {settings.BATCH_MAX_PERIODOS} periodos por batch")
+        load_rules(rules_path)
+        outputs = run_range(
+            data_dir=settings.DATA_DIR,
+            db_path=settings.DB_PATH,
+            inicio=req.inicio,
+            fin=req.fin,
+            valor_minuto=settings.VALOR_MINUTO,
+            margen_critico_pct=settings.MARGEN_CRITICO_PCT,
+            margen_objetivo_pct=settings.MARGEN_OBJETIVO_PCT,
+            esfuerzo_alto_min=settings.ESFUERZO_ALTO_MIN,
+            top_drivers=settings.TOP_DRIVERS,
+            rules_path=rules_path,
+            force=req.force
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    logger.info(f"Batch ejecutado - {len(outputs)} periodos")
+    return {"inicio": req.inicio, "fin": req.fin, "runs": outputs}
+
+@router.post("/scenarios")
+def scenarios(req: ScenariosRequest) -> Dict[str, Any]:
+    logger.info(f"=== POST /scenarios - periodo: {req.periodo}, escenarios: {len(req.escenarios)} ===")
+    if not req.escenarios:
+        raise HTTPException(status_code=400, detail="No hay escenarios")
+    if len(req.escenarios) > settings.SCENARIOS_MAX:
+        raise HTTPException(status_code=400, detail=f"Máximo {settings.SCENARIOS_MAX} escenarios por request")
+
+    rules_path = _rules_path(req.reglas)
+    try:
+        resolve_periodo(req.periodo)
+        return run_scenarios(
+            data_dir=settings.DATA_DIR,
+            periodo=req.periodo,
+            scenarios=[s.model_dump() for s in req.escenarios],
+            valor_minuto=settings.VALOR_MINUTO,
+            margen_critico_pct=settings.MARGEN_CRITICO_PCT,
+            margen_objetivo_pct=settings.MARGEN_OBJETIVO_PCT,
+            esfuerzo_alto_min=settings.ESFUERZO_ALTO_MIN,
+            rules_path=rules_path,
+            productos_detalle=req.productos
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics() -> PlainTextResponse:
+    # Formato de exposición de Prometheus (text/plain; version=0.0.4)
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@router.get("/pipeline/stats")
+def stats() -> Dict[str, Any]:
+    # Contadores de caché, corridas ejecutadas vs coalescidas y cola de jobs
+    return {**pipeline_stats(), "jobs": {"queue_depth": job_queue.depth(), "workers": job_queue.workers}}
+
+@router.post("/ventas")
+def ingest_ventas(req: VentasBatch) -> Dict[str, Any]:
+    logger.info(f"=== POST /ventas - filas: {len(req.rows)} ===")
+    if not req.rows:
+        raise HTTPException(status_code=400, detail="El lote no trae filas")
+
+    rows = pd.DataFrame([r.model_dump() for r in req.rows])
+    try:
+        added = append_ventas(settings.DATA_DIR, rows)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"filas_agregadas": int(sum(added.values())), "por_periodo": added}
+
+def _sections(sections: Optional[str]) -> Optional[List[str]]:
+    # "kpis,report" -> ["kpis", "report"]; None = output completo
+    if sections is None:
+        return None
+    out = [s.strip() for s in sections.split(",") if s.strip()]
+    invalidas = [s for s in out if s not in SECTIONS]
+    if invalidas:
+        raise HTTPException(status_code=400, detail=f"Secciones inválidas {invalidas}; válidas: {list(SECTIONS)}")
+    return out
 
 @router.get("/runs/latest")
-def latest():
-    out = get_latest_run(settings.DB_PATH)
+def latest(periodo: Optional[str] = None, sections: Optional[str] = None):
+    # sections: "kpis", "report", "alerts" separadas por coma (solo se descomprime lo pedido)
+    out = get_latest_run(settings.DB_PATH, periodo=periodo, sections=_sections(sections))
     if not out:
+        if periodo:
+            raise HTTPException(status_code=404, detail=f"No hay corridas para {periodo}")
         raise HTTPException(status_code=404, detail="No hay corridas aún. Ejecuta POST /run.")
     return out
 
 @router.get("/runs")
-def runs(limit: int = 20):
-    return {"runs": list_runs(settings.DB_PATH, limit=limit)}
+def runs(
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    periodo: Optional[str] = None,
+    desde: Optional[str] = None,  # fecha ISO de creación (inclusive)
+    hasta: Optional[str] = None   # fecha ISO de creación (inclusive)
+):
+    # Paginación por cursor: pasar `next_cursor` como `cursor` para la página siguiente
+    limit = max(1, min(limit, 500))
+    try:
+        rows = list_runs(settings.DB_PATH, limit=limit, cursor=cursor, periodo=periodo, desde=desde, hasta=hasta)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    next_cursor = run_cursor(rows[-1]) if len(rows) == limit else None
+    return {"runs": rows, "next_cursor": next_cursor}
+
+@router.get("/runs/{run_id}/diagnostics")
+def run_diagnostics(run_id: str):
+    if not get_run(settings.DB_PATH, run_id, sections=[]):
+        raise HTTPException(status_code=404, detail="run_id no encontrado")
+    return {"run_id": run_id, "stages": get_run_diagnostics(settings.DB_PATH, run_id)}
+
+@router.get("/diagnostics")
+def diagnostics(stage: Optional[str] = None, limit: int = 100):
+    # Costo por etapa a través de corridas, para graficar
+    return {"stages": list_stage_diagnostics(settings.DB_PATH, stage=stage, limit=limit)}
+
+# Consultas entre corridas sobre las tablas normalizadas. `ultima`: solo la corrida más
+# reciente de cada periodo (false = todas las corridas guardadas). `desde`/`hasta`: meses
+# que debe cubrir la corrida; `ventanas`: incluir corridas de varios meses ("2024-Q1"...)
+@router.get("/alerts")
+def alerts(
+    tipo: Optional[str] = None,
+    severidad: Optional[str] = None,
+    producto_id: Optional[str] = None,
+    desde: Optional[str] = None,
+    hasta: Optional[str] = None,
+    ultima: bool = True,
+    ventanas: bool = False,
+    limit: int = 500
+):
+    try:
+        rows = query_alerts(
+            settings.DB_PATH, tipo=tipo, severidad=severidad, producto_id=producto_id,
+            desde=desde, hasta=hasta, ultima=ultima, limit=limit, ventanas=ventanas
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"alerts": rows}
+
+@router.get("/alerts/resumen")
+def alerts_resumen(
+    desde: Optional[str] = None,
+    hasta: Optional[str] = None,
+    ultima: bool = True,
+    ventanas: bool = False
+):
+    try:
+        resumen = alert_counts(settings.DB_PATH, desde=desde, hasta=hasta, ultima=ultima, ventanas=ventanas)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"resumen": resumen}
+
+@router.get("/kpis")
+def kpis(desde: Optional[str] = None, hasta: Optional[str] = None, ultima: bool = True, ventanas: bool = False):
+    try:
+        serie = kpi_series(settings.DB_PATH, desde=desde, hasta=hasta, ultima=ultima, ventanas=ventanas)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"kpis": serie}
 
 @router.get("/runs/{run_id}")
-def run_by_id(run_id: str):
-    out = get_run(settings.DB_PATH, run_id)
+def run_by_id(run_id: str, sections: Optional[str] = None):
+    out = get_run(settings.DB_PATH, run_id, sections=_sections(sections))
     if not out:
         raise HTTPException(status_code=404, detail="run_id no encontrado")
     return out
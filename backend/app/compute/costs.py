@@ -1,54 +1,114 @@
-from typing import Dict, Tuple
+from typing import Dict, List, Optional, Tuple
 import pandas as pd
 
+from .recipe_matrix import compile_recipes
+
+def unidades_por_producto(dfs: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+    """
+    producto_id, unidades_periodo. Usa dfs["unidades"] si viene precalculado
+    (agregado del store o lectura por bloques); si no, agrupa las filas de ventas.
+    """
+    if "unidades" in dfs:
+        return dfs["unidades"][["producto_id", "unidades_periodo"]]
+    unidades = dfs["ventas"].groupby("producto_id", as_index=False)["cantidad_vendida"].sum()
+    return unidades.rename(columns={"cantidad_vendida": "unidades_periodo"})
+
 def compute_costs(
     dfs: Dict[str, pd.DataFrame],
-    valor_minuto: float
+    valor_minuto: float,
+    meses: int = 1
 ) -> Tuple[pd.DataFrame, pd.DataFrame]:
     """
+    `meses`: largo de la ventana (trimestre = 3, ...). Los gastos generales son mensuales,
+    así que se prorratea monto_mensual x meses sobre las unidades de toda la ventana.
     Returns:
       - unit_costs: producto_id, costo_insumos_unit, costo_esfuerzo_unit, costo_indirectos_unit, costo_total_unit
       - recipe_drivers: producto_id, nombre_insumo, costo_insumo_unit (para top drivers)
     """
+    # Unidades vendidas por producto (para prorrateo / KPIs)
+    unidades = unidades_por_producto(dfs)
+
+    unit_costs, recipe_drivers = compute_base_costs(dfs, valor_minuto=valor_minuto)
+
+    total_unidades = float(unidades["unidades_periodo"].sum()) if len(unidades) else 0.0
+    unit_costs["costo_indirectos_unit"] = indirect_unit_cost(dfs["gastos_generales"], total_unidades, meses=meses)
+    unit_costs["costo_total_unit"] = (
+        unit_costs["costo_insumos_unit"]
+        + unit_costs["costo_esfuerzo_unit"]
+        + unit_costs["costo_indirectos_unit"]
+    )
+
+    return unit_costs, recipe_drivers
+
+def compute_costs_panel(
+    dfs: Dict[str, pd.DataFrame],
+    unidades_panel: pd.DataFrame,
+    periodos: List[str],
+    valor_minuto: float
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Costos unitarios para varios periodos a la vez. Insumos y esfuerzo se calculan una
+    sola vez; solo el prorrateo de indirectos depende de las unidades de cada periodo.
+    `unidades_panel`: periodo, producto_id, unidades_periodo.
+    Retorna unit_costs con columna `periodo` (ordenado periodo -> producto) y recipe_drivers.
+    """
+    base, recipe_drivers = compute_base_costs(dfs, valor_minuto=valor_minuto)
+
+    totales = unidades_panel.groupby("periodo")["unidades_periodo"].sum()
+    gastos = dfs["gastos_generales"]
+    indirectos = {p: indirect_unit_cost(gastos, float(totales.get(p, 0.0))) for p in periodos}
+
+    n = len(base)
+    panel = pd.concat([base] * len(periodos), ignore_index=True) if periodos else base.head(0).copy()
+    panel.insert(0, "periodo", [p for p in periodos for _ in range(n)])
+    panel["costo_indirectos_unit"] = panel["periodo"].map(indirectos).astype(float)
+    panel["costo_total_unit"] = (
+        panel["costo_insumos_unit"]
+        + panel["costo_esfuerzo_unit"]
+        + panel["costo_indirectos_unit"]
+    )
+    return panel, recipe_drivers
+
+def indirect_unit_cost(gastos: pd.DataFrame, total_unidades: float, meses: int = 1) -> float:
+    # ===== Prorrateo gastos indirectos =====
+    total_gastos = float(gastos["monto_mensual"].sum()) * meses
+    if total_unidades <= 0:
+        return 0.0
+    return total_gastos / total_unidades
+
+def compute_base_costs(
+    dfs: Dict[str, pd.DataFrame],
+    valor_minuto: float,
+    drivers: bool = True
+) -> Tuple[pd.DataFrame, Optional[pd.DataFrame]]:
+    """
+    Costos que no dependen del periodo (insumos y esfuerzo).
+    Returns:
+      - base: producto_id, costo_insumos_unit, tiempo_total_min, costo_esfuerzo_unit
+      - recipe_drivers: producto_id, nombre_insumo, costo_insumo_unit (None si drivers=False)
+    """
     productos = dfs["productos"]
-    ventas = dfs["ventas"]
     insumos = dfs["insumos"]
     recetas = dfs["recetas"]
     tiempos = dfs["tiempos_produccion"]
-    gastos = dfs["gastos_generales"]
-
-    # Unidades vendidas por producto (para prorrateo / KPIs)
-    unidades = ventas.groupby("producto_id", as_index=False)["cantidad_vendida"].sum()
-    unidades = unidades.rename(columns={"cantidad_vendida": "unidades_periodo"})
 
     # ===== Costo insumos unitario por producto =====
-    # recetas * costo_unitario
-    receta_cost = recetas.merge(insumos[["insumo_id", "nombre_insumo", "costo_unitario"]],
-                               on="insumo_id", how="left")
-    receta_cost["costo_insumo_unit"] = receta_cost["cantidad"] * receta_cost["costo_unitario"]
-
-    # total por producto
-    costo_insumos = receta_cost.groupby("producto_id", as_index=False)["costo_insumo_unit"].sum()
-    costo_insumos = costo_insumos.rename(columns={"costo_insumo_unit": "costo_insumos_unit"})
+    # Matriz dispersa producto x insumo (compilada una vez por versión de recetas) @ costos;
+    # los subproductos (recetas multinivel) se acumulan en orden topológico
+    mat = compile_recipes(recetas, insumos["insumo_id"])
+    costo_insumos = pd.DataFrame({
+        "producto_id": mat.productos.to_numpy(),
+        "costo_insumos_unit": mat.unit_costs(insumos),
+    })
 
     # drivers (por insumo) para explicación
-    recipe_drivers = receta_cost.groupby(
-        ["producto_id", "nombre_insumo"], as_index=False
-    )["costo_insumo_unit"].sum()
+    recipe_drivers = mat.drivers(insumos) if drivers else None
 
     # ===== Costo esfuerzo unitario por producto =====
     esfuerzo = tiempos.copy()
     esfuerzo["costo_esfuerzo_unit"] = esfuerzo["tiempo_total_min"] * float(valor_minuto)
     esfuerzo = esfuerzo[["producto_id", "tiempo_total_min", "costo_esfuerzo_unit"]]
 
-    # ===== Prorrateo gastos indirectos =====
-    total_gastos = float(gastos["monto_mensual"].sum())
-    total_unidades = float(unidades["unidades_periodo"].sum()) if len(unidades) else 0.0
-    if total_unidades <= 0:
-        costo_indirectos_unit = 0.0
-    else:
-        costo_indirectos_unit = total_gastos / total_unidades
-
     # ===== Combine =====
     unit_costs = productos[["producto_id"]].merge(costo_insumos, on="producto_id", how="left")
     unit_costs = unit_costs.merge(esfuerzo[["producto_id", "tiempo_total_min", "costo_esfuerzo_unit"]],
@@ -57,11 +117,12 @@ def compute_costs(
     unit_costs["tiempo_total_min"] = unit_costs["tiempo_total_min"].fillna(0.0)
     unit_costs["costo_esfuerzo_unit"] = unit_costs["costo_esfuerzo_unit"].fillna(0.0)
 
-    unit_costs["costo_indirectos_unit"] = costo_indirectos_unit
-    unit_costs["costo_total_unit"] = (
-        unit_costs["costo_insumos_unit"]
-        + unit_costs["costo_esfuerzo_unit"]
-        + unit_costs["costo_indirectos_unit"]
-    )
+    if mat.multilevel:
+        # El tiempo de elaborar los subproductos usados también es esfuerzo del producto
+        propio = tiempos.drop_duplicates("producto_id").set_index("producto_id")["tiempo_total_min"]
+        propio = propio.reindex(mat.productos).fillna(0.0).to_numpy(dtype=float)
+        extra = pd.Series(mat.rollup(propio) - propio, index=mat.productos)
+        unit_costs["tiempo_total_min"] += unit_costs["producto_id"].map(extra).fillna(0.0).to_numpy()
+        unit_costs["costo_esfuerzo_unit"] = unit_costs["tiempo_total_min"] * float(valor_minuto)
 
     return unit_costs, recipe_drivers
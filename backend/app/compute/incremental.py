@@ -0,0 +1,120 @@
+"""
+Recálculo incremental cuando solo cambian los insumos (precios o nombres).
+
+`insumo_dependents` indexa recetas: insumo_id -> productos que lo usan (también vía
+subproductos en recetas multinivel). Con el estado
+de la corrida anterior (CostState) y los insumos nuevos, `update_costs` recalcula
+costos y métricas solo de los productos afectados y conserva el resto de las filas.
+Indirectos y unidades no dependen de insumos, así que se reutilizan tal cual.
+"""
+
+from typing import Dict, List, Optional, Set, Tuple
+import numpy as np
+import pandas as pd
+
+from .costs import compute_base_costs
+from .metrics import compute_metrics
+from .recipe_matrix import compile_recipes
+
+_INSUMO_COLS = ["insumo_id", "nombre_insumo", "costo_unitario"]
+
+def insumo_dependents(recetas: pd.DataFrame, insumo_ids: Optional[pd.Series] = None) -> Dict[str, np.ndarray]:
+    # insumo_id -> producto_ids (únicos) que lo usan en su receta, directo o vía subproductos
+    return compile_recipes(recetas, insumo_ids).dependents()
+
+def changed_insumos(prev: pd.DataFrame, new: pd.DataFrame) -> Set[str]:
+    """
+    insumo_ids con costo o nombre distinto, agregados o eliminados.
+    """
+    a = prev[_INSUMO_COLS].drop_duplicates("insumo_id").set_index("insumo_id")
+    b = new[_INSUMO_COLS].drop_duplicates("insumo_id").set_index("insumo_id")
+    out = set(a.index.symmetric_difference(b.index))
+    comunes = a.index.intersection(b.index)
+    a, b = a.loc[comunes], b.loc[comunes]
+    distinto = (a["nombre_insumo"] != b["nombre_insumo"]) | ~(
+        (a["costo_unitario"] == b["costo_unitario"]) | (a["costo_unitario"].isna() & b["costo_unitario"].isna())
+    )
+    out.update(comunes[distinto.to_numpy()])
+    return out
+
+class CostState:
+    """
+    Resultado intermedio de una corrida, reutilizable mientras solo cambien insumos.
+    Los frames no se mutan: cada actualización produce un estado nuevo.
+    """
+
+    def __init__(
+        self,
+        dfs: Dict[str, pd.DataFrame],
+        unit_costs: pd.DataFrame,
+        recipe_drivers: pd.DataFrame,
+        metrics: pd.DataFrame,
+        evidence: Dict[str, List[dict]],
+        dependents: Optional[Dict[str, np.ndarray]] = None
+    ) -> None:
+        self.dfs = dfs
+        self.unit_costs = unit_costs
+        self.recipe_drivers = recipe_drivers
+        self.metrics = metrics
+        # producto_id -> alertas con evidencia (sin alert_id), en orden de precedencia
+        self.evidence = evidence
+        self.dependents = dependents if dependents is not None else insumo_dependents(
+            dfs["recetas"], dfs["insumos"]["insumo_id"]
+        )
+
+    def affected(self, insumos: pd.DataFrame) -> Set[str]:
+        cambiados = changed_insumos(self.dfs["insumos"], insumos)
+        mat = compile_recipes(self.dfs["recetas"], self.dfs["insumos"]["insumo_id"])
+        if mat.subproductos.isin(list(cambiados)).any():
+            # Un subproducto pasó a ser (o dejó de ser) insumo: cambia la estructura de recetas
+            return set(self.dfs["productos"]["producto_id"])
+        out: Set[str] = set()
+        for insumo_id in cambiados:
+            out.update(self.dependents.get(insumo_id, ()))
+        return out
+
+def update_costs(
+    state: CostState,
+    insumos: pd.DataFrame,
+    affected: Set[str],
+    valor_minuto: float
+) -> Tuple[Dict[str, pd.DataFrame], pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Recalcula unit_costs, recipe_drivers y métricas solo para `affected`.
+    Retorna (dfs con insumos nuevos, unit_costs, recipe_drivers, metrics). unit_costs y
+    metrics quedan en el mismo orden que un cálculo completo; recipe_drivers conserva el
+    orden dentro de cada producto (lo único que usa top_drivers), no el global.
+    """
+    dfs = {**state.dfs, "insumos": insumos}
+    # Recetas y tiempos de los afectados y de los subproductos que usan (a cualquier nivel)
+    mat = compile_recipes(dfs["recetas"], insumos["insumo_id"])
+    alcance = affected.union(mat.components(affected)) if mat.multilevel else affected
+    sub = {
+        **dfs,
+        "productos": dfs["productos"][dfs["productos"]["producto_id"].isin(affected)],
+        "recetas": dfs["recetas"][dfs["recetas"]["producto_id"].isin(alcance)],
+        "tiempos_produccion": dfs["tiempos_produccion"][dfs["tiempos_produccion"]["producto_id"].isin(alcance)],
+    }
+
+    base, drivers_sub = compute_base_costs(sub, valor_minuto=valor_minuto)
+    drivers_sub = drivers_sub[drivers_sub["producto_id"].isin(affected)]
+    indirecto = state.unit_costs["costo_indirectos_unit"]
+    base["costo_indirectos_unit"] = float(indirecto.iloc[0]) if len(indirecto) else 0.0
+    base["costo_total_unit"] = base["costo_insumos_unit"] + base["costo_esfuerzo_unit"] + base["costo_indirectos_unit"]
+
+    unit_costs = _replace_rows(state.unit_costs, base, affected)
+    metrics = _replace_rows(state.metrics, compute_metrics(sub, unit_costs=base), affected)
+
+    rd = state.recipe_drivers
+    recipe_drivers = pd.concat([rd[~rd["producto_id"].isin(affected)], drivers_sub], ignore_index=True)
+    return dfs, unit_costs, recipe_drivers, metrics
+
+def _replace_rows(frame: pd.DataFrame, rows: pd.DataFrame, affected: Set[str]) -> pd.DataFrame:
+    # `rows` viene en el mismo orden relativo que las filas afectadas de `frame`
+    idx = np.flatnonzero(frame["producto_id"].isin(affected).to_numpy())
+    out = {}
+    for c in frame.columns:
+        col = frame[c].to_numpy(copy=True)
+        col[idx] = rows[c].to_numpy()
+        out[c] = col
+    return pd.DataFrame(out, index=frame.index)
@@ -1,5 +1,17 @@
 from typing import Dict
+import numpy as np
 import pandas as pd
+from .costs import unidades_por_producto
+
+# Columnas finales útiles
+METRIC_COLUMNS = [
+    "producto_id", "nombre_producto", "categoria",
+    "precio", "unidades_periodo", "ingreso_total",
+    "costo_insumos_unit", "costo_esfuerzo_unit", "costo_indirectos_unit", "costo_total_unit",
+    "margen_abs_unit", "margen_pct",
+    "contribucion_total", "perdida_total",
+    "tiempo_total_min", "eficiencia_min_por_margen",
+]
 
 def compute_metrics(
     dfs: Dict[str, pd.DataFrame],
@@ -9,39 +21,78 @@ def compute_metrics(
     Returns product-level metrics for the selected period (ventas already filtered upstream if needed).
     """
     productos = dfs["productos"]
-    ventas = dfs["ventas"]
-
-    unidades = ventas.groupby("producto_id", as_index=False)["cantidad_vendida"].sum()
-    unidades = unidades.rename(columns={"cantidad_vendida": "unidades_periodo"})
+    unidades = unidades_por_producto(dfs)
 
     m = productos.merge(unit_costs, on="producto_id", how="left").merge(unidades, on="producto_id", how="left")
+    return _finish(m)[METRIC_COLUMNS]
+
+def compute_metrics_panel(
+    dfs: Dict[str, pd.DataFrame],
+    unit_costs: pd.DataFrame
+) -> pd.DataFrame:
+    """
+    Métricas de varios periodos en un solo frame (ver compute_costs_panel): una fila por
+    (periodo, producto), ordenadas periodo -> producto. dfs["unidades"] trae columna `periodo`.
+    """
+    productos = dfs["productos"]
+    periodos = list(pd.unique(unit_costs["periodo"]))
+    unidades = dfs["unidades"][["periodo", "producto_id", "unidades_periodo"]]
+
+    n = len(productos)
+    panel = pd.concat([productos] * len(periodos), ignore_index=True) if periodos else productos.head(0).copy()
+    panel.insert(0, "periodo", [p for p in periodos for _ in range(n)])
+
+    on = ["periodo", "producto_id"]
+    m = panel.merge(unit_costs, on=on, how="left").merge(unidades, on=on, how="left")
+    return _finish(m)[["periodo"] + METRIC_COLUMNS]
+
+def _finish(m: pd.DataFrame) -> pd.DataFrame:
     m["unidades_periodo"] = m["unidades_periodo"].fillna(0.0)
 
     m["precio"] = m["precio_venta_actual"]
     m["ingreso_total"] = m["precio"] * m["unidades_periodo"]
 
     m["margen_abs_unit"] = m["precio"] - m["costo_total_unit"]
-    # Evitar división por cero
-    m["margen_pct"] = m.apply(lambda r: (r["margen_abs_unit"] / r["precio"]) if r["precio"] else 0.0, axis=1)
-
-    m["contribucion_total"] = m["margen_abs_unit"] * m["unidades_periodo"]
-    m["perdida_total"] = m.apply(lambda r: (-r["margen_abs_unit"] * r["unidades_periodo"]) if r["margen_abs_unit"] < 0 else 0.0, axis=1)
-
-    # Eficiencia (min por $ de margen positivo). Si margen<=0, eficiencia = infinito conceptual -> usamos None
-    def eff(r):
-        if r["margen_abs_unit"] <= 0:
-            return None
-        return float(r["tiempo_total_min"]) / float(r["margen_abs_unit"]) if r["margen_abs_unit"] else None
-
-    m["eficiencia_min_por_margen"] = m.apply(eff, axis=1)
-
-    # Columnas finales útiles
-    cols = [
-        "producto_id", "nombre_producto", "categoria",
-        "precio", "unidades_periodo", "ingreso_total",
-        "costo_insumos_unit", "costo_esfuerzo_unit", "costo_indirectos_unit", "costo_total_unit",
-        "margen_abs_unit", "margen_pct",
-        "contribucion_total", "perdida_total",
-        "tiempo_total_min", "eficiencia_min_por_margen",
-    ]
-    return m[cols]
+    return derive_margins(m)
+
+def derive_margins(m: pd.DataFrame) -> pd.DataFrame:
+    """
+    Columnas derivadas del margen, vectorizadas (sin apply por fila). Requiere precio,
+    margen_abs_unit, unidades_periodo y tiempo_total_min. Modifica `m` y lo retorna.
+    """
+    cols = margin_arrays(
+        m["precio"].to_numpy(dtype=float),
+        m["margen_abs_unit"].to_numpy(dtype=float),
+        m["unidades_periodo"].to_numpy(dtype=float),
+        m["tiempo_total_min"].to_numpy(dtype=float),
+    )
+    for c, v in cols.items():
+        m[c] = v
+    return m
+
+def margin_arrays(
+    precio: np.ndarray,
+    margen: np.ndarray,
+    unidades: np.ndarray,
+    tiempo: np.ndarray
+) -> Dict[str, np.ndarray]:
+    """
+    Núcleo de derive_margins sobre arrays que se puedan combinar por broadcasting
+    (1-D por producto o 2-D productos x escenarios, ver compute.scenarios).
+    """
+    out: Dict[str, np.ndarray] = {}
+    # Evitar división por cero: precio 0 -> margen_pct 0.0 (NaN se propaga)
+    shape = np.broadcast_shapes(precio.shape, margen.shape)
+    precio, margen = np.broadcast_to(precio, shape), np.broadcast_to(margen, shape)
+    out["margen_pct"] = np.divide(margen, precio, out=np.zeros(shape), where=(precio != 0))
+
+    out["contribucion_total"] = margen * unidades
+    out["perdida_total"] = np.where(margen < 0, -margen * unidades, 0.0)
+
+    # Eficiencia (min por $ de margen positivo). Si margen<=0, eficiencia = infinito conceptual -> NaN
+    shape = np.broadcast_shapes(tiempo.shape, margen.shape)
+    out["eficiencia_min_por_margen"] = np.divide(
+        np.broadcast_to(tiempo, shape), np.broadcast_to(margen, shape),
+        out=np.full(shape, np.nan), where=~(margen <= 0)
+    )
+    return out
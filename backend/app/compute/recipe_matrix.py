@@ -0,0 +1,290 @@
+"""
+Recetas compiladas a matrices dispersas (CSR) de cantidades.
+
+    mat = compile_recipes(recetas, insumos["insumo_id"])   # cacheada por versión de recetas
+    costo = mat.unit_costs(insumos)         # costo de insumos por producto
+    costos = mat.scenario_costs(C)          # una columna por escenario de precios
+
+Recetas multinivel: un componente (columna insumo_id) es un subproducto si tiene filas
+propias en recetas y no es un insumo. Entonces Q (producto x insumo hoja) guarda las
+cantidades directas de insumos y S (producto x producto) las de subproductos. Los
+productos se agrupan por nivel (0 = sin subproductos, n = usa alguno de nivel n-1) y
+el costo se acumula nivel por nivel: x[nivel] += S[nivel] @ x, reutilizando el costo ya
+calculado de cada intermedio; cada arista del grafo se recorre una sola vez.
+
+La compilación solo se repite cuando cambia el contenido de recetas; cambios de precios
+de insumos reutilizan la misma matriz.
+"""
+
+from typing import Iterable, List, Optional, Tuple
+from collections import OrderedDict
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+_RECETA_COLS = ["producto_id", "insumo_id", "cantidad"]
+
+class RecipeMatrix:
+    def __init__(self, recetas: pd.DataFrame, insumo_ids: Iterable[str] = ()) -> None:
+        r = recetas[_RECETA_COLS]
+        # Filas: productos con receta (orden de aparición)
+        self.productos = pd.Index(pd.unique(r["producto_id"]))
+        componentes = r["insumo_id"].to_numpy()
+        pos = self.productos.get_indexer(componentes)
+        # Un componente con receta propia es subproducto, salvo que exista como insumo
+        es_sub = pos >= 0
+        insumo_ids = pd.Index(insumo_ids)
+        if es_sub.any() and len(insumo_ids):
+            es_sub &= ~pd.Index(componentes).isin(insumo_ids)
+        rows = self.productos.get_indexer(r["producto_id"])
+        qty = np.nan_to_num(r["cantidad"].to_numpy(dtype=float), nan=0.0)
+        n = len(self.productos)
+
+        # Columnas de Q: insumos hoja referenciados (orden de aparición)
+        hoja = ~es_sub
+        self.insumos = pd.Index(pd.unique(componentes[hoja]))
+        cols = self.insumos.get_indexer(componentes[hoja])
+        # Filas repetidas (producto, componente) se suman
+        self.Q = sparse.csr_matrix((qty[hoja], (rows[hoja], cols)), shape=(n, len(self.insumos)))
+        self.Q.sum_duplicates()
+        self.S = sparse.csr_matrix((qty[es_sub], (rows[es_sub], pos[es_sub])), shape=(n, n))
+        self.S.sum_duplicates()
+        self.subproductos = self.productos[np.unique(pos[es_sub])]
+        # Nivel de cada producto (0 = sin subproductos) y filas de S agrupadas por nivel
+        self.level, self.levels = _levels(self.S, self.productos)
+        self._flat: Optional[sparse.csr_matrix] = None
+        # Posición de cada producto en orden alfabético (orden de salida de drivers)
+        self._rank = np.empty(len(self.productos), dtype=np.int64)
+        self._rank[np.argsort(self.productos.to_numpy(), kind="stable")] = np.arange(len(self.productos))
+
+    @property
+    def shape(self):
+        return self.Q.shape
+
+    def cost_vector(self, insumos: pd.DataFrame) -> np.ndarray:
+        """
+        costo_unitario alineado a las columnas de la matriz (0 si el insumo no existe o es NaN).
+        """
+        ins = insumos.drop_duplicates("insumo_id")
+        pos = self.insumos.get_indexer(ins["insumo_id"])
+        ok = pos >= 0
+        c = np.zeros(len(self.insumos))
+        c[pos[ok]] = np.nan_to_num(ins["costo_unitario"].to_numpy(dtype=float)[ok], nan=0.0)
+        return c
+
+    @property
+    def multilevel(self) -> bool:
+        return len(self.levels) > 0
+
+    def rollup(self, own: np.ndarray) -> np.ndarray:
+        """
+        Acumula por el árbol de recetas un valor propio de cada producto (vector o una
+        columna por escenario): total = propio + cantidades de subproductos x su total.
+        """
+        x = np.asarray(own, dtype=float)
+        if self.levels:
+            x = x.copy()
+        for rows, S in self.levels:
+            x[rows] += S @ x
+        return x
+
+    def unit_costs(self, insumos: pd.DataFrame) -> np.ndarray:
+        # Costo de insumos por producto (filas de self.productos), incluido el de subproductos
+        return self.rollup(self.Q @ self.cost_vector(insumos))
+
+    def scenario_costs(self, costos: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        `costos`: (n_insumos x n_escenarios), filas alineadas a self.insumos (ver cost_vector).
+        Retorna (n_productos x n_escenarios), o solo las filas `rows` (posiciones en
+        self.productos) si se indican: el resto no se calcula salvo los subproductos que usan.
+        """
+        if rows is None:
+            out = self.Q @ costos
+            return self.rollup(out.toarray() if sparse.issparse(out) else np.asarray(out))
+        # Solo las filas pedidas y los subproductos que usan, en un espacio compacto
+        need = np.unique(rows)
+        if self.multilevel:
+            need = np.union1d(need, self.productos.get_indexer(self.components(self.productos[need])))
+        x = self.Q[need] @ costos
+        x = x.toarray() if sparse.issparse(x) else np.asarray(x, dtype=float)
+        if self.multilevel:
+            S = self.S[need][:, need]
+            level = self.level[need]
+            for lvl in range(1, int(level.max()) + 1):
+                r = np.flatnonzero(level == lvl)
+                if len(r):
+                    x[r] += S[r] @ x
+        return x[np.searchsorted(need, rows)]
+
+    def flat(self) -> sparse.csr_matrix:
+        """
+        Cantidades de insumos hoja por producto con los subproductos expandidos
+        (Q si la receta es de un solo nivel). Se calcula una vez por matriz.
+        """
+        if self._flat is None:
+            L = self.Q
+            n = L.shape[0]
+            for rows, S in self.levels:
+                delta = (S @ L).tocsr()
+                counts = np.zeros(n, dtype=np.int64)
+                counts[rows] = np.diff(delta.indptr)
+                indptr = np.concatenate([[0], np.cumsum(counts)])
+                L = L + sparse.csr_matrix((delta.data, delta.indices, indptr), shape=L.shape)
+            L = L.tocsr()
+            L.sum_duplicates()
+            self._flat = L
+        return self._flat
+
+    def components(self, productos: Iterable[str]) -> pd.Index:
+        # Subproductos usados (a cualquier profundidad) por `productos`
+        frontier = np.unique(self.productos.get_indexer(pd.Index(productos)))
+        frontier = frontier[frontier >= 0]
+        seen = np.zeros(len(self.productos), dtype=bool)
+        out = []
+        while len(frontier):
+            hijos = np.unique(self.S[frontier].indices)
+            hijos = hijos[~seen[hijos]]
+            seen[hijos] = True
+            out.append(hijos)
+            frontier = hijos
+        return self.productos[np.concatenate(out)] if out else self.productos[:0]
+
+    def dependents(self) -> dict:
+        # insumo_id hoja -> producto_ids que lo usan (directo o vía subproductos)
+        csc = self.flat().tocsc()
+        prods = self.productos.to_numpy()
+        return {
+            ins: prods[csc.indices[csc.indptr[j]:csc.indptr[j + 1]]]
+            for j, ins in enumerate(self.insumos)
+        }
+
+    def drivers(self, insumos: pd.DataFrame) -> pd.DataFrame:
+        """
+        producto_id, nombre_insumo, costo_insumo_unit (costo por insumo dentro de cada receta),
+        ordenado por producto_id y nombre_insumo. Los subproductos se expanden a sus insumos
+        hoja; insumos con el mismo nombre en una receta se suman; insumos inexistentes no
+        aportan driver.
+        """
+        ins = insumos.drop_duplicates("insumo_id")
+        pos = self.insumos.get_indexer(ins["insumo_id"])
+        ok = pos >= 0
+        nombres = np.full(len(self.insumos), None, dtype=object)
+        nombres[pos[ok]] = ins["nombre_insumo"].to_numpy()[ok]
+        codes, uniques = pd.factorize(nombres, sort=True)
+
+        # Agrupa por códigos enteros (rango de producto, código de nombre) en vez de strings
+        coo = self.flat().tocoo()
+        name = codes[coo.col]
+        keep = name >= 0
+        row, name = coo.row[keep], name[keep]
+        val = (coo.data * self.cost_vector(insumos)[coo.col])[keep]
+        key = self._rank[row] * max(len(uniques), 1) + name
+        order = np.argsort(key, kind="stable")
+        key = key[order]
+        starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]]) if len(key) else np.array([], dtype=np.int64)
+        sums = np.add.reduceat(val[order], starts) if len(key) else np.array([], dtype=float)
+        return pd.DataFrame({
+            "producto_id": self.productos.to_numpy()[row[order][starts]],
+            "nombre_insumo": np.asarray(uniques, dtype=object)[name[order][starts]],
+            "costo_insumo_unit": sums,
+        })
+
+def _levels(
+    S: sparse.csr_matrix,
+    productos: pd.Index
+) -> Tuple[np.ndarray, List[Tuple[np.ndarray, sparse.csr_matrix]]]:
+    """
+    Orden topológico por niveles (Kahn vectorizado). Retorna (nivel por producto,
+    [(filas del nivel, S[filas])] de los niveles >= 1, de menor a mayor). ValueError si
+    hay un ciclo.
+    """
+    n = S.shape[0]
+    if S.nnz == 0:
+        return np.zeros(n, dtype=np.int64), []
+    pendientes = np.diff(S.indptr).astype(np.int64)   # subproductos distintos aún sin costo
+    padres = S.tocsc()
+    level = np.full(n, -1, dtype=np.int64)
+    frontier = np.flatnonzero(pendientes == 0)
+    out = []
+    lvl = 0
+    while len(frontier):
+        level[frontier] = lvl
+        if lvl > 0:
+            out.append((frontier, S[frontier]))
+        p = padres.indices[_ranges(padres.indptr[frontier], padres.indptr[frontier + 1])]
+        np.subtract.at(pendientes, p, 1)
+        p = np.unique(p)
+        frontier = p[pendientes[p] == 0]
+        lvl += 1
+    if (level < 0).any():
+        raise ValueError("Ciclo en recetas: " + " -> ".join(_find_cycle(S, level, productos)))
+    return level, out
+
+def _ranges(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    # Concatenación de arange(start, end) por par, sin bucle en Python
+    counts = ends - starts
+    offsets = np.repeat(starts - np.concatenate([[0], np.cumsum(counts)[:-1]]), counts)
+    return offsets + np.arange(counts.sum())
+
+def _find_cycle(S: sparse.csr_matrix, level: np.ndarray, productos: pd.Index) -> List[str]:
+    # Recorre subproductos sin nivel asignado hasta repetir uno (todo nodo sin nivel
+    # tiene al menos un hijo sin nivel, así que siempre se cierra un ciclo)
+    node = int(np.flatnonzero(level < 0)[0])
+    path: List[int] = []
+    seen = {}
+    while node not in seen:
+        seen[node] = len(path)
+        path.append(node)
+        hijos = S.indices[S.indptr[node]:S.indptr[node + 1]]
+        node = int(hijos[level[hijos] < 0][0])
+    ciclo = path[seen[node]:] + [node]
+    return [str(productos[i]) for i in ciclo]
+
+def recipes_hash(recetas: pd.DataFrame) -> str:
+    h = pd.util.hash_pandas_object(recetas[_RECETA_COLS], index=False).to_numpy()
+    return hashlib.blake2b(h.tobytes(), digest_size=16).hexdigest() + f":{len(recetas)}"
+
+_MAX_ENTRIES = 8
+_cache: "OrderedDict[str, RecipeMatrix]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+def compile_recipes(recetas: pd.DataFrame, insumo_ids: Optional[Iterable[str]] = None) -> RecipeMatrix:
+    """
+    Matriz de recetas, cacheada (LRU): se recompila solo si cambian las recetas. La clave es
+    la huella del archivo de origen (attrs["source"], ver load_csvs) si el frame tiene todas
+    las filas que se leyeron, o un hash del contenido. Un subconjunto de filas (p.ej. los
+    productos afectados en update_costs) hereda attrs, así que siempre va por contenido:
+    dos subconjuntos distintos pueden tener la misma cantidad de filas.
+    `insumo_ids`: insumos existentes; un componente que también es insumo no se expande.
+    """
+    source = recetas.attrs.get("source")
+    completo = source and recetas.attrs.get("source_rows") == len(recetas)
+    key = f"{source}:{len(recetas)}" if completo else recipes_hash(recetas)
+    mat = _get(key)
+    if mat is None:
+        mat = _put(key, RecipeMatrix(recetas))
+    if insumo_ids is not None and len(mat.subproductos):
+        # Caso raro: ids de subproducto que también existen como insumo
+        choque = sorted(mat.subproductos.intersection(pd.Index(insumo_ids)))
+        if choque:
+            key += ":insumos=" + hashlib.blake2b("\x00".join(map(str, choque)).encode(), digest_size=8).hexdigest()
+            mat = _get(key)
+            if mat is None:
+                mat = _put(key, RecipeMatrix(recetas, choque))
+    return mat
+
+def _get(key: str) -> Optional[RecipeMatrix]:
+    with _cache_lock:
+        mat = _cache.get(key)
+        if mat is not None:
+            _cache.move_to_end(key)
+        return mat
+
+def _put(key: str, mat: RecipeMatrix) -> RecipeMatrix:
+    with _cache_lock:
+        _cache[key] = mat
+        while len(_cache) > _MAX_ENTRIES:
+            _cache.popitem(last=False)
+    return mat
@@ -0,0 +1,192 @@
+"""
+Escenarios what-if evaluados en lote sobre el modelo de costos compilado.
+
+Cada escenario combina variaciones relativas (0.1 = +10%, -0.05 = -5%):
+  - insumos_pct: {insumo_id o nombre_insumo: variación del costo_unitario}
+  - precios_pct: {producto_id o categoria: variación del precio}
+  - precio_pct: variación del precio de todos los productos
+  - gastos_pct: variación de los gastos generales
+  - valor_minuto: valor del minuto de esfuerzo (None = el de la corrida)
+
+Los costos de insumos de todos los escenarios salen de una multiplicación dispersa
+(recetas @ costos, una columna por escenario); métricas y reglas se evalúan sobre
+arrays productos x escenarios. La columna 0 es siempre la base (sin cambios). Con
+catálogos grandes los escenarios se procesan en bloques para acotar la memoria.
+"""
+
+from typing import Any, Dict, List, Optional
+import numpy as np
+import pandas as pd
+
+from .costs import compute_base_costs, unidades_por_producto
+from .metrics import margin_arrays
+from .recipe_matrix import compile_recipes
+from app.rules.dsl import RuleSet
+
+# Celdas (productos x escenarios) por bloque
+_BLOCK_CELLS = 2_000_000
+
+def evaluate_scenarios(
+    dfs: Dict[str, pd.DataFrame],
+    scenarios: List[Dict[str, Any]],
+    valor_minuto: float,
+    rules: RuleSet,
+    params: Dict[str, float],
+    meses: int = 1,
+    productos_detalle: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    """
+    Retorna {"base": resumen, "escenarios": [resumen, ...]} en el orden recibido. Cada
+    resumen trae contribución, ingreso, costo, margen promedio, pérdida, alertas por tipo
+    y, si se pide `productos_detalle`, precio/costo/margen de esos productos.
+    """
+    productos = dfs["productos"]
+    insumos = dfs["insumos"]
+    ids = productos["producto_id"]
+    n = len(productos)
+    k = len(scenarios) + 1
+
+    mat = compile_recipes(dfs["recetas"], insumos["insumo_id"])
+    base, _ = compute_base_costs(dfs, valor_minuto=valor_minuto, drivers=False)
+    tiempo = base["tiempo_total_min"].to_numpy(dtype=float)
+    precio0 = productos["precio_venta_actual"].to_numpy(dtype=float)
+    unidades_df = unidades_por_producto(dfs)
+    unidades = productos[["producto_id"]].merge(unidades_df, on="producto_id", how="left")["unidades_periodo"]
+    unidades = unidades.fillna(0.0).to_numpy(dtype=float)
+    total_unidades = float(unidades_df["unidades_periodo"].sum()) if len(unidades_df) else 0.0
+    gastos = float(dfs["gastos_generales"]["monto_mensual"].sum()) * meses
+
+    # ===== Escenarios -> factores (una columna por escenario) =====
+    ins = insumos.drop_duplicates("insumo_id")
+    ins_keys = _Lookup(mat.insumos.get_indexer(ins["insumo_id"]), ins["insumo_id"], ins["nombre_insumo"])
+    prod_keys = _Lookup(np.arange(n), ids, productos["categoria"])
+
+    f_ins = np.ones((len(mat.insumos), k))
+    f_precio = np.ones((n, k))
+    vm = np.full(k, float(valor_minuto))
+    f_gastos = np.ones(k)
+    for j, sc in enumerate(scenarios, start=1):
+        nombre = sc.get("nombre") or f"escenario_{j}"
+        for key, pct in (sc.get("insumos_pct") or {}).items():
+            f_ins[ins_keys.resolve(key, nombre, "insumo"), j] *= 1.0 + float(pct)
+        f_precio[:, j] *= 1.0 + float(sc.get("precio_pct") or 0.0)
+        for key, pct in (sc.get("precios_pct") or {}).items():
+            f_precio[prod_keys.resolve(key, nombre, "producto"), j] *= 1.0 + float(pct)
+        if sc.get("valor_minuto") is not None:
+            vm[j] = float(sc["valor_minuto"])
+        f_gastos[j] = 1.0 + float(sc.get("gastos_pct") or 0.0)
+
+    detalle = None
+    if productos_detalle:
+        por_id = _Lookup(np.arange(n), ids)
+        detalle = np.array([por_id.resolve(p, "productos_detalle", "producto")[0] for p in productos_detalle])
+
+    # ===== Evaluación por bloques de escenarios =====
+    c = mat.cost_vector(insumos)
+    fila = mat.productos.get_indexer(ids)
+    con_receta = fila >= 0
+    block = max(1, _BLOCK_CELLS // max(n, 1))
+    resumen: Dict[str, List[np.ndarray]] = {}
+    alertas: Dict[str, List[np.ndarray]] = {}
+    detalle_cols: Dict[str, List[np.ndarray]] = {}
+    for start in range(0, k, block):
+        b = slice(start, min(k, start + block))
+        costo_insumos = np.zeros((n, b.stop - b.start))
+        costo_insumos[con_receta] = mat.scenario_costs(c[:, None] * f_ins[:, b], rows=fila[con_receta])
+        costo_esfuerzo = tiempo[:, None] * vm[None, b]
+        if total_unidades > 0:
+            costo_indirectos = np.broadcast_to(gastos * f_gastos[None, b] / total_unidades, costo_insumos.shape)
+        else:
+            costo_indirectos = np.zeros_like(costo_insumos)
+        costo_total = costo_insumos + costo_esfuerzo + costo_indirectos
+        precio = precio0[:, None] * f_precio[:, b]
+        margen = precio - costo_total
+        u = unidades[:, None]
+
+        cols = {
+            "precio": precio,
+            "unidades_periodo": u,
+            "ingreso_total": precio * u,
+            "costo_insumos_unit": costo_insumos,
+            "costo_esfuerzo_unit": costo_esfuerzo,
+            "costo_indirectos_unit": costo_indirectos,
+            "costo_total_unit": costo_total,
+            "margen_abs_unit": margen,
+            "tiempo_total_min": tiempo[:, None],
+            **margin_arrays(precio, margen, u, tiempo[:, None]),
+        }
+        masks = rules.masks(rules.array_namespace(cols, params), costo_total.shape)
+
+        parts = {
+            "ingreso_total": np.nansum(precio * u, axis=0),
+            "costo_total": np.nansum(costo_total * u, axis=0),
+            "contribucion_total": np.nansum(cols["contribucion_total"], axis=0),
+            "perdida_total_margen_negativo": np.nansum(cols["perdida_total"], axis=0),
+            "productos_margen_negativo": (margen < 0).sum(axis=0),
+        }
+        for name, v in parts.items():
+            resumen.setdefault(name, []).append(v)
+        # Varias reglas pueden compartir tipo: se suman
+        conteo: Dict[str, np.ndarray] = {}
+        for rule, mask in masks:
+            conteo[rule.tipo] = conteo.get(rule.tipo, 0) + mask.sum(axis=0)
+        for tipo, v in conteo.items():
+            alertas.setdefault(tipo, []).append(v)
+        if detalle is not None:
+            for name in ("precio", "costo_total_unit", "margen_abs_unit", "margen_pct", "contribucion_total"):
+                detalle_cols.setdefault(name, []).append(cols[name][detalle])
+
+    totales = {name: np.concatenate(v) for name, v in resumen.items()}
+    por_tipo = {tipo: np.concatenate(v) for tipo, v in alertas.items()}
+    por_producto = {name: np.concatenate(v, axis=1) for name, v in detalle_cols.items()}
+
+    out = [_summary(j, totales, por_tipo, por_producto, productos_detalle) for j in range(k)]
+    for j, sc in enumerate(scenarios, start=1):
+        out[j] = {"nombre": sc.get("nombre") or f"escenario_{j}", **out[j]}
+        out[j]["delta_contribucion"] = out[j]["contribucion_total"] - out[0]["contribucion_total"]
+    return {"base": out[0], "escenarios": out[1:]}
+
+class _Lookup:
+    # clave (id, nombre, categoría...) -> posiciones; las columnas previas ganan ante colisión
+    def __init__(self, pos: np.ndarray, *keys: pd.Series) -> None:
+        self.pos = pos
+        self.groups = [pd.Series(pos).groupby(col.astype(str).to_numpy(), sort=False).indices for col in keys]
+
+    def resolve(self, key: str, escenario: str, que: str) -> np.ndarray:
+        for groups in self.groups:
+            idx = groups.get(str(key))
+            if idx is not None:
+                pos = self.pos[idx]
+                # Insumos que no usa ninguna receta no tienen columna (-1): no afectan costos
+                return pos[pos >= 0]
+        raise ValueError(f"Escenario '{escenario}': {que} desconocido '{key}'")
+
+def _summary(
+    j: int,
+    resumen: Dict[str, np.ndarray],
+    alertas: Dict[str, np.ndarray],
+    detalle: Dict[str, np.ndarray],
+    productos_detalle: Optional[List[str]]
+) -> Dict[str, Any]:
+    ingreso = float(resumen["ingreso_total"][j])
+    contribucion = float(resumen["contribucion_total"][j])
+    out: Dict[str, Any] = {
+        "ingreso_total": ingreso,
+        "costo_total": float(resumen["costo_total"][j]),
+        "contribucion_total": contribucion,
+        # Igual que margen_promedio_pct de los KPIs: ponderado por unidades, sobre precio
+        "margen_promedio_pct": contribucion / ingreso if ingreso else 0.0,
+        "perdida_total_margen_negativo": float(resumen["perdida_total_margen_negativo"][j]),
+        "productos_margen_negativo": int(resumen["productos_margen_negativo"][j]),
+        "alertas": {tipo: int(v[j]) for tipo, v in alertas.items()},
+    }
+    out["total_alertas"] = sum(out["alertas"].values())
+    if productos_detalle:
+        out["productos"] = [
+            {"producto_id": pid, **{name: _num(v[i, j]) for name, v in detalle.items()}}
+            for i, pid in enumerate(productos_detalle)
+        ]
+    return out
+
+def _num(v: float) -> Optional[float]:
+    return None if np.isnan(v) else float(v)
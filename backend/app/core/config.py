@@ -11,6 +11,23 @@ class Settings:
     DATA_DIR: str = os.getenv("DATA_DIR", "app/data")
     DB_PATH: str = os.getenv("DB_PATH", "app/data/sabia.sqlite")
 
+    # SQLite: conexiones lectoras persistentes (además del único escritor)
+    SQLITE_READERS: int = int(os.getenv("SQLITE_READERS", "4"))
+
+    # Retención (app.jobs.maintenance): corridas completas por periodo; las anteriores quedan
+    # como resumen de KPIs. Con RETENTION_MAX_RUNS > 0 las que pasan ese total se eliminan
+    # (también su fila de run_kpis); 0 = sin tope, los resúmenes se conservan siempre
+    RETENTION_ENABLED: bool = os.getenv("RETENTION_ENABLED", "true").lower() in ("1", "true", "yes")
+    RETENTION_FULL_RUNS: int = int(os.getenv("RETENTION_FULL_RUNS", "5"))
+    RETENTION_MAX_RUNS: int = int(os.getenv("RETENTION_MAX_RUNS", "0"))
+    RETENTION_JOBS_DAYS: float = float(os.getenv("RETENTION_JOBS_DAYS", "30"))
+    RETENTION_EVERY_MINUTES: int = int(os.getenv("RETENTION_EVERY_MINUTES", "1440"))
+    # Fracción de páginas libres a partir de la cual se hace VACUUM completo
+    VACUUM_FULL_RATIO: float = float(os.getenv("VACUUM_FULL_RATIO", "0.25"))
+
+    # Ingesta: techo de memoria por bloque al leer ventas.csv
+    VENTAS_CHUNK_MAX_MB: float = float(os.getenv("VENTAS_CHUNK_MAX_MB", "64"))
+
     # Business knobs
     MARGEN_OBJETIVO_PCT: float = float(os.getenv("MARGEN_OBJETIVO_PCT", "0.30"))
     MARGEN_CRITICO_PCT: float = float(os.getenv("MARGEN_CRITICO_PCT", "0.10"))
@@ -24,4 +41,33 @@ class Settings:
     # Drivers
     TOP_DRIVERS: int = int(os.getenv("TOP_DRIVERS", "3"))
 
+    # Caché de resultados de run_all (memoria: LRU + TTL; respaldo: tabla runs)
+    RUN_CACHE_MAX_ENTRIES: int = int(os.getenv("RUN_CACHE_MAX_ENTRIES", "64"))
+    RUN_CACHE_TTL_S: float = float(os.getenv("RUN_CACHE_TTL_S", "600"))
+
+    # Estados intermedios para recálculo incremental cuando solo cambian insumos
+    INCREMENTAL_STATE_MAX_ENTRIES: int = int(os.getenv("INCREMENTAL_STATE_MAX_ENTRIES", "8"))
+
+    # Reglas de alertas (JSON). Vacío = app/rules/default_rules.json
+    RULES_PATH: str = os.getenv("RULES_PATH", "")
+    # Reglas por tenant: <RULES_DIR>/<nombre>.json (POST /run con "reglas": "<nombre>")
+    RULES_DIR: str = os.getenv("RULES_DIR", "app/data/reglas")
+
+    # Jobs asíncronos (POST /jobs): hilos del pool y máximo de jobs en espera (429 si se supera)
+    JOB_WORKERS: int = int(os.getenv("JOB_WORKERS", "2"))
+    JOB_QUEUE_MAX: int = int(os.getenv("JOB_QUEUE_MAX", "100"))
+
+    # POST /run/batch: máximo de meses entre inicio y fin (inclusive)
+    BATCH_MAX_PERIODOS: int = int(os.getenv("BATCH_MAX_PERIODOS", "36"))
+
+    # POST /scenarios: máximo de escenarios por request
+    SCENARIOS_MAX: int = int(os.getenv("SCENARIOS_MAX", "1000"))
+
+    # Hilos para generar reportes LLM en segundo plano
+    LLM_WORKERS: int = int(os.getenv("LLM_WORKERS", "2"))
+
+    # Diagnóstico por etapa: medir pico de memoria (tracemalloc) en todas las corridas y no
+    # solo en las que piden "diagnostics"; encarece cada corrida varias veces
+    DIAGNOSTICS_MEMORY: bool = os.getenv("DIAGNOSTICS_MEMORY", "false").lower() in ("1", "true", "yes")
+
 settings = Settings()
@@ -0,0 +1,90 @@
+"""
+Instrumentación por etapa del pipeline: tiempo de pared, CPU del hilo, pico de memoria
+asignada (tracemalloc) y filas procesadas.
+
+    diag = Diagnostics()
+    with diag.stage("compute_costs") as st:
+        unit_costs, _ = compute_costs(...)
+        st["rows"] = len(unit_costs)
+
+tracemalloc es global al proceso y encarece toda asignación mientras está activo, así
+que con `memory=True` se enciende solo mientras viva el Diagnostics (usar `with` o
+`close()`). El pico también es global (`reset_peak`), así que las etapas con memoria se
+serializan entre hilos: dos corridas medidas no se pisan el pico, a costa de esperar
+su turno. Las asignaciones de hilos sin medición que corran a la vez sí se cuentan.
+"""
+
+from typing import Any, Dict, Iterator, List, Optional
+from contextlib import contextmanager
+import threading
+import time
+import tracemalloc
+
+from .telemetry import stage_seconds
+
+_tm_lock = threading.Lock()
+_tm_users = 0
+_tm_owned = False
+# Una sola etapa medida a la vez (reentrante por si se anidan en el mismo hilo)
+_peak_lock = threading.RLock()
+
+def _acquire_tracing() -> None:
+    global _tm_users, _tm_owned
+    with _tm_lock:
+        if _tm_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tm_owned = True
+        _tm_users += 1
+
+def _release_tracing() -> None:
+    global _tm_users, _tm_owned
+    with _tm_lock:
+        _tm_users -= 1
+        # Solo se apaga si lo encendimos nosotros (respeta PYTHONTRACEMALLOC / -X tracemalloc)
+        if _tm_users == 0 and _tm_owned:
+            tracemalloc.stop()
+            _tm_owned = False
+
+class Diagnostics:
+    def __init__(self, memory: bool = False) -> None:
+        self.memory = memory
+        self.stages: List[Dict[str, Any]] = []
+        if memory:
+            _acquire_tracing()
+
+    def __enter__(self) -> "Diagnostics":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self.memory:
+            self.memory = False
+            _release_tracing()
+
+    @contextmanager
+    def stage(self, name: str, rows: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        rec: Dict[str, Any] = {"stage": name, "rows": rows}
+        memory = self.memory
+        if memory:
+            _peak_lock.acquire()
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        wall0 = time.perf_counter()
+        cpu0 = time.thread_time()
+        try:
+            yield rec
+        finally:
+            rec["wall_ms"] = (time.perf_counter() - wall0) * 1000.0
+            rec["cpu_ms"] = (time.thread_time() - cpu0) * 1000.0
+            if memory:
+                rec["peak_mem_kb"] = max(0, tracemalloc.get_traced_memory()[1] - base) / 1024.0
+                _peak_lock.release()
+            else:
+                rec["peak_mem_kb"] = None
+            self.stages.append(rec)
+            stage_seconds.observe(rec["wall_ms"] / 1000.0, stage=name)
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        return [dict(s) for s in self.stages]
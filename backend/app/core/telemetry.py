@@ -0,0 +1,231 @@
+"""
+Métricas operativas en formato de exposición de Prometheus (GET /metrics), sin dependencias.
+
+Contadores e histogramas se escriben en un shard por hilo (threading.local): el camino
+caliente no toma locks, solo el primer registro de cada hilo. Al exportar se suman los
+shards; una lectura concurrente puede quedar desfasada en una observación, nunca corrupta.
+Los valores que ya existen en otros módulos (hits de caché, profundidad de cola) se
+exponen con callbacks evaluados solo al exportar.
+"""
+
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import bisect
+import logging
+import math
+import threading
+
+logger = logging.getLogger(__name__)
+
+LabelKey = Tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class _Metric(ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards: List[Dict[LabelKey, Any]] = []
+        self._lock = threading.Lock()
+
+    def _shard(self) -> Dict[LabelKey, Any]:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = {}
+            with self._lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+        return shard
+
+    def _key(self, labels: Dict[str, Any]) -> LabelKey:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    @abstractmethod
+    def _merged(self) -> Dict[LabelKey, Any]:
+        # Valor actual por tupla de labels
+        ...
+
+    @abstractmethod
+    def render(self) -> List[str]:
+        # Líneas de muestra en formato de exposición (sin HELP / TYPE)
+        ...
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        shard = self._shard()
+        key = self._key(labels)
+        shard[key] = shard.get(key, 0.0) + amount
+
+    def _merged(self) -> Dict[LabelKey, float]:
+        out: Dict[LabelKey, float] = {}
+        with self._lock:
+            shards = list(self._shards)
+        for shard in shards:
+            for key, v in list(shard.items()):
+                out[key] = out.get(key, 0.0) + v
+        return out
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_labels(self.labelnames, k)} {_fmt(v)}" for k, v in sorted(self._merged().items())]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> None:
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels: Any) -> None:
+        shard = self._shard()
+        key = self._key(labels)
+        h = shard.get(key)
+        if h is None:
+            # [conteos por bucket (+Inf al final), suma, cantidad]
+            h = shard[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        h[0][bisect.bisect_left(self.buckets, value)] += 1
+        h[1] += value
+        h[2] += 1
+
+    def _merged(self) -> Dict[LabelKey, list]:
+        out: Dict[LabelKey, list] = {}
+        with self._lock:
+            shards = list(self._shards)
+        for shard in shards:
+            for key, h in list(shard.items()):
+                acc = out.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0, 0])
+                for i, c in enumerate(h[0]):
+                    acc[0][i] += c
+                acc[1] += h[1]
+                acc[2] += h[2]
+        return out
+
+    def render(self) -> List[str]:
+        lines = []
+        names = self.labelnames + ("le",)
+        for key, (counts, total, n) in sorted(self._merged().items()):
+            cum = 0
+            for le, c in zip(self.buckets + (math.inf,), counts):
+                cum += c
+                lines.append(f"{self.name}_bucket{_labels(names, key + (_fmt(le),))} {cum}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_fmt(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {n}")
+        return lines
+
+class Callback(_Metric):
+    # Valor calculado al exportar: fn() -> número o {tupla de labels: número}
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        fn: Callable[[], Any],
+        kind: str = "gauge",
+        labelnames: Sequence[str] = ()
+    ) -> None:
+        super().__init__(name, help, labelnames)
+        self.kind = kind
+        self.fn = fn
+
+    def _merged(self) -> Dict[LabelKey, Any]:
+        values = self.fn()
+        return values if isinstance(values, dict) else {(): values}
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_labels(self.labelnames, k)} {_fmt(v)}" for k, v in sorted(self._merged().items())]
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            # Re-registrar el mismo nombre (p.ej. recarga de módulo) reemplaza el anterior
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def callback(
+        self,
+        name: str,
+        help: str,
+        fn: Callable[[], Any],
+        kind: str = "gauge",
+        labelnames: Sequence[str] = ()
+    ) -> Callback:
+        return self.register(Callback(name, help, fn, kind, labelnames))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for m in metrics:
+            try:
+                body = m.render()
+            except Exception:
+                # Una métrica rota (p.ej. un callback que falla) no tumba el resto del export
+                logger.exception(f"No se pudo exportar la métrica {m.name}")
+                continue
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            lines.extend(body)
+        return "\n".join(lines) + "\n"
+
+def _fmt(v: Optional[float]) -> str:
+    if v is None:
+        return "NaN"
+    v = float(v)
+    if math.isinf(v):
+        return "+Inf" if v > 0 else "-Inf"
+    return repr(int(v)) if v.is_integer() and abs(v) < 1e15 else repr(v)
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    esc = lambda s: str(s).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    return "{" + ",".join(f'{n}="{esc(v)}"' for n, v in zip(names, values)) + "}"
+
+registry = Registry()
+
+# Métricas del camino caliente (se registran acá para que todos los módulos compartan instancias)
+http_request_seconds = registry.histogram(
+    "sabia_http_request_duration_seconds", "Latencia de requests HTTP por ruta", ("method", "route")
+)
+http_requests_total = registry.counter(
+    "sabia_http_requests_total", "Requests HTTP por ruta y código", ("method", "route", "status")
+)
+stage_seconds = registry.histogram(
+    "sabia_pipeline_stage_duration_seconds", "Duración de cada etapa de run_all", ("stage",)
+)
+llm_seconds = registry.histogram(
+    "sabia_llm_request_duration_seconds", "Latencia de llamadas al LLM", ("provider",)
+)
+llm_errors_total = registry.counter(
+    "sabia_llm_errors_total", "Llamadas al LLM fallidas o vacías", ("provider",)
+)
+sqlite_write_seconds = registry.histogram(
+    "sabia_sqlite_write_duration_seconds", "Latencia de escrituras SQLite", ("op",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+)
@@ -103,7 +103,8 @@ def real_story_1(periodo: str = "2024-01") -> Dict[str, Any]:
             margen_objetivo_pct=settings.MARGEN_OBJETIVO_PCT,
             esfuerzo_alto_min=settings.ESFUERZO_ALTO_MIN,
             top_drivers=settings.TOP_DRIVERS,
-            llm_provider=None
+            llm_provider=None,
+            rules_path=settings.RULES_PATH or None
         )
         return extract_story_1_ranking(output)
     except Exception as e:
@@ -126,7 +127,8 @@ def real_story_2(periodo: str = "2024-01") -> Dict[str, Any]:
             margen_objetivo_pct=settings.MARGEN_OBJETIVO_PCT,
             esfuerzo_alto_min=settings.ESFUERZO_ALTO_MIN,
             top_drivers=settings.TOP_DRIVERS,
-            llm_provider=None
+            llm_provider=None,
+            rules_path=settings.RULES_PATH or None
         )
         return extract_story_2_tiempo_margen(output)
     except Exception as e:
@@ -149,7 +151,8 @@ def real_story_3(periodo: str = "2024-01") -> Dict[str, Any]:
             margen_objetivo_pct=settings.MARGEN_OBJETIVO_PCT,
             esfuerzo_alto_min=settings.ESFUERZO_ALTO_MIN,
             top_drivers=settings.TOP_DRIVERS,
-            llm_provider=None
+            llm_provider=None,
+            rules_path=settings.RULES_PATH or None
         )
         return extract_story_3_alertas(output)
     except Exception as e:
@@ -172,7 +175,8 @@ def real_story_4(periodo: str = "2024-01") -> Dict[str, Any]:
             margen_objetivo_pct=settings.MARGEN_OBJETIVO_PCT,
             esfuerzo_alto_min=settings.ESFUERZO_ALTO_MIN,
             top_drivers=settings.TOP_DRIVERS,
-            llm_provider=None
+            llm_provider=None,
+            rules_path=settings.RULES_PATH or None
         )
         return extract_story_4_drivers(output)
     except Exception as e:
@@ -1,59 +1,87 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Iterable, Optional
 import pandas as pd
 
-def top_drivers_for_product(recipe_drivers: pd.DataFrame, producto_id: str, top_n: int) -> List[Dict[str, Any]]:
-    df = recipe_drivers[recipe_drivers["producto_id"] == producto_id].copy()
-    if df.empty:
-        return []
-    df = df.sort_values("costo_insumo_unit", ascending=False).head(top_n)
-    return [
-        {"tipo": "INSUMO", "nombre": str(r["nombre_insumo"]), "impacto_unitario": float(r["costo_insumo_unit"])}
-        for _, r in df.iterrows()
-    ]
+from app.rules.engine import alerts_to_records
+
+EVIDENCE_COLUMNS = [
+    "precio", "costo_total_unit", "costo_insumos_unit", "costo_esfuerzo_unit",
+    "costo_indirectos_unit", "margen_abs_unit", "margen_pct", "unidades_periodo",
+    "contribucion_total", "perdida_total", "tiempo_total_min",
+]
+
+def top_drivers(
+    recipe_drivers: pd.DataFrame,
+    producto_ids: Iterable[str],
+    top_n: int
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Top-N insumos por costo para todos los productos pedidos en una sola pasada
+    (sort + groupby.head), en vez de filtrar/ordenar por producto.
+    """
+    rd = recipe_drivers[recipe_drivers["producto_id"].isin(set(producto_ids))]
+    rd = rd.sort_values("costo_insumo_unit", ascending=False, kind="mergesort")
+    rd = rd.groupby("producto_id", sort=False).head(top_n)
+
+    out: Dict[str, List[Dict[str, Any]]] = {}
+    for pid, nombre, costo in zip(rd["producto_id"], rd["nombre_insumo"], rd["costo_insumo_unit"]):
+        out.setdefault(pid, []).append(
+            {"tipo": "INSUMO", "nombre": str(nombre), "impacto_unitario": float(costo)}
+        )
+    return out
 
 def attach_evidence(
-    alerts: List[Dict[str, Any]],
+    alerts: pd.DataFrame,
     metrics: pd.DataFrame,
     recipe_drivers: pd.DataFrame,
-    top_n_drivers: int
+    top_n_drivers: int,
+    drivers: Optional[Dict[str, List[Dict[str, Any]]]] = None
 ) -> List[Dict[str, Any]]:
-    m_idx = metrics.set_index("producto_id")
+    """
+    Agrega evidencia e impacto estimado al frame de alertas (ver build_alerts) y lo
+    convierte a dicts. La evidencia se calcula una vez por producto y se reutiliza
+    entre alertas del mismo producto. `drivers` (ver top_drivers) permite reutilizar
+    los drivers ya calculados entre varios periodos.
+    """
+    if alerts.empty:
+        return []
+
+    pids = alerts["producto_id"].unique()
+    m = metrics[metrics["producto_id"].isin(pids)].drop_duplicates("producto_id")
+    if drivers is None:
+        drivers = top_drivers(recipe_drivers, pids, top_n_drivers)
+
+    evidencias: Dict[str, Dict[str, Any]] = {}
+    cols = [m[c].to_numpy(dtype=float).tolist() for c in EVIDENCE_COLUMNS]
+    for pid, *values in zip(m["producto_id"].tolist(), *cols):
+        evidencia = dict(zip(EVIDENCE_COLUMNS, values))
+        evidencia["drivers"] = drivers.get(pid, [])
+        evidencias[pid] = evidencia
+
+    # impacto estimado simple: si subo a precio_sugerido, diferencia * unidades
+    j = alerts[["producto_id", "precio_sugerido", "margen_objetivo_pct"]].merge(
+        m[["producto_id", "precio", "unidades_periodo", "perdida_total"]], on="producto_id", how="left"
+    )
+    ps = j["precio_sugerido"].to_numpy(dtype=float)
+    unidades = j["unidades_periodo"].to_numpy(dtype=float)
+    perdida = j["perdida_total"].to_numpy(dtype=float)
+    con_ps = j["margen_objetivo_pct"].notna().to_numpy() & (j["margen_objetivo_pct"].to_numpy(dtype=float) < 1.0)
+    ajuste = con_ps & (unidades > 0)
+    impacto_precio = (ps - j["precio"].to_numpy(dtype=float)) * unidades
 
     out = []
-    for idx, a in enumerate(alerts, start=1):
-        pid = str(a["producto_id"])
-        row = m_idx.loc[pid]
-
-        drivers = top_drivers_for_product(recipe_drivers, pid, top_n_drivers)
-
-        evidencia = {
-            "precio": float(row["precio"]),
-            "costo_total_unit": float(row["costo_total_unit"]),
-            "costo_insumos_unit": float(row["costo_insumos_unit"]),
-            "costo_esfuerzo_unit": float(row["costo_esfuerzo_unit"]),
-            "costo_indirectos_unit": float(row["costo_indirectos_unit"]),
-            "margen_abs_unit": float(row["margen_abs_unit"]),
-            "margen_pct": float(row["margen_pct"]),
-            "unidades_periodo": float(row["unidades_periodo"]),
-            "contribucion_total": float(row["contribucion_total"]),
-            "perdida_total": float(row["perdida_total"]),
-            "tiempo_total_min": float(row["tiempo_total_min"]),
-            "drivers": drivers
-        }
-
-        # impacto estimado simple: si subo a precio_sugerido, diferencia * unidades
+    records = alerts_to_records(alerts)
+    for idx, a in enumerate(records):
+        pid = a["producto_id"]
         impacto = {}
-        rec = a.get("recomendacion", {})
-        ps = rec.get("precio_sugerido")
-        if ps is not None and row["unidades_periodo"] > 0:
-            impacto["impacto_si_ajusta_precio"] = float((float(ps) - float(row["precio"])) * float(row["unidades_periodo"]))
-        if row["perdida_total"] > 0:
-            impacto["perdida_actual_periodo"] = float(row["perdida_total"])
+        if ajuste[idx]:
+            impacto["impacto_si_ajusta_precio"] = float(impacto_precio[idx])
+        if perdida[idx] > 0:
+            impacto["perdida_actual_periodo"] = float(perdida[idx])
 
         out.append({
-            "alert_id": f"A-{idx:04d}",
+            "alert_id": f"A-{idx + 1:04d}",
             **a,
-            "evidencia": evidencia,
+            "evidencia": evidencias[pid],
             "impacto_estimado": impacto
         })
     return out
@@ -0,0 +1,153 @@
+"""
+Caché columnar (Parquet) de los datasets ya validados y tipados.
+
+Cada dataset se guarda como `<nombre>.parquet` junto a un manifiesto `<nombre>.json`
+con la huella del CSV de origen (tamaño, mtime y hash de contenido). Si la huella
+no cambió, se lee el Parquet y se evita re-parsear el CSV.
+"""
+
+from typing import Dict, Any, Optional, Callable, Tuple
+import hashlib
+import json
+import logging
+import os
+import threading
+import pandas as pd
+
+from app.core.telemetry import registry
+
+logger = logging.getLogger(__name__)
+
+_HASH_BLOCK = 1024 * 1024
+# Subir si cambia la limpieza/tipado: invalida toda la caché existente
+CACHE_VERSION = 1
+
+def file_fingerprint(path: str) -> Dict[str, Any]:
+    st = os.stat(path)
+    return {"size": int(st.st_size), "mtime_ns": int(st.st_mtime_ns)}
+
+def content_hash(path: str) -> str:
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def tmp_path(path: str) -> str:
+    # Sufijo único por proceso/hilo para escrituras atómicas concurrentes
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+def _write_json_atomic(path: str, data: Dict[str, Any]) -> None:
+    tmp = tmp_path(path)
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+def read_manifest(manifest_path: str) -> Optional[Dict[str, Any]]:
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def match_fingerprint(manifest: Optional[Dict[str, Any]], path: str) -> Tuple[bool, Dict[str, Any]]:
+    """
+    Compara la huella actual de `path` con la del manifiesto.
+    Retorna (coincide, huella_actual). El hash de contenido solo se calcula
+    si cambió el tamaño/mtime (p.ej. `touch` o copia del mismo archivo).
+    """
+    fp = file_fingerprint(path)
+    if manifest is None or manifest.get("v") != CACHE_VERSION:
+        return False, {**fp, "sha": content_hash(path), "v": CACHE_VERSION}
+    if manifest.get("size") == fp["size"] and manifest.get("mtime_ns") == fp["mtime_ns"]:
+        return True, {**fp, "sha": manifest.get("sha"), "v": CACHE_VERSION}
+    sha = content_hash(path)
+    return manifest.get("sha") == sha, {**fp, "sha": sha, "v": CACHE_VERSION}
+
+def write_manifest(manifest_path: str, data: Dict[str, Any]) -> None:
+    try:
+        _write_json_atomic(manifest_path, data)
+    except OSError as e:
+        logger.warning(f"No se pudo escribir manifiesto {manifest_path}: {str(e)}")
+
+class FrameCache:
+    def __init__(self, cache_dir: str) -> None:
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _paths(self, name: str):
+        return (
+            os.path.join(self.cache_dir, f"{name}.parquet"),
+            os.path.join(self.cache_dir, f"{name}.json"),
+        )
+
+    def load(self, name: str, csv_path: str, parse_fn: Callable[[str], pd.DataFrame]) -> pd.DataFrame:
+        """
+        Devuelve el dataset `name` desde caché si la huella de `csv_path` coincide;
+        si no, lo parsea con `parse_fn` y actualiza la caché.
+        """
+        parquet_path, manifest_path = self._paths(name)
+        manifest = read_manifest(manifest_path)
+        cached = manifest is not None and os.path.exists(parquet_path)
+
+        same, fp = match_fingerprint(manifest, csv_path)
+        if cached and same:
+            df = self._read(parquet_path)
+            if df is not None:
+                if fp != {k: manifest.get(k) for k in fp}:
+                    write_manifest(manifest_path, fp)
+                self._count(hit=True)
+                return df
+
+        # Miss: re-parsear y persistir
+        self._count(hit=False)
+        df = parse_fn(csv_path)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp = tmp_path(parquet_path)
+            df.to_parquet(tmp, index=False)
+            os.replace(tmp, parquet_path)
+            write_manifest(manifest_path, fp)
+        except Exception as e:
+            logger.warning(f"No se pudo escribir caché de {name}: {type(e).__name__}: {str(e)}")
+        return df
+
+    def _read(self, parquet_path: str) -> Optional[pd.DataFrame]:
+        try:
+            return pd.read_parquet(parquet_path)
+        except Exception as e:
+            logger.warning(f"Caché ilegible {parquet_path}: {type(e).__name__}: {str(e)}")
+            return None
+
+    def _count(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+_caches: Dict[str, FrameCache] = {}
+_caches_lock = threading.Lock()
+
+def frame_cache_stats() -> Dict[str, int]:
+    # Totales de todas las cachés (GET /metrics)
+    with _caches_lock:
+        caches = list(_caches.values())
+    return {"hits": sum(c.hits for c in caches), "misses": sum(c.misses for c in caches)}
+
+def get_cache(cache_dir: str) -> FrameCache:
+    key = os.path.abspath(cache_dir)
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = FrameCache(key)
+        return _caches[key]
+
+registry.callback(
+    "sabia_frame_cache_requests_total", "Lecturas de datasets desde la caché Parquet",
+    lambda: {("hit",): frame_cache_stats()["hits"], ("miss",): frame_cache_stats()["misses"]},
+    kind="counter", labelnames=("result",)
+)
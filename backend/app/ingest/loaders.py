@@ -1,7 +1,11 @@
-from typing import Dict
+from typing import Dict, List, Optional
 import os
 import pandas as pd
-from .validators import validate_schema, basic_cleaning
+from .validators import missing_columns, clean_dataset, invalid_ventas_rows, SchemaError
+from .cache import get_cache, file_fingerprint
+from .sales_store import get_sales_store, filter_periodo, resolve_periodo
+from .streaming import iter_ventas_chunks, stream_unidades, stream_unidades_panel
+from app.core.config import settings
 
 FILES = {
     "productos": "productos.csv",
@@ -12,14 +16,125 @@ FILES = {
     "gastos_generales": "gastos_generales.csv",
 }
 
-def load_csvs(data_dir: str) -> Dict[str, pd.DataFrame]:
+def default_cache_dir(data_dir: str) -> str:
+    return os.path.join(data_dir, ".cache")
+
+def data_fingerprint(data_dir: str) -> Dict[str, Dict[str, int]]:
+    # Huella barata (tamaño + mtime) de cada archivo de datos
+    out = {}
+    for key, fname in FILES.items():
+        path = os.path.join(data_dir, fname)
+        out[key] = file_fingerprint(path) if os.path.exists(path) else {}
+    return out
+
+def _parse_dataset(name: str, path: str) -> pd.DataFrame:
+    df = pd.read_csv(path)
+    err = missing_columns(name, df)
+    if err:
+        raise SchemaError(err)
+    return clean_dataset(name, df)
+
+def load_csvs(
+    data_dir: str,
+    cache_dir: Optional[str] = None,
+    use_cache: bool = True,
+    periodo: Optional[str] = None,
+    unidades_only: bool = False,
+    periodos: Optional[List[str]] = None,
+    datasets: Optional[List[str]] = None
+) -> Dict[str, pd.DataFrame]:
+    """
+    Carga los 6 datasets validados y tipados.
+    Con `periodo` ("YYYY-MM", o ventana: "YYYY-Qn", "YYYY-MM:YTD", "YYYY-MM:Tn"; ver
+    resolve_periodo) ventas trae solo esos meses (desde sus particiones si hay caché).
+    Con `unidades_only` no se cargan filas de ventas: se entrega dfs["unidades"]
+    (producto_id, unidades_periodo), desde el agregado del store o leyendo por bloques.
+    Con `unidades_only` y `periodos` (lista "YYYY-MM") dfs["unidades"] es un panel
+    (periodo, producto_id, unidades_periodo) con todos esos meses.
+    Con `datasets` solo se cargan esos (p.ej. ["insumos"]).
+    """
+    cache_dir = cache_dir or default_cache_dir(data_dir)
+    cache = get_cache(cache_dir) if use_cache else None
+
     dfs: Dict[str, pd.DataFrame] = {}
+    errors = []
     for key, fname in FILES.items():
+        if datasets is not None and key not in datasets:
+            continue
         path = os.path.join(data_dir, fname)
         if not os.path.exists(path):
             raise FileNotFoundError(f"No existe: {path}")
-        dfs[key] = pd.read_csv(path)
+        parse = lambda p, key=key: _parse_dataset(key, p)
+        try:
+            if key == "ventas" and unidades_only and periodos is not None:
+                dfs["unidades"] = _load_unidades_panel(path, cache_dir, periodos, use_cache)
+            elif key == "ventas" and unidades_only:
+                dfs["unidades"] = _load_unidades(path, cache_dir, periodo, use_cache)
+            elif key == "ventas" and periodo is not None:
+                dfs[key] = _load_ventas_periodo(path, cache_dir, periodo, use_cache)
+            else:
+                # Huella del archivo de origen (tomada antes de leer): permite cachear
+                # derivados del dataset, p.ej. la matriz de recetas
+                fp = file_fingerprint(path)
+                dfs[key] = cache.load(key, path, parse) if cache else parse(path)
+                dfs[key].attrs["source"] = f"{os.path.abspath(path)}|{fp['size']}|{fp['mtime_ns']}"
+                # Los subconjuntos heredan attrs: la huella solo vale con todas las filas
+                dfs[key].attrs["source_rows"] = len(dfs[key])
+        except SchemaError as e:
+            errors.append(str(e))
 
-    validate_schema(dfs)
-    dfs = basic_cleaning(dfs)
+    if errors:
+        raise ValueError("Validación fallida:\n- " + "\n- ".join(errors))
     return dfs
+
+def _iter_ventas(path: str):
+    return iter_ventas_chunks(path, settings.VENTAS_CHUNK_MAX_MB)
+
+def _load_ventas_periodo(path: str, cache_dir: str, periodo: str, use_cache: bool) -> pd.DataFrame:
+    if not use_cache:
+        return filter_periodo(_parse_dataset("ventas", path), periodo)
+    store = get_sales_store(cache_dir)
+    store.ensure(path, _iter_ventas)
+    return store.read(periodo)
+
+def _load_unidades(path: str, cache_dir: str, periodo: Optional[str], use_cache: bool) -> pd.DataFrame:
+    if periodo is not None and len(resolve_periodo(periodo)) > 1 and not use_cache:
+        # Ventana sin store: un solo recorrido por (periodo, producto) y suma de los meses
+        panel = stream_unidades_panel(path, resolve_periodo(periodo), settings.VENTAS_CHUNK_MAX_MB)
+        return panel.groupby("producto_id", as_index=False)["unidades_periodo"].sum()
+    if not use_cache or periodo is None:
+        return stream_unidades(path, periodo, settings.VENTAS_CHUNK_MAX_MB)
+    store = get_sales_store(cache_dir)
+    store.ensure(path, _iter_ventas)
+    return store.unidades(periodo).rename(columns={"unidades": "unidades_periodo"})
+
+def _load_unidades_panel(path: str, cache_dir: str, periodos: List[str], use_cache: bool) -> pd.DataFrame:
+    if not use_cache:
+        return stream_unidades_panel(path, periodos, settings.VENTAS_CHUNK_MAX_MB)
+    store = get_sales_store(cache_dir)
+    store.ensure(path, _iter_ventas)
+    return store.unidades_panel(periodos).rename(columns={"unidades": "unidades_periodo"})
+
+def append_ventas(data_dir: str, rows: pd.DataFrame, cache_dir: Optional[str] = None) -> Dict[str, int]:
+    """
+    Ingesta incremental (append-only) de ventas nuevas.
+    Valida solo el lote contra REQUIRED_COLUMNS["ventas"], lo agrega a ventas.csv y al
+    store particionado, y actualiza el agregado por periodo/producto sin releer el histórico.
+    Un lote con alguna fila inválida se rechaza completo (ValueError) antes de escribir.
+    Retorna filas agregadas por periodo.
+    """
+    path = os.path.join(data_dir, FILES["ventas"])
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No existe: {path}")
+    err = missing_columns("ventas", rows)
+    if err:
+        raise ValueError("Validación fallida:\n- " + err)
+    batch = clean_dataset("ventas", rows)
+    errores = invalid_ventas_rows(batch)
+    if errores:
+        raise ValueError("Lote de ventas inválido:\n- " + "\n- ".join(errores))
+
+    store = get_sales_store(cache_dir or default_cache_dir(data_dir))
+    # El store debe reflejar el CSV actual antes de agregar (si no, se reconstruye una vez)
+    store.ensure(path, _iter_ventas)
+    return store.append(batch, path, rows)
@@ -0,0 +1,360 @@
+"""
+Store de ventas particionado por periodo (YYYY-MM).
+
+Layout bajo `<cache_dir>/ventas/`:
+  _manifest.json          huella del ventas.csv de origen
+  _schema.parquet         esquema vacío (para periodos sin ventas)
+  _unidades.parquet       agregado periodo x producto_id (unidades vendidas)
+  2024-01/part-*.parquet  filas del periodo, con `fecha` ya parseada
+
+Se construye una vez cuando cambia ventas.csv; cada corrida lee solo su partición.
+Las ventas nuevas se agregan con `append` (un part nuevo por periodo tocado) sin
+releer el histórico.
+"""
+
+from typing import Callable, Dict, Iterable, List, Optional
+import logging
+import os
+import re
+import shutil
+import threading
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .validators import REQUIRED_COLUMNS
+from .cache import read_manifest, match_fingerprint, write_manifest, tmp_path, file_fingerprint
+
+logger = logging.getLogger(__name__)
+
+SIN_FECHA = "sin-fecha"
+
+_QUARTER_RE = re.compile(r"^(\d{4})-Q([1-4])$")
+_WINDOW_RE = re.compile(r"^(\d{4}-\d{1,2}):(YTD|T(\d+))$")
+
+def normalize_periodo(periodo: str) -> str:
+    # "2024-1" -> "2024-01"
+    try:
+        y, m = (int(x) for x in periodo.split("-"))
+    except ValueError:
+        raise ValueError(f"Periodo inválido: {periodo}")
+    if not 1 <= m <= 12:
+        raise ValueError(f"Periodo inválido: {periodo}")
+    return f"{y:04d}-{m:02d}"
+
+def resolve_periodo(periodo: str) -> List[str]:
+    """
+    Meses ("YYYY-MM") que cubre un periodo:
+      "2024-03"      un mes
+      "2024-Q1"      trimestre (enero..marzo)
+      "2024-03:YTD"  año a la fecha (enero..marzo 2024)
+      "2024-03:T6"   últimos 6 meses terminando en marzo 2024
+    """
+    q = _QUARTER_RE.match(periodo)
+    if q:
+        y, n = int(q.group(1)), int(q.group(2))
+        return periodos_entre(f"{y}-{3 * n - 2}", f"{y}-{3 * n}")
+    w = _WINDOW_RE.match(periodo)
+    if w:
+        fin = normalize_periodo(w.group(1))
+        if w.group(2) == "YTD":
+            return periodos_entre(f"{fin[:4]}-01", fin)
+        n = int(w.group(3))
+        if n < 1:
+            raise ValueError(f"Periodo inválido: {periodo}")
+        inicio = (pd.Period(fin, freq="M") - (n - 1)).strftime("%Y-%m")
+        return periodos_entre(inicio, fin)
+    return [normalize_periodo(periodo)]
+
+def periodos_entre(inicio: str, fin: str) -> List[str]:
+    # "2024-01", "2024-03" -> ["2024-01", "2024-02", "2024-03"]
+    inicio, fin = normalize_periodo(inicio), normalize_periodo(fin)
+    if inicio > fin:
+        raise ValueError(f"Rango inválido: {inicio} > {fin}")
+    return list(pd.period_range(inicio, fin, freq="M").strftime("%Y-%m"))
+
+def with_periodo(ventas: pd.DataFrame) -> pd.DataFrame:
+    # Parsea fecha y agrega columna `periodo` ("YYYY-MM" o SIN_FECHA)
+    v = ventas.copy()
+    v["fecha"] = pd.to_datetime(v["fecha"], errors="coerce")
+    key = v["fecha"].dt.year * 100 + v["fecha"].dt.month
+    labels = {k: f"{int(k) // 100:04d}-{int(k) % 100:02d}" for k in key.dropna().unique()}
+    v["periodo"] = key.map(labels).fillna(SIN_FECHA)
+    return v
+
+def filter_periodo(ventas: pd.DataFrame, periodo: str) -> pd.DataFrame:
+    # Filtro en memoria (sin store): mismo resultado que leer la(s) partición(es)
+    v = with_periodo(ventas)
+    return v[v["periodo"].isin(resolve_periodo(periodo))].drop(columns=["periodo"])
+
+class SalesStore:
+    def __init__(self, root: str) -> None:
+        self.root = root
+        self._lock = threading.Lock()
+        # Agregado mensual en memoria, invalidado por el stat de _unidades.parquet
+        self._agg: Optional[pd.DataFrame] = None
+        self._agg_fp: Optional[Dict] = None
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.root, "_manifest.json")
+
+    @property
+    def unidades_path(self) -> str:
+        return os.path.join(self.root, "_unidades.parquet")
+
+    def _partition_dir(self, periodo: str, root: Optional[str] = None) -> str:
+        return os.path.join(root or self.root, periodo)
+
+    def is_fresh(self, csv_path: str) -> bool:
+        same, _ = match_fingerprint(read_manifest(self.manifest_path), csv_path)
+        return same
+
+    def ensure(self, csv_path: str, iter_chunks: Callable[[str], Iterable[pd.DataFrame]]) -> None:
+        """
+        Reconstruye las particiones si ventas.csv cambió desde la última construcción.
+        `iter_chunks(csv_path)` entrega bloques validados/tipados (memoria acotada).
+        """
+        with self._lock:
+            manifest = read_manifest(self.manifest_path)
+            same, fp = match_fingerprint(manifest, csv_path)
+            if same:
+                if fp != {k: manifest.get(k) for k in fp}:
+                    write_manifest(self.manifest_path, fp)
+                return
+            logger.info(f"Reconstruyendo store de ventas particionado: {self.root}")
+            self._rebuild(iter_chunks(csv_path), fp)
+
+    def _rebuild(self, chunks: Iterable[pd.DataFrame], fp: Dict) -> None:
+        staging = tmp_path(self.root)
+        os.makedirs(staging, exist_ok=True)
+
+        agg: Optional[pd.DataFrame] = None
+        schema: Optional[pd.DataFrame] = None
+        # Un writer Parquet abierto por periodo; las filas se bufferean y se escriben
+        # como row groups al acumular ~1 bloque, así cada partición queda en un archivo
+        writers: Dict[str, pq.ParquetWriter] = {}
+        buffers: Dict[str, List[pd.DataFrame]] = {}
+        buffered = 0
+        limit = 0
+
+        def flush() -> None:
+            for periodo, frames in buffers.items():
+                df = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                if periodo not in writers:
+                    pdir = self._partition_dir(periodo, staging)
+                    os.makedirs(pdir, exist_ok=True)
+                    writers[periodo] = pq.ParquetWriter(os.path.join(pdir, "part-00000.parquet"), table.schema)
+                w = writers[periodo]
+                w.write_table(table.cast(w.schema))
+            buffers.clear()
+
+        try:
+            for chunk in chunks:
+                v = with_periodo(chunk)
+                limit = limit or len(v)
+                if schema is None:
+                    schema = v.drop(columns=["periodo"]).head(0)
+                for periodo, part in v.groupby("periodo", sort=True):
+                    buffers.setdefault(periodo, []).append(part.drop(columns=["periodo"]))
+                buffered += len(v)
+                agg = _merge_aggregate(agg, _aggregate(v))
+                if buffered >= limit:
+                    flush()
+                    buffered = 0
+            flush()
+        finally:
+            for w in writers.values():
+                w.close()
+
+        if schema is None:
+            schema = with_periodo(pd.DataFrame(columns=sorted(REQUIRED_COLUMNS["ventas"]))).drop(columns=["periodo"])
+        schema.to_parquet(os.path.join(staging, "_schema.parquet"), index=False)
+        if agg is None:
+            agg = pd.DataFrame({"periodo": pd.Series(dtype=str), "producto_id": pd.Series(dtype=str), "unidades": pd.Series(dtype=float)})
+        agg.to_parquet(os.path.join(staging, "_unidades.parquet"), index=False)
+        write_manifest(os.path.join(staging, "_manifest.json"), fp)
+
+        # Swap atómico del directorio completo
+        old = None
+        if os.path.exists(self.root):
+            old = tmp_path(self.root) + ".old"
+            os.replace(self.root, old)
+        os.replace(staging, self.root)
+        if old:
+            shutil.rmtree(old, ignore_errors=True)
+
+    def append(self, batch: pd.DataFrame, csv_path: str, raw_batch: pd.DataFrame) -> Dict[str, int]:
+        """
+        Agrega un lote ya validado/tipado (`batch`) al store y su versión original
+        (`raw_batch`) a ventas.csv. Solo toca las particiones del lote y el agregado.
+        Orden: particiones, agregado (tmp + rename) y al final el CSV, que es la fuente
+        de verdad; si algo falla se deshace lo escrito y el store queda como estaba.
+        Retorna filas agregadas por periodo.
+        """
+        with self._lock:
+            v = with_periodo(batch)
+            written: List[str] = []
+            created: List[str] = []
+            backup: Optional[str] = None
+            replaced = False
+            csv_size = os.path.getsize(csv_path)
+            try:
+                added: Dict[str, int] = {}
+                for periodo, part in v.groupby("periodo", sort=True):
+                    pdir = self._partition_dir(periodo)
+                    if not os.path.isdir(pdir):
+                        os.makedirs(pdir)
+                        created.append(pdir)
+                    path = os.path.join(pdir, f"part-{_next_part(pdir):05d}.parquet")
+                    written.append(path)
+                    part.drop(columns=["periodo"]).to_parquet(path, index=False)
+                    added[periodo] = int(len(part))
+
+                # Agregado periodo x producto: se suma el lote en su lugar
+                prev = None
+                if os.path.exists(self.unidades_path):
+                    prev = pd.read_parquet(self.unidades_path)
+                    backup = tmp_path(self.unidades_path) + ".bak"
+                    shutil.copy2(self.unidades_path, backup)
+                agg = _merge_aggregate(prev, _aggregate(v))
+                tmp = tmp_path(self.unidades_path)
+                agg.to_parquet(tmp, index=False)
+                os.replace(tmp, self.unidades_path)
+                replaced = True
+
+                _append_csv(csv_path, raw_batch)
+            except BaseException:
+                self._rollback(csv_path, csv_size, written, created, backup, replaced)
+                raise
+            if backup:
+                os.remove(backup)
+
+            # El store sigue sincronizado con el CSV: registrar su nueva huella.
+            # Sin hash (evita releer el archivo); si cambia el stat se reconstruye.
+            fp = file_fingerprint(csv_path)
+            manifest = read_manifest(self.manifest_path) or {}
+            write_manifest(self.manifest_path, {**manifest, **fp, "sha": None})
+            return added
+
+    def _rollback(self, csv_path: str, csv_size: int, written: List[str], created: List[str],
+                  backup: Optional[str], replaced: bool) -> None:
+        # Deshace un append a medias: CSV a su tamaño previo, parts nuevos fuera, agregado previo
+        logger.warning(f"Append de ventas fallido, revirtiendo: {self.root}")
+        if os.path.getsize(csv_path) != csv_size:
+            with open(csv_path, "rb+") as f:
+                f.truncate(csv_size)
+        for path in written:
+            if os.path.exists(path):
+                os.remove(path)
+        for pdir in created:
+            shutil.rmtree(pdir, ignore_errors=True)
+        tmp = tmp_path(self.unidades_path)
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        if replaced and backup:
+            os.replace(backup, self.unidades_path)
+        elif replaced:
+            os.remove(self.unidades_path)
+        elif backup and os.path.exists(backup):
+            os.remove(backup)
+        # El agregado en memoria se revalida por stat; se fuerza por si el mtime no cambió
+        self._agg = None
+
+    def aggregate(self) -> pd.DataFrame:
+        """
+        Agregado mensual (periodo, producto_id, unidades); se lee de disco solo si cambió.
+        """
+        fp = file_fingerprint(self.unidades_path)
+        if self._agg is None or self._agg_fp != fp:
+            self._agg = pd.read_parquet(self.unidades_path)
+            self._agg_fp = fp
+        return self._agg
+
+    def unidades(self, periodo: str) -> pd.DataFrame:
+        """
+        Unidades vendidas por producto en el periodo (producto_id, unidades), desde el agregado.
+        Para ventanas (trimestre, YTD, últimos N meses) suma los parciales mensuales.
+        """
+        meses = resolve_periodo(periodo)
+        agg = self.aggregate()
+        if len(meses) == 1:
+            agg = agg[agg["periodo"] == meses[0]]
+            return agg[["producto_id", "unidades"]].reset_index(drop=True)
+        agg = agg[agg["periodo"].isin(meses)]
+        return agg.groupby("producto_id", as_index=False)["unidades"].sum()
+
+    def unidades_panel(self, periodos: List[str]) -> pd.DataFrame:
+        """
+        Unidades por (periodo, producto_id) para varios periodos con una sola lectura del agregado.
+        """
+        agg = self.aggregate()
+        agg = agg[agg["periodo"].isin([normalize_periodo(p) for p in periodos])]
+        return agg[["periodo", "producto_id", "unidades"]].reset_index(drop=True)
+
+    def periodos(self) -> List[str]:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(
+            d for d in os.listdir(self.root)
+            if d != SIN_FECHA and os.path.isdir(os.path.join(self.root, d)) and not d.startswith("_")
+        )
+
+    def read(self, periodo: str) -> pd.DataFrame:
+        # Lee las particiones de todos los meses del periodo (ver resolve_periodo)
+        parts = []
+        for mes in resolve_periodo(periodo):
+            pdir = self._partition_dir(mes)
+            if os.path.isdir(pdir):
+                parts += [os.path.join(pdir, f) for f in sorted(os.listdir(pdir)) if f.endswith(".parquet")]
+        if not parts:
+            return pd.read_parquet(os.path.join(self.root, "_schema.parquet"))
+        frames = [pd.read_parquet(f) for f in parts]
+        df = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+        return df
+
+def _aggregate(v: pd.DataFrame) -> pd.DataFrame:
+    v = v[v["periodo"] != SIN_FECHA]
+    agg = v.groupby(["periodo", "producto_id"], as_index=False)["cantidad_vendida"].sum()
+    return agg.rename(columns={"cantidad_vendida": "unidades"})
+
+def _merge_aggregate(acc: Optional[pd.DataFrame], agg: pd.DataFrame) -> pd.DataFrame:
+    if acc is None:
+        return agg
+    out = pd.concat([acc, agg], ignore_index=True)
+    return out.groupby(["periodo", "producto_id"], as_index=False)["unidades"].sum()
+
+def _next_part(pdir: str) -> int:
+    nums = [
+        int(f[len("part-"):-len(".parquet")])
+        for f in os.listdir(pdir)
+        if f.startswith("part-") and f.endswith(".parquet")
+    ]
+    return max(nums) + 1 if nums else 0
+
+def _append_csv(csv_path: str, raw_batch: pd.DataFrame) -> None:
+    # Respeta el orden de columnas del CSV existente
+    header = list(pd.read_csv(csv_path, nrows=0).columns)
+    rows = raw_batch.reindex(columns=header)
+    with open(csv_path, "rb+") as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() > 0:
+            f.seek(-1, os.SEEK_END)
+            needs_newline = f.read(1) != b"\n"
+        else:
+            needs_newline = False
+    with open(csv_path, "a", encoding="utf-8", newline="") as f:
+        if needs_newline:
+            f.write("\n")
+        rows.to_csv(f, header=False, index=False)
+
+_stores: Dict[str, SalesStore] = {}
+_stores_lock = threading.Lock()
+
+def get_sales_store(cache_dir: str) -> SalesStore:
+    root = os.path.abspath(os.path.join(cache_dir, "ventas"))
+    with _stores_lock:
+        if root not in _stores:
+            _stores[root] = SalesStore(root)
+        return _stores[root]
@@ -0,0 +1,83 @@
+"""
+Lectura de ventas por bloques acotados en memoria.
+
+El tamaño de bloque se deriva de un techo en MB (VENTAS_CHUNK_MAX_MB) y del peso
+estimado por fila, así el pico de memoria no depende del tamaño de ventas.csv.
+"""
+
+from typing import Iterator, List, Optional
+import pandas as pd
+
+from .validators import missing_columns, clean_dataset, REQUIRED_COLUMNS, SchemaError
+
+_SAMPLE_ROWS = 1000
+# Parseo + limpieza + fecha parseada: ~3 copias vivas del bloque
+_OVERHEAD = 3.0
+
+def chunk_rows_for(path: str, max_chunk_mb: float) -> int:
+    sample = pd.read_csv(path, nrows=_SAMPLE_ROWS)
+    if sample.empty:
+        return _SAMPLE_ROWS
+    per_row = float(sample.memory_usage(deep=True).sum()) / len(sample)
+    return max(_SAMPLE_ROWS, int(max_chunk_mb * 1024 * 1024 / (per_row * _OVERHEAD)))
+
+def iter_ventas_chunks(path: str, max_chunk_mb: float, usecols=None) -> Iterator[pd.DataFrame]:
+    """
+    Itera ventas.csv en bloques validados y tipados (ver clean_dataset).
+    Lanza SchemaError si faltan columnas requeridas.
+    """
+    header = pd.read_csv(path, nrows=0)
+    err = missing_columns("ventas", header)
+    if err:
+        raise SchemaError(err)
+
+    rows = chunk_rows_for(path, max_chunk_mb)
+    for chunk in pd.read_csv(path, chunksize=rows, usecols=usecols):
+        yield clean_dataset("ventas", chunk)
+
+def stream_unidades(path: str, periodo: Optional[str], max_chunk_mb: float) -> pd.DataFrame:
+    """
+    Unidades vendidas por producto (producto_id, unidades_periodo) plegando bloque a bloque.
+    Con `periodo` ("YYYY-MM") solo suma las filas de ese mes.
+    """
+    y = m = None
+    if periodo is not None:
+        y, m = (int(x) for x in periodo.split("-"))
+
+    totals: Optional[pd.Series] = None
+    for chunk in iter_ventas_chunks(path, max_chunk_mb, usecols=sorted(REQUIRED_COLUMNS["ventas"])):
+        if y is not None:
+            fecha = pd.to_datetime(chunk["fecha"], errors="coerce")
+            chunk = chunk[(fecha.dt.year == y) & (fecha.dt.month == m)]
+        part = chunk.groupby("producto_id")["cantidad_vendida"].sum()
+        totals = part if totals is None else totals.add(part, fill_value=0.0)
+
+    if totals is None:
+        totals = pd.Series(dtype=float)
+    out = totals.rename("unidades_periodo").rename_axis("producto_id").reset_index()
+    return out
+
+def stream_unidades_panel(path: str, periodos: List[str], max_chunk_mb: float) -> pd.DataFrame:
+    """
+    Unidades por (periodo, producto_id) para varios meses en una sola pasada: la fecha se
+    parsea una vez por bloque y se agrupa por (periodo, producto_id) en un solo groupby.
+    """
+    keys = {int(p[:4]) * 100 + int(p[5:7]): p for p in periodos}
+
+    totals: Optional[pd.Series] = None
+    for chunk in iter_ventas_chunks(path, max_chunk_mb, usecols=sorted(REQUIRED_COLUMNS["ventas"])):
+        fecha = pd.to_datetime(chunk["fecha"], errors="coerce")
+        key = fecha.dt.year * 100 + fecha.dt.month
+        sel = key.isin(list(keys))
+        part = chunk["cantidad_vendida"][sel].groupby([key[sel].astype(int), chunk["producto_id"][sel]]).sum()
+        totals = part if totals is None else totals.add(part, fill_value=0.0)
+
+    if totals is None or totals.empty:
+        return pd.DataFrame({
+            "periodo": pd.Series(dtype=str),
+            "producto_id": pd.Series(dtype=str),
+            "unidades_periodo": pd.Series(dtype=float),
+        })
+    out = totals.rename("unidades_periodo").rename_axis(["periodo", "producto_id"]).reset_index()
+    out["periodo"] = out["periodo"].map(keys)
+    return out
@@ -1,4 +1,4 @@
-from typing import Dict
+from typing import Dict, List, Optional
 import pandas as pd
 
 REQUIRED_COLUMNS = {
@@ -10,52 +10,73 @@ REQUIRED_COLUMNS = {
     "gastos_generales": {"tipo_gasto", "monto_mensual"},
 }
 
+class SchemaError(ValueError):
+    # Faltan columnas requeridas en un dataset
+    pass
+
+def missing_columns(name: str, df: pd.DataFrame) -> Optional[str]:
+    # Mensaje de error para un dataset puntual (None si está completo)
+    cols = REQUIRED_COLUMNS[name]
+    df_cols = set(df.columns)
+    if not cols.issubset(df_cols):
+        missing_cols = cols - df_cols
+        return f"{name}: faltan columnas {sorted(list(missing_cols))}"
+    return None
+
 def validate_schema(dfs: Dict[str, pd.DataFrame]) -> None:
     missing = []
-    for name, cols in REQUIRED_COLUMNS.items():
+    for name in REQUIRED_COLUMNS:
         if name not in dfs:
             missing.append(f"Falta dataset: {name}")
             continue
-        df = dfs[name]
-        df_cols = set(df.columns)
-        if not cols.issubset(df_cols):
-            missing_cols = cols - df_cols
-            missing.append(f"{name}: faltan columnas {sorted(list(missing_cols))}")
+        err = missing_columns(name, dfs[name])
+        if err:
+            missing.append(err)
     if missing:
         raise ValueError("Validación fallida:\n- " + "\n- ".join(missing))
 
-def basic_cleaning(dfs: Dict[str, pd.DataFrame]) -> Dict[str, pd.DataFrame]:
+def clean_dataset(name: str, df: pd.DataFrame) -> pd.DataFrame:
     # Tipos mínimos para demo
-    p = dfs["productos"].copy()
-    p["producto_id"] = p["producto_id"].astype(str).str.strip()
-    p["precio_venta_actual"] = p["precio_venta_actual"].astype(float)
-
-    v = dfs["ventas"].copy()
-    v["producto_id"] = v["producto_id"].astype(str).str.strip()
-    v["cantidad_vendida"] = v["cantidad_vendida"].astype(float)
-
-    i = dfs["insumos"].copy()
-    i["insumo_id"] = i["insumo_id"].astype(str).str.strip()
-    i["costo_unitario"] = i["costo_unitario"].astype(float)
+    d = df.copy()
+    if name == "productos":
+        d["producto_id"] = d["producto_id"].astype(str).str.strip()
+        d["precio_venta_actual"] = d["precio_venta_actual"].astype(float)
+    elif name == "ventas":
+        d["producto_id"] = d["producto_id"].astype(str).str.strip()
+        d["cantidad_vendida"] = d["cantidad_vendida"].astype(float)
+    elif name == "insumos":
+        d["insumo_id"] = d["insumo_id"].astype(str).str.strip()
+        d["costo_unitario"] = d["costo_unitario"].astype(float)
+    elif name == "recetas":
+        d["producto_id"] = d["producto_id"].astype(str).str.strip()
+        d["insumo_id"] = d["insumo_id"].astype(str).str.strip()
+        d["cantidad"] = d["cantidad"].astype(float)
+    elif name == "tiempos_produccion":
+        d["producto_id"] = d["producto_id"].astype(str).str.strip()
+        d["tiempo_total_min"] = d["tiempo_total_min"].astype(float)
+    elif name == "gastos_generales":
+        d["monto_mensual"] = d["monto_mensual"].astype(float)
+    return d
 
-    r = dfs["recetas"].copy()
-    r["producto_id"] = r["producto_id"].astype(str).str.strip()
-    r["insumo_id"] = r["insumo_id"].astype(str).str.strip()
-    r["cantidad"] = r["cantidad"].astype(float)
-
-    t = dfs["tiempos_produccion"].copy()
-    t["producto_id"] = t["producto_id"].astype(str).str.strip()
-    t["tiempo_total_min"] = t["tiempo_total_min"].astype(float)
-
-    g = dfs["gastos_generales"].copy()
-    g["monto_mensual"] = g["monto_mensual"].astype(float)
-
-    return {
-        "productos": p,
-        "ventas": v,
-        "insumos": i,
-        "recetas": r,
-        "tiempos_produccion": t,
-        "gastos_generales": g,
-    }
+def basic_cleaning(dfs: Dict[str, pd.DataFrame]) -> Dict[str, pd.DataFrame]:
+    return {name: clean_dataset(name, dfs[name]) for name in REQUIRED_COLUMNS}
 
+def invalid_ventas_rows(df: pd.DataFrame, limit: int = 20) -> List[str]:
+    """
+    Filas de un lote de ventas que no se pueden ingerir: fecha que no parsea
+    (iría a la partición sin-fecha) o cantidad negativa/vacía. Índices 0-based del lote.
+    """
+    fechas = pd.to_datetime(df["fecha"], errors="coerce")
+    cantidad = pd.to_numeric(df["cantidad_vendida"], errors="coerce")
+    errores = []
+    for i, (fecha, f, c) in enumerate(zip(df["fecha"], fechas, cantidad)):
+        motivos = []
+        if pd.isna(f):
+            motivos.append(f"fecha inválida {fecha!r}")
+        if pd.isna(c) or c < 0:
+            motivos.append(f"cantidad_vendida inválida {c!r}")
+        if motivos:
+            errores.append(f"fila {i}: " + ", ".join(motivos))
+    if len(errores) > limit:
+        errores = errores[:limit] + [f"... y {len(errores) - limit} filas más"]
+    return errores
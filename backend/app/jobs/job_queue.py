@@ -0,0 +1,94 @@
+"""
+Cola de jobs para corridas asíncronas (POST /jobs).
+
+La cola vive en la tabla `jobs` de SQLite (queued -> running -> done | failed), así el
+trabajo encolado sobrevive reinicios: al arrancar, los jobs 'running' vuelven a 'queued'
+y se reencolan en orden. Un pool acotado de hilos los ejecuta; si ya hay `max_queued`
+jobs esperando, `submit` lanza QueueFull (HTTP 429 en la API).
+"""
+
+from typing import Any, Callable, Dict, List, Optional
+import logging
+import queue
+import threading
+import uuid
+
+from app.storage.db import create_job, update_job, get_job, count_jobs, requeue_jobs
+
+logger = logging.getLogger(__name__)
+
+class QueueFull(Exception):
+    pass
+
+class JobQueue:
+    def __init__(
+        self,
+        db_path: str,
+        handler: Callable[[Dict[str, Any]], Dict[str, Any]],
+        workers: int = 2,
+        max_queued: int = 100
+    ) -> None:
+        # handler(request) -> output de la corrida (con run_id)
+        self.db_path = db_path
+        self.handler = handler
+        self.workers = max(1, int(workers))
+        self.max_queued = int(max_queued)
+        self._q: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        pendientes = requeue_jobs(self.db_path)
+        if pendientes:
+            logger.info(f"Reanudando {len(pendientes)} jobs pendientes")
+        for job_id in pendientes:
+            self._q.put(job_id)
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"sabia-job-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        # Los jobs aún en cola quedan 'queued' en SQLite y se retoman al reiniciar
+        for _ in self._threads:
+            self._q.put(None)
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def submit(self, request: Dict[str, Any]) -> str:
+        with self._lock:
+            if count_jobs(self.db_path, "queued") >= self.max_queued:
+                raise QueueFull(f"Cola llena ({self.max_queued} jobs en espera)")
+            job_id = uuid.uuid4().hex
+            create_job(self.db_path, job_id, request)
+        self._q.put(job_id)
+        return job_id
+
+    def depth(self) -> int:
+        return self._q.qsize()
+
+    def _worker(self) -> None:
+        while True:
+            job_id = self._q.get()
+            if job_id is None:
+                return
+            try:
+                self._run(job_id)
+            except Exception:
+                # Falla al leer/registrar el estado (p.ej. SQLite): el hilo sigue con la cola
+                logger.exception(f"Job {job_id}: no se pudo registrar su estado")
+
+    def _run(self, job_id: str) -> None:
+        job = get_job(self.db_path, job_id)
+        if job is None or job["status"] != "queued":
+            return
+        try:
+            update_job(self.db_path, job_id, "running")
+            output = self.handler(job["request"])
+            update_job(self.db_path, job_id, "done", run_id=output.get("run_id"))
+        except Exception as e:
+            logger.error(f"Job {job_id} falló: {type(e).__name__}: {e}")
+            update_job(self.db_path, job_id, "failed", error=f"{type(e).__name__}: {e}")
@@ -0,0 +1,27 @@
+"""
+Mantenimiento periódico de la base (programado con app.jobs.scheduler).
+
+Cada pasada aplica la retención (corridas completas recientes, resúmenes KPI de las
+anteriores, payloads deduplicados sin referencias, jobs viejos) y luego devuelve el
+espacio libre con incremental_vacuum / VACUUM, así el tamaño de la base y el costo de
+las consultas dependen de la política y no de los años de operación.
+"""
+
+from typing import Any, Dict
+import logging
+
+from app.core.config import settings
+from app.storage.db import apply_retention, vacuum_db
+
+logger = logging.getLogger(__name__)
+
+def run_maintenance(db_path: str) -> Dict[str, Any]:
+    out: Dict[str, Any] = apply_retention(
+        db_path,
+        full_runs=settings.RETENTION_FULL_RUNS,
+        max_runs=settings.RETENTION_MAX_RUNS,
+        jobs_days=settings.RETENTION_JOBS_DAYS,
+    )
+    out["vacuum"] = vacuum_db(db_path, full_ratio=settings.VACUUM_FULL_RATIO)
+    logger.info(f"Mantenimiento de {db_path}: {out}")
+    return out
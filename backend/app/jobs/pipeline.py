@@ -1,25 +1,57 @@
-from typing import Dict, Any, Optional
-from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 import pandas as pd
+import copy
 import logging
+import threading
 
-from app.ingest.loaders import load_csvs
-from app.compute.costs import compute_costs
-from app.compute.metrics import compute_metrics
+from app.core.config import settings
+from app.core.diagnostics import Diagnostics
+from app.core.telemetry import registry, llm_seconds, llm_errors_total
+from app.ingest.loaders import load_csvs, data_fingerprint
+from app.ingest.sales_store import periodos_entre, resolve_periodo
+from app.compute.costs import compute_costs, compute_costs_panel
+from app.compute.metrics import compute_metrics, compute_metrics_panel
+from app.compute.incremental import CostState, update_costs
+from app.compute.scenarios import evaluate_scenarios
 from app.rules.engine import build_alerts
-from app.explain.explainer import attach_evidence
-from app.storage.db import save_run
+from app.rules.dsl import load_rules, rules_fingerprint
+from app.explain.explainer import attach_evidence, top_drivers as top_drivers_for
+from app.storage.db import (
+    save_run, save_runs, get_run_by_cache_key, update_run_output,
+    save_run_diagnostics, get_run_diagnostics
+)
+from app.jobs.run_cache import RunCache, cache_key
+from app.jobs.singleflight import SingleFlight
 
 logger = logging.getLogger(__name__)
 
-def _period_filter(ventas: pd.DataFrame, periodo: str) -> pd.DataFrame:
-    # periodo "YYYY-MM" (demo simple)
-    # ventas.fecha puede venir como string; lo parseamos
-    v = ventas.copy()
-    v["fecha"] = pd.to_datetime(v["fecha"], errors="coerce")
-    y, m = periodo.split("-")
-    y, m = int(y), int(m)
-    return v[(v["fecha"].dt.year == y) & (v["fecha"].dt.month == m)].dropna(subset=["fecha"])
+run_cache = RunCache(settings.RUN_CACHE_MAX_ENTRIES, settings.RUN_CACHE_TTL_S)
+# Corridas concurrentes con la misma clave comparten un solo cálculo
+run_flight = SingleFlight()
+# Estado intermedio por (datos salvo insumos, reglas, periodo, parámetros): si solo
+# cambian insumos se recalculan únicamente los productos que los usan
+# (CostState no se muta, así que se comparte sin copiar)
+cost_states = RunCache(settings.INCREMENTAL_STATE_MAX_ENTRIES, settings.RUN_CACHE_TTL_S, copy=False)
+# Reportes LLM fuera del camino crítico: la corrida se guarda con el reporte
+# determinístico y el del LLM se parchea al terminar (report_status)
+report_pool = ThreadPoolExecutor(max_workers=settings.LLM_WORKERS, thread_name_prefix="sabia-llm")
+_reports_in_flight: set = set()
+_reports_lock = threading.Lock()
+
+registry.callback(
+    "sabia_run_cache_requests_total", "Búsquedas en la caché en memoria de run_all",
+    lambda: {("hit",): run_cache.hits, ("miss",): run_cache.misses}, kind="counter", labelnames=("result",)
+)
+registry.callback("sabia_run_cache_entries", "Corridas en la caché en memoria", lambda: run_cache.stats()["entries"])
+registry.callback(
+    "sabia_runs_total", "Cálculos de run_all ejecutados vs coalescidos (single-flight)",
+    lambda: {("executed",): run_flight.executed, ("coalesced",): run_flight.coalesced},
+    kind="counter", labelnames=("result",)
+)
+registry.callback("sabia_runs_in_flight", "Corridas calculándose ahora", lambda: run_flight.stats()["in_flight"])
+registry.callback("sabia_llm_reports_pending", "Reportes LLM en cola o en curso", lambda: len(_reports_in_flight))
 
 def run_all(
     *,
@@ -31,58 +63,437 @@ def run_all(
     margen_objetivo_pct: float,
     esfuerzo_alto_min: int,
     top_drivers: int,
-    llm_provider=None
+    llm_provider=None,
+    rules_path: Optional[str] = None,
+    force: bool = False,
+    diagnostics: bool = False
 ) -> Dict[str, Any]:
-    dfs = load_csvs(data_dir)
-
-    # Filtrar ventas por periodo (para que el run sea consistente)
-    dfs["ventas"] = _period_filter(dfs["ventas"], periodo)
-
-    unit_costs, recipe_drivers = compute_costs(dfs, valor_minuto=valor_minuto)
-    metrics = compute_metrics(dfs, unit_costs=unit_costs)
-
-    alerts = build_alerts(
-        metrics,
+    """
+    Ejecuta el pipeline completo para `periodo` ("YYYY-MM" o ventana "YYYY-Qn",
+    "YYYY-MM:YTD", "YYYY-MM:Tn") y guarda la corrida.
+    Si ya existe un resultado para los mismos datos y parámetros se reutiliza
+    (memoria y luego tabla runs) sin recalcular ni insertar otra fila; `force` lo evita.
+    Llamadas concurrentes idénticas se coalescen en un solo cálculo.
+    Con `llm_provider` la corrida se retorna y guarda de inmediato con el reporte
+    determinístico y report_status="pending"; el reporte del LLM se genera en segundo
+    plano y reemplaza executive_report_md en la corrida guardada ("ready" / "failed").
+    Cada etapa se instrumenta (ver app.core.diagnostics) y se guarda en run_diagnostics;
+    con `diagnostics` se agrega al resultado bajo la clave "diagnostics".
+    """
+    data = data_fingerprint(data_dir)
+    params = dict(
+        rules=rules_fingerprint(rules_path),
+        periodo=periodo,
+        valor_minuto=valor_minuto,
         margen_critico_pct=margen_critico_pct,
         margen_objetivo_pct=margen_objetivo_pct,
-        esfuerzo_alto_min=esfuerzo_alto_min
+        esfuerzo_alto_min=esfuerzo_alto_min,
+        top_drivers=top_drivers,
     )
-    alerts = attach_evidence(alerts, metrics, recipe_drivers, top_n_drivers=top_drivers)
+    key = cache_key(data=data, llm=_llm_key(llm_provider), **params)
+    state_key = cache_key(data={k: v for k, v in data.items() if k != "insumos"}, **params)
+    if not force:
+        cached = _cached_run(db_path, key)
+        if cached is not None:
+            logger.info(f"Corrida reutilizada desde caché: {cached.get('run_id')}")
+            if cached.get("report_status") in ("pending", "failed") and llm_provider is not None:
+                # Reporte que quedó pendiente (p.ej. el proceso se reinició) o cuyo LLM
+                # falló: se reintenta en segundo plano
+                _schedule_report(db_path, key, cached, llm_provider)
+                cached["report_status"] = "pending"
+            return _with_diagnostics(db_path, cached) if diagnostics else cached
 
-    kpis = _kpis_from_metrics(metrics, alerts, periodo)
+    def compute() -> Dict[str, Any]:
+        # Pico de memoria solo si se pidió diagnóstico (tracemalloc encarece la corrida)
+        with Diagnostics(memory=diagnostics or settings.DIAGNOSTICS_MEMORY) as diag:
+            output = _compute_run(
+                data_dir=data_dir,
+                periodo=periodo,
+                valor_minuto=valor_minuto,
+                margen_critico_pct=margen_critico_pct,
+                margen_objetivo_pct=margen_objetivo_pct,
+                esfuerzo_alto_min=esfuerzo_alto_min,
+                top_drivers=top_drivers,
+                rules_path=rules_path,
+                report_status="pending" if llm_provider is not None else "fallback",
+                diag=diag,
+                state_key=state_key,
+                incremental=not force,
+            )
+            with diag.stage("save_run", rows=len(output["alerts"])):
+                save_run(db_path, run_id=output["run_id"], periodo=periodo, output=output, cache_key=key)
+        save_run_diagnostics(db_path, output["run_id"], diag.to_list())
+        run_cache.put(key, output)
+        if llm_provider is not None:
+            _schedule_report(db_path, key, output, llm_provider)
+        return output
 
-    payload = {
-        "periodo": periodo,
-        "kpis": kpis,
-        "alerts": alerts
+    output = run_flight.do(key, compute)
+    return _with_diagnostics(db_path, output) if diagnostics else output
+
+def _with_diagnostics(db_path: str, output: Dict[str, Any]) -> Dict[str, Any]:
+    # Copia del output con las etapas guardadas de esa corrida (no se muta la caché)
+    return {**output, "diagnostics": get_run_diagnostics(db_path, output["run_id"])}
+
+def run_range(
+    *,
+    data_dir: str,
+    db_path: str,
+    inicio: str,
+    fin: str,
+    valor_minuto: float,
+    margen_critico_pct: float,
+    margen_objetivo_pct: float,
+    esfuerzo_alto_min: int,
+    top_drivers: int,
+    rules_path: Optional[str] = None,
+    force: bool = False
+) -> List[Dict[str, Any]]:
+    """
+    Ejecuta el pipeline para todos los meses entre `inicio` y `fin` (inclusive) en una
+    sola pasada: costos, métricas y alertas se calculan como un panel periodo x producto
+    y las corridas nuevas se guardan en una sola transacción. Sin LLM (reporte determinístico).
+    Cada periodo usa la misma clave de caché que `run_all`, así los meses ya calculados
+    se reutilizan (salvo `force`) y un `run_all` posterior del mismo mes no recalcula.
+    Cada corrida guarda en run_diagnostics sus etapas propias (attach_evidence, kpis) más
+    las del panel compartido, con prefijo "batch_" (costo de todo el lote, no del mes).
+    """
+    periodos = periodos_entre(inicio, fin)
+    data = data_fingerprint(data_dir)
+    rules = rules_fingerprint(rules_path)
+    keys = {
+        p: cache_key(
+            data=data,
+            rules=rules,
+            periodo=p,
+            valor_minuto=valor_minuto,
+            margen_critico_pct=margen_critico_pct,
+            margen_objetivo_pct=margen_objetivo_pct,
+            esfuerzo_alto_min=esfuerzo_alto_min,
+            top_drivers=top_drivers,
+            llm=None,
+        )
+        for p in periodos
     }
 
-    executive_md = None
-    if llm_provider is not None:
-        logger.info(f"Llamando al LLM provider: {type(llm_provider).__name__}")
-        logger.info(f"Payload contiene {len(alerts)} alertas")
-        try:
-            executive_md = llm_provider.generate_executive_report(payload)
-            logger.info(f"LLM respondió con {len(executive_md) if executive_md else 0} caracteres")
-        except Exception as e:
-            logger.error(f"Error al llamar al LLM: {type(e).__name__}: {str(e)}")
-            import traceback
-            logger.error(f"Traceback:\n{traceback.format_exc()}")
+    outputs: Dict[str, Dict[str, Any]] = {}
+    if not force:
+        for p in periodos:
+            cached = _cached_run(db_path, keys[p])
+            if cached is not None:
+                outputs[p] = cached
+    pendientes = [p for p in periodos if p not in outputs]
+
+    def compute() -> Dict[str, Dict[str, Any]]:
+        with Diagnostics(memory=settings.DIAGNOSTICS_MEMORY) as diag:
+            computed, stages = _compute_range(
+                data_dir=data_dir,
+                periodos=pendientes,
+                valor_minuto=valor_minuto,
+                margen_critico_pct=margen_critico_pct,
+                margen_objetivo_pct=margen_objetivo_pct,
+                esfuerzo_alto_min=esfuerzo_alto_min,
+                top_drivers=top_drivers,
+                rules_path=rules_path,
+                diag=diag,
+            )
+            with diag.stage("batch_save_runs", rows=len(computed)):
+                save_runs(db_path, [(o["run_id"], p, o, keys[p]) for p, o in computed.items()])
+        for p, o in computed.items():
+            save_run_diagnostics(db_path, o["run_id"], diag.to_list() + stages[p])
+            run_cache.put(keys[p], o)
+        return computed
+
+    if pendientes:
+        logger.info(f"Batch {periodos[0]}..{periodos[-1]}: {len(pendientes)} periodos a calcular")
+        outputs.update(run_flight.do(cache_key(batch=[keys[p] for p in pendientes]), compute))
+    return [outputs[p] for p in periodos]
+
+def run_scenarios(
+    *,
+    data_dir: str,
+    periodo: str,
+    scenarios: List[Dict[str, Any]],
+    valor_minuto: float,
+    margen_critico_pct: float,
+    margen_objetivo_pct: float,
+    esfuerzo_alto_min: int,
+    rules_path: Optional[str] = None,
+    productos_detalle: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    """
+    Evalúa escenarios what-if (ver compute.scenarios) sobre los datos del periodo.
+    No se guardan en la base: son simulaciones, no corridas.
+    """
+    dfs = load_csvs(data_dir, periodo=periodo, unidades_only=True)
+    params = {
+        "margen_critico_pct": margen_critico_pct,
+        "margen_objetivo_pct": margen_objetivo_pct,
+        "esfuerzo_alto_min": esfuerzo_alto_min,
+    }
+    out = evaluate_scenarios(
+        dfs,
+        scenarios,
+        valor_minuto=valor_minuto,
+        rules=load_rules(rules_path),
+        params=params,
+        meses=len(resolve_periodo(periodo)),
+        productos_detalle=productos_detalle,
+    )
+    return {"periodo": periodo, **out}
+
+def pipeline_stats() -> Dict[str, Any]:
+    return {"run_cache": run_cache.stats(), "single_flight": run_flight.stats()}
+
+def _cached_run(db_path: str, key: str) -> Optional[Dict[str, Any]]:
+    # Memoria primero; si no, la última corrida guardada con esa clave
+    cached = run_cache.get(key)
+    if cached is None:
+        cached = get_run_by_cache_key(db_path, key)
+        # Un reporte LLM fallido no se memoriza: cada acierto lo reintenta (ver run_all)
+        if cached is not None and cached.get("report_status") != "failed":
+            run_cache.put(key, cached)
+    return cached
+
+def _llm_key(llm_provider) -> Optional[str]:
+    if llm_provider is None:
+        return None
+    model = getattr(llm_provider, "model_name", None)
+    return f"{type(llm_provider).__name__}:{model}" if model else type(llm_provider).__name__
+
+def _compute_run(
+    *,
+    data_dir: str,
+    periodo: str,
+    valor_minuto: float,
+    margen_critico_pct: float,
+    margen_objetivo_pct: float,
+    esfuerzo_alto_min: int,
+    top_drivers: int,
+    rules_path: Optional[str] = None,
+    report_status: str = "fallback",
+    diag: Optional[Diagnostics] = None,
+    state_key: Optional[str] = None,
+    incremental: bool = True
+) -> Dict[str, Any]:
+    diag = diag or Diagnostics()
+    rules = load_rules(rules_path)
+    state = cost_states.get(state_key) if state_key and incremental else None
+
+    if state is not None:
+        # Solo cambiaron insumos: recalcular los productos que los usan
+        with diag.stage("load_csvs") as st:
+            insumos = load_csvs(data_dir, datasets=["insumos"])["insumos"]
+            st["rows"] = len(insumos)
+        affected = state.affected(insumos)
+        logger.info(f"Recálculo incremental: {len(affected)} productos afectados por cambios en insumos")
+        with diag.stage("incremental_costs", rows=len(affected)):
+            dfs, unit_costs, recipe_drivers, metrics = update_costs(state, insumos, affected, valor_minuto)
+        sub = metrics[metrics["producto_id"].isin(affected)]
+        with diag.stage("build_alerts") as st:
+            alerts_df = build_alerts(
+                sub,
+                margen_critico_pct=margen_critico_pct,
+                margen_objetivo_pct=margen_objetivo_pct,
+                esfuerzo_alto_min=esfuerzo_alto_min,
+                rules=rules
+            )
+            st["rows"] = len(alerts_df)
+        with diag.stage("attach_evidence") as st:
+            evidence = {pid: recs for pid, recs in state.evidence.items() if pid not in affected}
+            evidence.update(_evidence_by_product(
+                attach_evidence(alerts_df, sub, recipe_drivers, top_n_drivers=top_drivers)
+            ))
+            alerts = _ordered_alerts(metrics, evidence)
+            st["rows"] = len(alerts)
     else:
-        logger.info("No se proporcionó LLM provider")
+        # Solo unidades por producto del periodo (para que el run sea consistente):
+        # desde el agregado del store, sin materializar filas de ventas
+        with diag.stage("load_csvs") as st:
+            dfs = load_csvs(data_dir, periodo=periodo, unidades_only=True)
+            st["rows"] = int(sum(len(df) for df in dfs.values()))
+
+        # Ventanas (trimestre, YTD, últimos N meses) prorratean los gastos de todos sus meses
+        meses = len(resolve_periodo(periodo))
+        with diag.stage("compute_costs") as st:
+            unit_costs, recipe_drivers = compute_costs(dfs, valor_minuto=valor_minuto, meses=meses)
+            st["rows"] = len(unit_costs)
+        with diag.stage("compute_metrics") as st:
+            metrics = compute_metrics(dfs, unit_costs=unit_costs)
+            st["rows"] = len(metrics)
+
+        with diag.stage("build_alerts") as st:
+            alerts_df = build_alerts(
+                metrics,
+                margen_critico_pct=margen_critico_pct,
+                margen_objetivo_pct=margen_objetivo_pct,
+                esfuerzo_alto_min=esfuerzo_alto_min,
+                rules=rules
+            )
+            st["rows"] = len(alerts_df)
+        with diag.stage("attach_evidence") as st:
+            alerts = attach_evidence(alerts_df, metrics, recipe_drivers, top_n_drivers=top_drivers)
+            st["rows"] = len(alerts)
+        evidence = _evidence_by_product(alerts)
+
+    if state_key:
+        cost_states.put(state_key, CostState(
+            dfs, unit_costs, recipe_drivers, metrics, evidence,
+            dependents=state.dependents if state is not None else None
+        ))
+
+    with diag.stage("kpis", rows=len(metrics)):
+        kpis = _kpis_from_metrics(metrics, alerts, periodo)
 
     run_id = datetime.utcnow().isoformat() + "Z"
     output = {
         "run_id": run_id,
         "periodo": periodo,
-        "executive_report_md": executive_md or _fallback_report(kpis, alerts),
+        "executive_report_md": _fallback_report(kpis, alerts),
+        "report_status": report_status,
         "kpis": kpis,
         "alerts": alerts
     }
-
-    save_run(db_path, run_id=run_id, periodo=periodo, output=output)
     return output
 
+def _evidence_by_product(alerts: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    # producto_id -> alertas (sin alert_id, que depende de la posición global).
+    # Copia profunda: CostState no comparte `evidencia` con el output entregado
+    out: Dict[str, List[Dict[str, Any]]] = {}
+    for a in alerts:
+        rec = copy.deepcopy({k: v for k, v in a.items() if k != "alert_id"})
+        out.setdefault(a["producto_id"], []).append(rec)
+    return out
+
+def _ordered_alerts(metrics: pd.DataFrame, evidence: Dict[str, List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    # Mismo orden que build_alerts (producto -> precedencia) y alert_id correlativo
+    out = []
+    for pid in pd.unique(metrics["producto_id"]):
+        for rec in evidence.get(pid, ()):
+            out.append({"alert_id": f"A-{len(out) + 1:04d}", **copy.deepcopy(rec)})
+    return out
+
+def _schedule_report(db_path: str, key: str, output: Dict[str, Any], llm_provider) -> None:
+    # Un solo reporte en curso por corrida
+    with _reports_lock:
+        if output["run_id"] in _reports_in_flight:
+            return
+        _reports_in_flight.add(output["run_id"])
+    report_pool.submit(_generate_report, db_path, key, output, llm_provider)
+
+def _generate_report(db_path: str, key: str, output: Dict[str, Any], llm_provider) -> None:
+    # Corre en report_pool: genera el reporte y parchea la corrida guardada y la caché
+    try:
+        _patch_report(db_path, key, output, llm_provider)
+    finally:
+        with _reports_lock:
+            _reports_in_flight.discard(output["run_id"])
+
+def _patch_report(db_path: str, key: str, output: Dict[str, Any], llm_provider) -> None:
+    payload = {
+        "periodo": output["periodo"],
+        "kpis": output["kpis"],
+        "alerts": output["alerts"]
+    }
+
+    executive_md = None
+    logger.info(f"Llamando al LLM provider: {type(llm_provider).__name__}")
+    logger.info(f"Payload contiene {len(output['alerts'])} alertas")
+    diag = Diagnostics()
+    try:
+        with diag.stage("llm", rows=len(output["alerts"])):
+            executive_md = llm_provider.generate_executive_report(payload)
+        logger.info(f"LLM respondió con {len(executive_md) if executive_md else 0} caracteres")
+    except Exception as e:
+        logger.error(f"Error al llamar al LLM: {type(e).__name__}: {str(e)}")
+        import traceback
+        logger.error(f"Traceback:\n{traceback.format_exc()}")
+
+    provider = type(llm_provider).__name__
+    if diag.stages:
+        llm_seconds.observe(diag.stages[-1]["wall_ms"] / 1000.0, provider=provider)
+    if executive_md:
+        patched = {**output, "executive_report_md": executive_md, "report_status": "ready"}
+    else:
+        llm_errors_total.inc(provider=provider)
+        patched = {**output, "report_status": "failed"}
+    try:
+        update_run_output(db_path, output["run_id"], patched)
+        save_run_diagnostics(db_path, output["run_id"], diag.to_list())
+        if executive_md:
+            run_cache.put(key, patched)
+        else:
+            # Reporte determinístico de respaldo: no queda en memoria como resultado final
+            run_cache.discard(key)
+    except Exception as e:
+        logger.error(f"No se pudo actualizar la corrida {output['run_id']}: {type(e).__name__}: {e}")
+
+def _compute_range(
+    *,
+    data_dir: str,
+    periodos: List[str],
+    valor_minuto: float,
+    margen_critico_pct: float,
+    margen_objetivo_pct: float,
+    esfuerzo_alto_min: int,
+    top_drivers: int,
+    rules_path: Optional[str] = None,
+    diag: Optional[Diagnostics] = None
+) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, List[Dict[str, Any]]]]:
+    # Retorna (outputs, etapas propias de cada periodo); las del panel quedan en `diag`
+    diag = diag or Diagnostics()
+    # Panel de unidades (periodo, producto_id) en una sola lectura/groupby
+    with diag.stage("batch_load_csvs") as st:
+        dfs = load_csvs(data_dir, unidades_only=True, periodos=periodos)
+        st["rows"] = int(sum(len(df) for df in dfs.values()))
+
+    with diag.stage("batch_compute_costs") as st:
+        unit_costs, recipe_drivers = compute_costs_panel(dfs, dfs["unidades"], periodos, valor_minuto=valor_minuto)
+        st["rows"] = len(unit_costs)
+    with diag.stage("batch_compute_metrics") as st:
+        metrics = compute_metrics_panel(dfs, unit_costs=unit_costs)
+        st["rows"] = len(metrics)
+
+    with diag.stage("batch_build_alerts") as st:
+        alerts_df = build_alerts(
+            metrics,
+            margen_critico_pct=margen_critico_pct,
+            margen_objetivo_pct=margen_objetivo_pct,
+            esfuerzo_alto_min=esfuerzo_alto_min,
+            rules=load_rules(rules_path)
+        )
+        # Drivers una sola vez para todos los productos con alerta en el rango
+        drivers = top_drivers_for(recipe_drivers, alerts_df["producto_id"].unique(), top_drivers)
+        st["rows"] = len(alerts_df)
+
+    metrics_por_periodo = dict(tuple(metrics.groupby("periodo", sort=False)))
+    alerts_por_periodo = dict(tuple(alerts_df.groupby("periodo", sort=False)))
+
+    now = datetime.utcnow()
+    out: Dict[str, Dict[str, Any]] = {}
+    stages: Dict[str, List[Dict[str, Any]]] = {}
+    for i, periodo in enumerate(periodos):
+        m = metrics_por_periodo.get(periodo, metrics.head(0)).drop(columns=["periodo"])
+        a = alerts_por_periodo.get(periodo, alerts_df.head(0)).drop(columns=["periodo"]).reset_index(drop=True)
+        with Diagnostics(memory=diag.memory) as d:
+            with d.stage("attach_evidence") as st:
+                alerts = attach_evidence(a, m, recipe_drivers, top_n_drivers=top_drivers, drivers=drivers)
+                st["rows"] = len(alerts)
+            with d.stage("kpis", rows=len(m)):
+                kpis = _kpis_from_metrics(m, alerts, periodo)
+        stages[periodo] = d.to_list()
+        # run_id único por periodo dentro del lote
+        run_id = (now + timedelta(microseconds=i)).isoformat() + "Z"
+        out[periodo] = {
+            "run_id": run_id,
+            "periodo": periodo,
+            "executive_report_md": _fallback_report(kpis, alerts),
+            "report_status": "fallback",
+            "kpis": kpis,
+            "alerts": alerts
+        }
+    return out, stages
+
 def _kpis_from_metrics(metrics: pd.DataFrame, alerts: list, periodo: str) -> Dict[str, Any]:
     total_productos = int(metrics["producto_id"].nunique())
 
@@ -0,0 +1,68 @@
+"""
+Caché de resultados de `run_all`.
+
+Nivel 1: memoria (LRU + TTL). Nivel 2: tabla `runs` de SQLite (columna cache_key).
+La clave combina la huella de los archivos de datos y reglas con todos los
+parámetros de la corrida, así un cambio en cualquiera produce otra clave.
+Con `copy` (por defecto) se guarda y se entrega una copia profunda: quien modifique
+la respuesta no altera los aciertos siguientes.
+"""
+
+from typing import Any, Dict, Optional
+from collections import OrderedDict
+import copy as _copy
+import hashlib
+import json
+import threading
+import time
+
+def cache_key(**parts: Any) -> str:
+    raw = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+class RunCache:
+    def __init__(self, max_entries: int, ttl_s: float, copy: bool = True) -> None:
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.copy = copy
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and (time.monotonic() - item[0]) <= self.ttl_s:
+                self._data.move_to_end(key)
+                self.hits += 1
+                value = item[1]
+            else:
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+        return _copy.deepcopy(value) if self.copy else value
+
+    def put(self, key: str, output: Dict[str, Any]) -> None:
+        if self.max_entries <= 0:
+            return
+        if self.copy:
+            output = _copy.deepcopy(output)
+        with self._lock:
+            self._data[key] = (time.monotonic(), output)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def discard(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._data), "hits": self.hits, "misses": self.misses}
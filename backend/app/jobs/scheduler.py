@@ -2,8 +2,16 @@ from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 from typing import Callable
 
-def start_scheduler(run_fn: Callable[[], None], every_minutes: int = 360) -> BackgroundScheduler:
+def start_scheduler(
+    run_fn: Callable[[], None],
+    every_minutes: int = 360,
+    job_id: str = "sabia_pipeline"
+) -> BackgroundScheduler:
     sched = BackgroundScheduler()
-    sched.add_job(run_fn, trigger=IntervalTrigger(minutes=every_minutes), id="sabia_pipeline", replace_existing=True)
+    # Una sola ejecución a la vez: si una pasada se atrasa, la siguiente no se solapa
+    sched.add_job(
+        run_fn, trigger=IntervalTrigger(minutes=every_minutes), id=job_id,
+        replace_existing=True, max_instances=1, coalesce=True
+    )
     sched.start()
     return sched
@@ -0,0 +1,66 @@
+"""
+Coalescencia de llamadas concurrentes idénticas ("single-flight").
+
+Si varios hilos piden la misma clave mientras hay un cálculo en curso, solo el
+primero ejecuta; el resto espera y recibe el mismo resultado (o la misma excepción).
+Con `copy` (por defecto), si hubo esperas cada llamador recibe su propia copia profunda,
+así nadie ve las modificaciones de otro; sin esperas el líder recibe el original.
+"""
+
+from typing import Any, Callable, Dict, Optional
+import copy as _copy
+import threading
+
+class _Call:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+class SingleFlight:
+    def __init__(self, copy: bool = True) -> None:
+        self.copy = copy
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.executed += 1
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return _copy.deepcopy(call.result) if self.copy else call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+                shared = call.waiters > 0
+            call.done.set()
+        # call.result queda intacto para los que esperan: el líder también recibe copia
+        return _copy.deepcopy(call.result) if self.copy and shared else call.result
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "executed": self.executed,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls),
+            }
@@ -1,9 +1,14 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 import logging
-from app.api.routes import router
+import time
+from app.api.routes import router, job_queue
 from app.demo.demo_routes import demo_router
 from app.core.config import settings
 from app.storage.db import init_db
+from app.storage.pool import close_pools
+from app.jobs.maintenance import run_maintenance
+from app.jobs.scheduler import start_scheduler
+from app.core.telemetry import http_request_seconds, http_requests_total
 
 # Configurar logging
 logging.basicConfig(
@@ -15,6 +20,36 @@ app = FastAPI(title="SabIA Backend", version="0.1.0")
 app.include_router(router)
 app.include_router(demo_router)
 
+@app.middleware("http")
+async def _request_metrics(request: Request, call_next):
+    t0 = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Plantilla de la ruta ("/runs/{run_id}"), no la URL, para acotar las series
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        http_request_seconds.observe(time.perf_counter() - t0, method=request.method, route=route)
+        http_requests_total.inc(method=request.method, route=route, status=status)
+
 @app.on_event("startup")
 def _startup():
     init_db(settings.DB_PATH)
+    # Retoma los jobs que quedaron en cola antes del reinicio
+    job_queue.start()
+    if settings.RETENTION_ENABLED:
+        app.state.scheduler = start_scheduler(
+            lambda: run_maintenance(settings.DB_PATH),
+            every_minutes=settings.RETENTION_EVERY_MINUTES,
+            job_id="sabia_maintenance",
+        )
+
+@app.on_event("shutdown")
+def _shutdown():
+    sched = getattr(app.state, "scheduler", None)
+    if sched is not None:
+        sched.shutdown(wait=False)
+    job_queue.stop(timeout=5)
+    close_pools()
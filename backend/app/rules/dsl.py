@@ -0,0 +1,181 @@
+"""
+Reglas de alerta declarativas (JSON) compiladas a predicados vectorizados.
+
+Cada regla define `condicion`, una expresión sobre columnas de métricas y parámetros
+(margen_critico_pct, margen_objetivo_pct, esfuerzo_alto_min). Ejemplo:
+
+    "0 <= margen_pct < margen_critico_pct and tiempo_total_min >= esfuerzo_alto_min"
+
+La expresión se valida contra un subconjunto seguro de Python y se reescribe para
+operar sobre arrays NumPy (and/or/not -> &/|/~, comparaciones encadenadas -> &).
+La compilación se hace una vez por archivo (cacheada por ruta + mtime).
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+import ast
+import json
+import os
+import threading
+import numpy as np
+import pandas as pd
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(__file__), "default_rules.json")
+
+PARAMS = ("margen_critico_pct", "margen_objetivo_pct", "esfuerzo_alto_min")
+FUNCS = {"abs": np.abs, "isnan": np.isnan}
+
+_ALLOWED_NODES = (
+    ast.Expression, ast.BoolOp, ast.BinOp, ast.UnaryOp, ast.Compare, ast.Name, ast.Load,
+    ast.Constant, ast.Call,
+    ast.And, ast.Or, ast.Not, ast.USub, ast.UAdd, ast.Invert,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.BitAnd, ast.BitOr,
+    ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Eq, ast.NotEq,
+)
+
+class _Vectorize(ast.NodeTransformer):
+    # and/or/not y comparaciones encadenadas no funcionan con arrays: se reescriben a &, |, ~
+
+    def visit_BoolOp(self, node: ast.BoolOp) -> ast.AST:
+        self.generic_visit(node)
+        op = ast.BitAnd() if isinstance(node.op, ast.And) else ast.BitOr()
+        out = node.values[0]
+        for v in node.values[1:]:
+            out = ast.BinOp(left=out, op=op, right=v)
+        return out
+
+    def visit_UnaryOp(self, node: ast.UnaryOp) -> ast.AST:
+        self.generic_visit(node)
+        if isinstance(node.op, ast.Not):
+            return ast.UnaryOp(op=ast.Invert(), operand=node.operand)
+        return node
+
+    def visit_Compare(self, node: ast.Compare) -> ast.AST:
+        self.generic_visit(node)
+        if len(node.ops) == 1:
+            return node
+        parts = []
+        left = node.left
+        for op, right in zip(node.ops, node.comparators):
+            parts.append(ast.Compare(left=left, ops=[op], comparators=[right]))
+            left = right
+        out = parts[0]
+        for p in parts[1:]:
+            out = ast.BinOp(left=out, op=ast.BitAnd(), right=p)
+        return out
+
+def compile_condition(expr: str, label: str = "regla") -> Tuple[Any, List[str]]:
+    """
+    Valida y compila una condición. Retorna (code, columnas_referenciadas).
+    """
+    try:
+        tree = ast.parse(expr, mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"{label}: condición inválida ({e.msg}): {expr}")
+
+    names = set()
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES):
+            raise ValueError(f"{label}: expresión no permitida ({type(node).__name__}): {expr}")
+        if isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.func.id not in FUNCS or node.keywords:
+                raise ValueError(f"{label}: función no permitida: {expr}")
+        elif isinstance(node, ast.Constant) and not isinstance(node.value, (int, float, bool)):
+            raise ValueError(f"{label}: solo se permiten constantes numéricas: {expr}")
+        elif isinstance(node, ast.Name):
+            names.add(node.id)
+
+    tree = ast.fix_missing_locations(_Vectorize().visit(tree))
+    code = compile(tree, f"<{label}>", "eval")
+    columns = sorted(n for n in names if n not in PARAMS and n not in FUNCS)
+    return code, columns
+
+class Rule:
+    def __init__(self, spec: Dict[str, Any], orden: int) -> None:
+        missing = [k for k in ("tipo", "severidad", "condicion", "mensaje", "accion") if k not in spec]
+        if missing:
+            raise ValueError(f"Regla #{orden}: faltan campos {missing}")
+        self.tipo = str(spec["tipo"])
+        self.severidad = str(spec["severidad"])
+        self.condicion = str(spec["condicion"])
+        self.mensaje = str(spec["mensaje"])
+        self.accion = str(spec["accion"])
+        self.nota: Optional[str] = spec.get("nota")
+        self.precio_sugerido = bool(spec.get("precio_sugerido", False))
+        # exclusiva: si aplica, las reglas de menor precedencia no se evalúan para ese producto
+        self.exclusiva = bool(spec.get("exclusiva", False))
+        self.precedencia = int(spec.get("precedencia", orden))
+        self.code, self.columns = compile_condition(self.condicion, label=self.tipo)
+
+    def evaluate(self, namespace: Dict[str, Any], shape: Tuple[int, ...]) -> np.ndarray:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            out = eval(self.code, {"__builtins__": {}}, namespace)
+        return np.broadcast_to(np.asarray(out, dtype=bool), shape)
+
+class RuleSet:
+    def __init__(self, specs: List[Dict[str, Any]]) -> None:
+        rules = [Rule(spec, i) for i, spec in enumerate(specs)]
+        # Orden estable por precedencia (menor = primero)
+        self.rules = sorted(rules, key=lambda r: r.precedencia)
+        self.columns = sorted({c for r in self.rules for c in r.columns})
+
+    def namespace(self, metrics: pd.DataFrame, params: Dict[str, float]) -> Dict[str, Any]:
+        faltan = [c for c in self.columns if c not in metrics.columns]
+        if faltan:
+            raise ValueError(f"Reglas referencian columnas inexistentes: {faltan}")
+        return self.array_namespace({c: metrics[c].to_numpy(dtype=float) for c in self.columns}, params)
+
+    def array_namespace(self, arrays: Dict[str, np.ndarray], params: Dict[str, float]) -> Dict[str, Any]:
+        # Igual que namespace pero desde arrays (p.ej. productos x escenarios)
+        faltan = [c for c in self.columns if c not in arrays]
+        if faltan:
+            raise ValueError(f"Reglas referencian columnas inexistentes: {faltan}")
+        ns: Dict[str, Any] = {c: arrays[c] for c in self.columns}
+        ns.update({k: float(params[k]) for k in PARAMS})
+        ns.update(FUNCS)
+        return ns
+
+    def masks(self, namespace: Dict[str, Any], shape: Tuple[int, ...]) -> List[Tuple[Rule, np.ndarray]]:
+        """
+        Máscaras por regla (en orden de precedencia) ya descontando las exclusivas previas.
+        `namespace` puede traer arrays 1-D (productos) o 2-D (productos x escenarios).
+        """
+        out = []
+        bloqueado = np.zeros(shape, dtype=bool)
+        for rule in self.rules:
+            mask = rule.evaluate(namespace, shape) & ~bloqueado
+            if rule.exclusiva:
+                bloqueado = bloqueado | mask
+            out.append((rule, mask))
+        return out
+
+def parse_rules(text: str) -> RuleSet:
+    data = json.loads(text)
+    specs = data.get("rules") if isinstance(data, dict) else data
+    if not isinstance(specs, list):
+        raise ValueError("El archivo de reglas debe ser una lista o {\"rules\": [...]}")
+    return RuleSet(specs)
+
+def rules_fingerprint(path: Optional[str] = None) -> Dict[str, Any]:
+    path = os.path.abspath(path or DEFAULT_RULES_PATH)
+    st = os.stat(path)
+    return {"path": path, "mtime_ns": int(st.st_mtime_ns), "size": int(st.st_size)}
+
+_cache: Dict[str, Tuple[Tuple[int, int], RuleSet]] = {}
+_cache_lock = threading.Lock()
+
+def load_rules(path: Optional[str] = None) -> RuleSet:
+    """
+    Carga y compila un archivo de reglas; se recompila solo si cambia (mtime/tamaño).
+    """
+    path = os.path.abspath(path or DEFAULT_RULES_PATH)
+    st = os.stat(path)
+    key = (int(st.st_mtime_ns), int(st.st_size))
+    with _cache_lock:
+        hit = _cache.get(path)
+        if hit and hit[0] == key:
+            return hit[1]
+    with open(path, "r", encoding="utf-8") as f:
+        ruleset = parse_rules(f.read())
+    with _cache_lock:
+        _cache[path] = (key, ruleset)
+    return ruleset
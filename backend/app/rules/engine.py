@@ -1,90 +1,97 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+import numpy as np
 import pandas as pd
 
+from .dsl import RuleSet, load_rules
+
+ALERT_COLUMNS = [
+    "producto_id", "nombre_producto", "tipo", "severidad", "mensaje",
+    "accion", "precio_sugerido", "margen_objetivo_pct", "nota",
+]
+
 def build_alerts(
     metrics: pd.DataFrame,
     margen_critico_pct: float,
     margen_objetivo_pct: float,
-    esfuerzo_alto_min: int
-) -> List[Dict[str, Any]]:
-    alerts: List[Dict[str, Any]] = []
+    esfuerzo_alto_min: int,
+    rules: Optional[RuleSet] = None
+) -> pd.DataFrame:
+    """
+    Evalúa cada regla (por defecto `default_rules.json`) como máscara booleana sobre
+    todo el frame de métricas. Retorna un frame de alertas (ALERT_COLUMNS) en el orden
+    producto -> precedencia; usar `alerts_to_records` para convertirlo a dicts en el
+    borde de la API. Si `metrics` es un panel (columna `periodo`) la columna se conserva.
+    """
+    n = len(metrics)
+    rules = rules or load_rules()
+    params = {
+        "margen_critico_pct": margen_critico_pct,
+        "margen_objetivo_pct": margen_objetivo_pct,
+        "esfuerzo_alto_min": esfuerzo_alto_min,
+    }
+    masks = rules.masks(rules.namespace(metrics, params), (n,))
 
-    for _, r in metrics.iterrows():
-        producto_id = str(r["producto_id"])
-        nombre = str(r["nombre_producto"])
-        precio = float(r["precio"])
-        costo_total = float(r["costo_total_unit"])
-        margen_abs = float(r["margen_abs_unit"])
-        margen_pct = float(r["margen_pct"]) if r["margen_pct"] is not None else 0.0
-        unidades = float(r["unidades_periodo"])
-        tiempo = float(r["tiempo_total_min"])
+    # Precio sugerido: una sola columna para todo el catálogo
+    costo_total = metrics["costo_total_unit"].to_numpy(dtype=float)
+    if margen_objetivo_pct >= 1.0:
+        precio_sugerido = np.full(n, np.nan)
+    else:
+        precio_sugerido = costo_total / (1.0 - margen_objetivo_pct)
 
-        # Helper precio sugerido
-        def precio_sugerido():
-            if margen_objetivo_pct >= 1.0:
-                return None
-            return (costo_total / (1.0 - margen_objetivo_pct)) if (1.0 - margen_objetivo_pct) else None
+    producto_id = metrics["producto_id"].astype(str).to_numpy()
+    nombre = metrics["nombre_producto"].astype(str).to_numpy()
+    periodo = metrics["periodo"].to_numpy() if "periodo" in metrics.columns else None
+    columns = (["periodo"] if periodo is not None else []) + ALERT_COLUMNS
+    pos = np.arange(n)
 
-        # Margen negativo
-        if margen_abs < 0:
-            alerts.append({
-                "producto_id": producto_id,
-                "nombre_producto": nombre,
-                "tipo": "MARGEN_NEGATIVO",
-                "severidad": "ALTA",
-                "mensaje": "El costo total por unidad supera el precio de venta.",
-                "recomendacion": {
-                    "accion": "AJUSTAR_PRECIO",
-                    "precio_sugerido": precio_sugerido(),
-                    "margen_objetivo_pct": margen_objetivo_pct
-                }
-            })
+    frames = []
+    for orden, (rule, mask) in enumerate(masks):
+        idx = pos[mask]
+        if not len(idx):
             continue
+        frame = pd.DataFrame({
+            "_pos": idx,
+            "_orden": orden,
+            "producto_id": producto_id[idx],
+            "nombre_producto": nombre[idx],
+            "tipo": rule.tipo,
+            "severidad": rule.severidad,
+            "mensaje": rule.mensaje,
+            "accion": rule.accion,
+            "precio_sugerido": precio_sugerido[idx] if rule.precio_sugerido else np.nan,
+            "margen_objetivo_pct": margen_objetivo_pct if rule.precio_sugerido else np.nan,
+            "nota": rule.nota,
+        })
+        if periodo is not None:
+            frame["periodo"] = periodo[idx]
+        frames.append(frame)
 
-        # Margen crítico
-        if 0 <= margen_pct < margen_critico_pct:
-            alerts.append({
-                "producto_id": producto_id,
-                "nombre_producto": nombre,
-                "tipo": "MARGEN_CRITICO",
-                "severidad": "MEDIA",
-                "mensaje": "El margen está por debajo del umbral crítico.",
-                "recomendacion": {
-                    "accion": "REVISAR_PRECIO_O_COSTOS",
-                    "precio_sugerido": precio_sugerido(),
-                    "margen_objetivo_pct": margen_objetivo_pct
-                }
-            })
-
-        # Alto esfuerzo / bajo retorno
-        # criterio simple: esfuerzo alto y margen bajo (abs)
-        if tiempo >= float(esfuerzo_alto_min) and margen_abs <= (0.5 * precio * margen_critico_pct):
-            alerts.append({
-                "producto_id": producto_id,
-                "nombre_producto": nombre,
-                "tipo": "ALTO_ESFUERZO_BAJO_RETORNO",
-                "severidad": "MEDIA",
-                "mensaje": "Alto tiempo de producción con retorno bajo por unidad.",
-                "recomendacion": {
-                    "accion": "OPTIMIZAR_O_PRIORIZAR",
-                    "nota": "Revisar proceso/receta o priorizar productos con mejor retorno."
-                }
-            })
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    alerts = pd.concat(frames, ignore_index=True)
+    alerts = alerts.sort_values(["_pos", "_orden"], kind="mergesort")
+    return alerts[columns].reset_index(drop=True)
 
-        # Precio “desactualizado” (proxy): costo_total muy cerca del precio
-        # en demo no tenemos histórico, así que usamos cercanía al precio
-        if precio > 0 and (costo_total / precio) >= (1.0 - (margen_critico_pct / 2.0)):
-            alerts.append({
-                "producto_id": producto_id,
-                "nombre_producto": nombre,
-                "tipo": "PRECIO_DESACTUALIZADO",
-                "severidad": "MEDIA",
-                "mensaje": "El costo actual está muy cerca del precio; riesgo de quedar sin margen.",
-                "recomendacion": {
-                    "accion": "AJUSTAR_PRECIO",
-                    "precio_sugerido": precio_sugerido(),
-                    "margen_objetivo_pct": margen_objetivo_pct
-                }
-            })
+def _recomendacion(r: Dict[str, Any]) -> Dict[str, Any]:
+    rec: Dict[str, Any] = {"accion": r["accion"]}
+    mo = r["margen_objetivo_pct"]
+    if pd.notna(mo):
+        # Reglas con precio sugerido (None si el margen objetivo no es alcanzable)
+        rec["precio_sugerido"] = None if mo >= 1.0 else float(r["precio_sugerido"])
+        rec["margen_objetivo_pct"] = mo
+    if isinstance(r["nota"], str):
+        rec["nota"] = r["nota"]
+    return rec
 
-    return alerts
+def alerts_to_records(alerts: pd.DataFrame) -> List[Dict[str, Any]]:
+    out = []
+    for r in alerts.to_dict(orient="records"):
+        out.append({
+            "producto_id": r["producto_id"],
+            "nombre_producto": r["nombre_producto"],
+            "tipo": r["tipo"],
+            "severidad": r["severidad"],
+            "mensaje": r["mensaje"],
+            "recomendacion": _recomendacion(r),
+        })
+    return out
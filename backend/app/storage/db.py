@@ -1,22 +1,70 @@
 import sqlite3
+import base64
+import functools
+import hashlib
 import json
 import os
-from typing import Optional, Dict, Any, List
-from datetime import datetime
+import time
+import zlib
+from typing import Optional, Dict, Any, Iterable, List, Tuple
+from datetime import datetime, timedelta, timezone
+
+from app.core.config import settings
+from app.core.telemetry import sqlite_write_seconds
+from app.storage.pool import get_pool
+from app.ingest.sales_store import resolve_periodo
 
 def get_conn(db_path: str) -> sqlite3.Connection:
+    # Conexión suelta (scripts / mantenimiento); la app usa el pool de _write / _read
     conn = sqlite3.connect(db_path, check_same_thread=False)
     conn.row_factory = sqlite3.Row
     return conn
 
+def _write(db_path: str):
+    # Conexión escritora persistente, en transacción (commit al salir)
+    return get_pool(db_path, readers=settings.SQLITE_READERS).writer()
+
+def _read(db_path: str):
+    # Conexión lectora persistente del pool (WAL: no espera a las escrituras)
+    return get_pool(db_path, readers=settings.SQLITE_READERS).reader()
+
+def _timed_write(fn):
+    # Latencia de cada escritura, por función (GET /metrics)
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            sqlite_write_seconds.observe(time.perf_counter() - t0, op=fn.__name__)
+    return wrapper
+
 def init_db(db_path: str) -> None:
     # Crear el directorio si no existe
     db_dir = os.path.dirname(db_path)
     if db_dir and not os.path.exists(db_dir):
         os.makedirs(db_dir, exist_ok=True)
     
-    conn = get_conn(db_path)
-    cur = conn.cursor()
+    with _write(db_path) as conn:
+        _create_schema(conn.cursor())
+
+# Tablas normalizadas por corrida, solo con las columnas que se consultan entre corridas
+# (el output completo, con evidencia y drivers, vive una sola vez en payloads):
+#   run_kpis: una fila por corrida; run_alerts: una por alerta (quién, tipo, severidad).
+# periodo y created_at se repiten en cada tabla para filtrar por índice sin joins.
+# periodo_inicio/periodo_fin: primer y último mes ("YYYY-MM") que cubre la corrida;
+# ventana = 1 para periodos de varios meses ("2024-Q1", "2024-03:YTD", "2024-03:T6"),
+# que no se mezclan con las corridas mensuales en las consultas por rango.
+KPI_COLUMNS = [
+    "total_productos", "productos_margen_negativo_count", "productos_margen_critico_count",
+    "productos_precio_desactualizado_count", "productos_alto_esfuerzo_bajo_retorno_count",
+    "margen_promedio_pct", "contribucion_total", "perdida_total_margen_negativo",
+]
+_RANGE_COLUMNS = ["periodo_inicio", "periodo_fin", "ventana"]
+_INTEGER_KPI_COLUMNS = {c for c in KPI_COLUMNS if c == "total_productos" or c.endswith("_count")}
+ALERT_COLUMNS = ["producto_id", "nombre_producto", "tipo", "severidad"]
+
+def _create_schema(cur: sqlite3.Cursor) -> None:
     cur.execute("""
     CREATE TABLE IF NOT EXISTS runs (
         run_id TEXT PRIMARY KEY,
@@ -25,44 +73,640 @@ def init_db(db_path: str) -> None:
         output_json TEXT NOT NULL
     )
     """)
-    conn.commit()
-    conn.close()
-
-def save_run(db_path: str, run_id: str, periodo: str, output: Dict[str, Any]) -> None:
-    conn = get_conn(db_path)
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT OR REPLACE INTO runs(run_id, periodo, created_at, output_json) VALUES (?, ?, ?, ?)",
-        (run_id, periodo, datetime.utcnow().isoformat() + "Z", json.dumps(output, ensure_ascii=False))
+    # Migración: clave de caché de run_all (bases creadas antes no la tienen)
+    cols = {r["name"] for r in cur.execute("PRAGMA table_info(runs)").fetchall()}
+    if "cache_key" not in cols:
+        cur.execute("ALTER TABLE runs ADD COLUMN cache_key TEXT")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_runs_cache_key ON runs(cache_key, created_at)")
+    # Listado / última corrida (global o por periodo) y paginación por cursor (created_at, run_id)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_runs_created ON runs(created_at, run_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_runs_periodo ON runs(periodo, created_at, run_id)")
+    # Cola de jobs de POST /jobs (persistente: sobrevive reinicios)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS jobs (
+        job_id TEXT PRIMARY KEY,
+        status TEXT NOT NULL,
+        request_json TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        started_at TEXT,
+        finished_at TEXT,
+        run_id TEXT,
+        error TEXT
     )
-    conn.commit()
-    conn.close()
-
-def get_latest_run(db_path: str) -> Optional[Dict[str, Any]]:
-    conn = get_conn(db_path)
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM runs ORDER BY created_at DESC LIMIT 1")
-    row = cur.fetchone()
-    conn.close()
-    if not row:
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at)")
+    # Instrumentación por etapa de cada corrida (ver app.core.diagnostics)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS run_diagnostics (
+        run_id TEXT NOT NULL,
+        stage TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        wall_ms REAL,
+        cpu_ms REAL,
+        peak_mem_kb REAL,
+        rows INTEGER
+    )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_run_diagnostics_run ON run_diagnostics(run_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_run_diagnostics_stage ON run_diagnostics(stage, created_at)")
+
+    kpis_sql = f"""
+    CREATE TABLE IF NOT EXISTS {{}} (
+        run_id TEXT PRIMARY KEY,
+        periodo TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        {", ".join(f"{c} {'INTEGER' if c in _INTEGER_KPI_COLUMNS else 'REAL'}" for c in KPI_COLUMNS)}
+    )
+    """
+    cur.execute(kpis_sql.format("run_kpis"))
+    # Migración: conteos creados como REAL (se leían como 15.0) -> INTEGER
+    tipos = {r["name"]: r["type"] for r in cur.execute("PRAGMA table_info(run_kpis)").fetchall()}
+    if tipos.get("total_productos") == "REAL":
+        cur.execute(kpis_sql.format("run_kpis_new"))
+        cur.execute(
+            f"INSERT INTO run_kpis_new SELECT run_id, periodo, created_at, "
+            f"{', '.join(f'CAST({c} AS INTEGER)' if c in _INTEGER_KPI_COLUMNS else c for c in KPI_COLUMNS)} FROM run_kpis"
+        )
+        cur.execute("DROP TABLE run_kpis")
+        cur.execute("ALTER TABLE run_kpis_new RENAME TO run_kpis")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_run_kpis_periodo ON run_kpis(periodo, created_at)")
+    _add_range_columns(cur, "run_kpis")
+    alerts_sql = f"""
+    CREATE TABLE IF NOT EXISTS {{}} (
+        run_id TEXT NOT NULL,
+        alert_id TEXT NOT NULL,
+        periodo TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        periodo_inicio TEXT,
+        periodo_fin TEXT,
+        ventana INTEGER NOT NULL DEFAULT 0,
+        {", ".join(f"{c} TEXT" for c in ALERT_COLUMNS)},
+        PRIMARY KEY (run_id, alert_id)
+    )
+    """
+    cur.execute(alerts_sql.format("run_alerts"))
+    cur.execute("DROP INDEX IF EXISTS idx_run_alerts_periodo")
+    # Migración: alertas con recomendación/impacto y tablas de evidencia, que duplicaban
+    # lo que ya está en payloads -> solo columnas de consulta
+    if "mensaje" in {r["name"] for r in cur.execute("PRAGMA table_info(run_alerts)").fetchall()}:
+        _add_range_columns(cur, "run_alerts")
+        cur.execute(alerts_sql.format("run_alerts_new"))
+        columnas = ", ".join(["run_id", "alert_id", "periodo", "created_at"] + _RANGE_COLUMNS + ALERT_COLUMNS)
+        cur.execute(f"INSERT INTO run_alerts_new({columnas}) SELECT {columnas} FROM run_alerts")
+        cur.execute("DROP TABLE run_alerts")
+        cur.execute("ALTER TABLE run_alerts_new RENAME TO run_alerts")
+    cur.execute("DROP TABLE IF EXISTS run_evidence")
+    cur.execute("DROP TABLE IF EXISTS run_evidence_drivers")
+    _add_range_columns(cur, "run_alerts")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_run_alerts_producto ON run_alerts(producto_id, periodo)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_run_alerts_tipo ON run_alerts(tipo, severidad)")
+
+    # Secciones del output por contenido: payloads guarda cada sección comprimida una sola
+    # vez (hash del JSON); run_sections apunta cada corrida a sus secciones
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS payloads (
+        hash TEXT PRIMARY KEY,
+        data BLOB NOT NULL
+    )
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS run_sections (
+        run_id TEXT NOT NULL,
+        section TEXT NOT NULL,
+        hash TEXT NOT NULL,
+        PRIMARY KEY (run_id, section)
+    )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_run_sections_hash ON run_sections(hash)")
+    # Migración: corridas resumidas por la retención (solo meta + kpis)
+    if "compacted" not in cols:
+        cur.execute("ALTER TABLE runs ADD COLUMN compacted INTEGER NOT NULL DEFAULT 0")
+
+    # Migración: corridas guardadas antes de las tablas normalizadas
+    pendientes = cur.execute(
+        "SELECT run_id, periodo, created_at, output_json FROM runs "
+        "WHERE run_id NOT IN (SELECT run_id FROM run_kpis)"
+    ).fetchall()
+    if pendientes:
+        _insert_normalized(cur, [
+            (r["run_id"], r["periodo"], r["created_at"], json.loads(r["output_json"])) for r in pendientes
+            if r["output_json"]
+        ])
+    # Migración: output_json sin comprimir -> secciones en payloads
+    legacy = cur.execute("SELECT run_id, output_json FROM runs WHERE output_json != ''").fetchall()
+    if legacy:
+        _write_payloads(cur, [(r["run_id"], _split_output(json.loads(r["output_json"]))) for r in legacy])
+        cur.executemany("UPDATE runs SET output_json = '' WHERE run_id = ?", [(r["run_id"],) for r in legacy])
+    # Migración: secciones por corrida (run_payloads) -> payloads por contenido
+    if cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'run_payloads'").fetchone():
+        por_run: Dict[str, Dict[str, Any]] = {}
+        for r in cur.execute("SELECT run_id, section, data FROM run_payloads").fetchall():
+            por_run.setdefault(r["run_id"], {}).update(json.loads(zlib.decompress(r["data"])))
+        _write_payloads(cur, [(run_id, _split_output(out)) for run_id, out in por_run.items()])
+        cur.execute("DROP TABLE run_payloads")
+
+def _add_range_columns(cur: sqlite3.Cursor, table: str) -> None:
+    # Migración: periodo_inicio / periodo_fin / ventana en tablas creadas antes
+    cols = {r["name"] for r in cur.execute(f"PRAGMA table_info({table})").fetchall()}
+    if "ventana" not in cols:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN periodo_inicio TEXT")
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN periodo_fin TEXT")
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN ventana INTEGER NOT NULL DEFAULT 0")
+        periodos = [r[0] for r in cur.execute(f"SELECT DISTINCT periodo FROM {table}").fetchall()]
+        cur.executemany(
+            f"UPDATE {table} SET periodo_inicio = ?, periodo_fin = ?, ventana = ? WHERE periodo = ?",
+            [(*_periodo_range(p), p) for p in periodos]
+        )
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_rango ON {table}(ventana, periodo_fin, periodo_inicio)")
+
+def _periodo_range(periodo: str) -> Tuple[str, str, int]:
+    # (primer mes, último mes, ventana) de un periodo guardado
+    try:
+        meses = resolve_periodo(periodo)
+    except ValueError:
+        return periodo, periodo, 0
+    return meses[0], meses[-1], int(len(meses) > 1)
+
+def _insert_normalized(
+    conn: Any,
+    runs: List[Tuple[str, str, str, Dict[str, Any]]]
+) -> None:
+    """
+    Escribe kpis y alertas (columnas de consulta) de (run_id, periodo, created_at, output),
+    reemplazando lo que hubiera de esos run_id. Usa la transacción del llamador.
+    """
+    kpis, alerts = [], []
+    for run_id, periodo, created_at, output in runs:
+        rango = _periodo_range(periodo)
+        k = output.get("kpis") or {}
+        kpis.append((run_id, periodo, created_at, *rango, *[k.get(c) for c in KPI_COLUMNS]))
+        for a in output.get("alerts") or []:
+            alerts.append((run_id, a.get("alert_id"), periodo, created_at, *rango, *[a.get(c) for c in ALERT_COLUMNS]))
+
+    ids = [(r[0],) for r in runs]
+    for table in ("run_kpis", "run_alerts"):
+        conn.executemany(f"DELETE FROM {table} WHERE run_id = ?", ids)
+    _insert_many(conn, "run_kpis", ["run_id", "periodo", "created_at"] + _RANGE_COLUMNS + KPI_COLUMNS, kpis)
+    _insert_many(conn, "run_alerts", ["run_id", "alert_id", "periodo", "created_at"] + _RANGE_COLUMNS + ALERT_COLUMNS, alerts)
+
+def _insert_many(conn: Any, table: str, columns: List[str], rows: List[tuple]) -> None:
+    if rows:
+        conn.executemany(
+            f"INSERT INTO {table}({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", rows
+        )
+
+# Output de cada corrida partido en secciones comprimidas (zlib), para leer solo lo que
+# se pide (p.ej. el dashboard solo usa kpis). "meta" lleva el resto de las claves
+# (periodo...) y siempre se incluye; run_id sale de la tabla runs, así dos corridas con
+# el mismo resultado comparten todas sus secciones en payloads. runs.output_json queda
+# vacío; corridas antiguas sin secciones se leen de ahí.
+SECTIONS = {
+    "report": ("executive_report_md", "report_status"),
+    "kpis": ("kpis",),
+    "alerts": ("alerts",),
+}
+_ZLIB_LEVEL = 6
+# Orden de claves del output de run_all, para reconstruirlo igual
+_OUTPUT_ORDER = ("run_id", "periodo", "executive_report_md", "report_status", "kpis", "alerts")
+
+def _split_output(output: Dict[str, Any]) -> List[Tuple[str, str, bytes]]:
+    # [(sección, hash del JSON, JSON comprimido)]
+    asignadas = {k for keys in SECTIONS.values() for k in keys}
+    parts = {name: {k: output[k] for k in keys if k in output} for name, keys in SECTIONS.items()}
+    parts["meta"] = {k: v for k, v in output.items() if k not in asignadas and k != "run_id"}
+    out = []
+    for name, part in parts.items():
+        raw = json.dumps(part, ensure_ascii=False).encode("utf-8")
+        out.append((name, hashlib.blake2b(raw, digest_size=16).hexdigest(), zlib.compress(raw, _ZLIB_LEVEL)))
+    return out
+
+def _write_payloads(conn: Any, rows: List[Tuple[str, List[Tuple[str, str, bytes]]]]) -> None:
+    # Reemplaza las secciones de cada run_id; el contenido ya guardado no se reescribe
+    conn.executemany(
+        "INSERT OR IGNORE INTO payloads(hash, data) VALUES (?, ?)",
+        [(h, data) for _, parts in rows for _, h, data in parts]
+    )
+    conn.executemany("DELETE FROM run_sections WHERE run_id = ?", [(run_id,) for run_id, _ in rows])
+    conn.executemany(
+        "INSERT INTO run_sections(run_id, section, hash) VALUES (?, ?, ?)",
+        [(run_id, name, h) for run_id, parts in rows for name, h, _ in parts]
+    )
+
+def _load_output(conn: Any, run_id: str, sections: Optional[Iterable[str]] = None) -> Optional[Dict[str, Any]]:
+    # Output de la corrida con "meta" + `sections` (None = todas); None si no existe.
+    # Una corrida compactada por la retención solo tiene meta y kpis, y lo indica.
+    names = ["meta"] + (list(SECTIONS) if sections is None else [s for s in sections if s != "meta"])
+    rows = conn.execute(
+        "SELECT p.data, r.compacted FROM runs r "
+        "JOIN run_sections s ON s.run_id = r.run_id JOIN payloads p ON p.hash = s.hash "
+        f"WHERE r.run_id = ? AND s.section IN ({', '.join('?' * len(names))})",
+        [run_id] + names
+    ).fetchall()
+    if rows:
+        merged: Dict[str, Any] = {"run_id": run_id}
+        for r in rows:
+            merged.update(json.loads(zlib.decompress(r["data"])))
+        out = {k: merged.pop(k) for k in _OUTPUT_ORDER if k in merged}
+        out.update(merged)
+        if rows[0]["compacted"]:
+            out["compacted"] = True
+        return out
+    legacy = conn.execute("SELECT output_json FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+    if not legacy or not legacy["output_json"]:
         return None
-    return json.loads(row["output_json"])
-
-def list_runs(db_path: str, limit: int = 20) -> List[Dict[str, Any]]:
-    conn = get_conn(db_path)
-    cur = conn.cursor()
-    cur.execute("SELECT run_id, periodo, created_at FROM runs ORDER BY created_at DESC LIMIT ?", (limit,))
-    rows = cur.fetchall()
-    conn.close()
+    out = json.loads(legacy["output_json"])
+    if sections is None:
+        return out
+    keep = {k for s in sections for k in SECTIONS.get(s, ())}
+    asignadas = {k for keys in SECTIONS.values() for k in keys}
+    return {k: v for k, v in out.items() if k in keep or k not in asignadas}
+
+@_timed_write
+def save_run(
+    db_path: str,
+    run_id: str,
+    periodo: str,
+    output: Dict[str, Any],
+    cache_key: Optional[str] = None
+) -> None:
+    # Serializar y comprimir fuera de la transacción: el escritor es uno solo
+    parts = _split_output(output)
+    created_at = datetime.utcnow().isoformat() + "Z"
+    with _write(db_path) as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO runs(run_id, periodo, created_at, output_json, cache_key) VALUES (?, ?, ?, '', ?)",
+            (run_id, periodo, created_at, cache_key)
+        )
+        _write_payloads(conn, [(run_id, parts)])
+        _insert_normalized(conn, [(run_id, periodo, created_at, output)])
+
+@_timed_write
+def update_run_output(db_path: str, run_id: str, output: Dict[str, Any]) -> None:
+    # Reemplaza el output de una corrida ya guardada (p.ej. reporte LLM en segundo plano)
+    # Las corridas ya compactadas por la retención no se reponen
+    parts = _split_output(output)
+    with _write(db_path) as conn:
+        cur = conn.execute("UPDATE runs SET output_json = '' WHERE run_id = ? AND compacted = 0", (run_id,))
+        if cur.rowcount:
+            _write_payloads(conn, [(run_id, parts)])
+
+@_timed_write
+def save_runs(
+    db_path: str,
+    runs: List[Tuple[str, str, Dict[str, Any], Optional[str]]]
+) -> None:
+    # Varias corridas (run_id, periodo, output, cache_key) en una sola transacción.
+    # created_at avanza 1µs por fila para conservar el orden del lote.
+    now = datetime.utcnow()
+    rows = [
+        (run_id, periodo, (now + timedelta(microseconds=i)).isoformat() + "Z", key)
+        for i, (run_id, periodo, output, key) in enumerate(runs)
+    ]
+    payloads = [(run_id, _split_output(output)) for run_id, _, output, _ in runs]
+    with _write(db_path) as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO runs(run_id, periodo, created_at, output_json, cache_key) VALUES (?, ?, ?, '', ?)",
+            rows
+        )
+        _write_payloads(conn, payloads)
+        _insert_normalized(conn, [(r[0], r[1], r[2], run[2]) for r, run in zip(rows, runs)])
+
+def get_latest_run(
+    db_path: str,
+    periodo: Optional[str] = None,
+    sections: Optional[Iterable[str]] = None
+) -> Optional[Dict[str, Any]]:
+    sql = "SELECT run_id FROM runs"
+    params: List[Any] = []
+    if periodo:
+        sql += " WHERE periodo = ?"
+        params.append(periodo)
+    sql += " ORDER BY created_at DESC, run_id DESC LIMIT 1"
+    with _read(db_path) as conn:
+        row = conn.execute(sql, params).fetchone()
+        return _load_output(conn, row["run_id"], sections) if row else None
+
+def list_runs(
+    db_path: str,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    periodo: Optional[str] = None,
+    desde: Optional[str] = None,
+    hasta: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    Corridas más recientes primero, por índice (sin OFFSET). `cursor`: el de la última fila
+    de la página anterior (ver run_cursor). `desde`/`hasta`: fechas ISO sobre created_at
+    (una fecha sin hora en `hasta` incluye todo ese día).
+    """
+    where: List[str] = []
+    params: List[Any] = []
+    if periodo:
+        where.append("periodo = ?")
+        params.append(periodo)
+    if desde:
+        where.append("created_at >= ?")
+        params.append(_iso_bound(desde, fin=False))
+    if hasta:
+        where.append("created_at < ?")
+        params.append(_iso_bound(hasta, fin=True))
+    if cursor:
+        where.append("(created_at, run_id) < (?, ?)")
+        params.extend(_decode_cursor(cursor))
+    sql = "SELECT run_id, periodo, created_at FROM runs"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY created_at DESC, run_id DESC LIMIT ?"
+    params.append(limit)
+    with _read(db_path) as conn:
+        rows = conn.execute(sql, params).fetchall()
     return [dict(r) for r in rows]
 
-def get_run(db_path: str, run_id: str) -> Optional[Dict[str, Any]]:
-    conn = get_conn(db_path)
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM runs WHERE run_id = ?", (run_id,))
-    row = cur.fetchone()
-    conn.close()
+def run_cursor(row: Dict[str, Any]) -> str:
+    # Cursor opaco de paginación: posición (created_at, run_id) de una fila de list_runs
+    raw = json.dumps([row["created_at"], row["run_id"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, run_id = json.loads(raw)
+        return str(created_at), str(run_id)
+    except (ValueError, TypeError):
+        raise ValueError("Cursor inválido")
+
+def _iso_bound(value: str, fin: bool) -> str:
+    # Fecha/hora ISO -> texto comparable con created_at ("...Z"); `fin` con fecha sola = día siguiente
+    try:
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError(f"Fecha inválida: {value}")
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    if fin and len(value) == 10:
+        dt += timedelta(days=1)
+    return dt.isoformat() + "Z"
+
+def get_run(db_path: str, run_id: str, sections: Optional[Iterable[str]] = None) -> Optional[Dict[str, Any]]:
+    # `sections`: subconjunto de SECTIONS a descomprimir (None = output completo)
+    with _read(db_path) as conn:
+        return _load_output(conn, run_id, sections)
+
+
+def get_run_by_cache_key(db_path: str, cache_key: str) -> Optional[Dict[str, Any]]:
+    with _read(db_path) as conn:
+        row = conn.execute(
+            "SELECT run_id FROM runs WHERE cache_key = ? ORDER BY created_at DESC LIMIT 1",
+            (cache_key,)
+        ).fetchone()
+        return _load_output(conn, row["run_id"]) if row else None
+
+@_timed_write
+def create_job(db_path: str, job_id: str, request: Dict[str, Any]) -> None:
+    with _write(db_path) as conn:
+        conn.execute(
+            "INSERT INTO jobs(job_id, status, request_json, created_at) VALUES (?, 'queued', ?, ?)",
+            (job_id, json.dumps(request, ensure_ascii=False), datetime.utcnow().isoformat() + "Z")
+        )
+
+@_timed_write
+def update_job(
+    db_path: str,
+    job_id: str,
+    status: str,
+    run_id: Optional[str] = None,
+    error: Optional[str] = None
+) -> None:
+    now = datetime.utcnow().isoformat() + "Z"
+    with _write(db_path) as conn:
+        if status == "running":
+            conn.execute("UPDATE jobs SET status = ?, started_at = ? WHERE job_id = ?", (status, now, job_id))
+        else:
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, run_id = ?, error = ? WHERE job_id = ?",
+                (status, now, run_id, error, job_id)
+            )
+
+def get_job(db_path: str, job_id: str) -> Optional[Dict[str, Any]]:
+    with _read(db_path) as conn:
+        row = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
     if not row:
         return None
-    return json.loads(row["output_json"])
+    job = dict(row)
+    job["request"] = json.loads(job.pop("request_json"))
+    return job
+
+def count_jobs(db_path: str, status: str) -> int:
+    with _read(db_path) as conn:
+        return int(conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (status,)).fetchone()[0])
+
+@_timed_write
+def requeue_jobs(db_path: str) -> List[str]:
+    # Al arrancar: los jobs que quedaron 'running' vuelven a la cola; retorna los pendientes en orden
+    with _write(db_path) as conn:
+        conn.execute("UPDATE jobs SET status = 'queued', started_at = NULL WHERE status = 'running'")
+        rows = conn.execute("SELECT job_id FROM jobs WHERE status = 'queued' ORDER BY created_at").fetchall()
+    return [r["job_id"] for r in rows]
+
+@_timed_write
+def save_run_diagnostics(db_path: str, run_id: str, stages: List[Dict[str, Any]]) -> None:
+    created_at = datetime.utcnow().isoformat() + "Z"
+    with _write(db_path) as conn:
+        conn.executemany(
+            "INSERT INTO run_diagnostics(run_id, stage, created_at, wall_ms, cpu_ms, peak_mem_kb, rows) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (run_id, st["stage"], created_at, st.get("wall_ms"), st.get("cpu_ms"), st.get("peak_mem_kb"), st.get("rows"))
+                for st in stages
+            ]
+        )
+
+def get_run_diagnostics(db_path: str, run_id: str) -> List[Dict[str, Any]]:
+    with _read(db_path) as conn:
+        rows = conn.execute(
+            "SELECT stage, wall_ms, cpu_ms, peak_mem_kb, rows FROM run_diagnostics WHERE run_id = ? ORDER BY rowid",
+            (run_id,)
+        ).fetchall()
+    return [dict(r) for r in rows]
+
+def list_stage_diagnostics(db_path: str, stage: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+    # Costo por etapa a lo largo de las corridas (más recientes primero)
+    sql = "SELECT d.run_id, r.periodo, d.stage, d.created_at, d.wall_ms, d.cpu_ms, d.peak_mem_kb, d.rows " \
+          "FROM run_diagnostics d LEFT JOIN runs r ON r.run_id = d.run_id"
+    params: List[Any] = []
+    if stage:
+        sql += " WHERE d.stage = ?"
+        params.append(stage)
+    sql += " ORDER BY d.created_at DESC, d.rowid DESC LIMIT ?"
+    params.append(limit)
+    with _read(db_path) as conn:
+        rows = conn.execute(sql, params).fetchall()
+    return [dict(r) for r in rows]
+
+def _periodo_filter(
+    alias: str,
+    desde: Optional[str],
+    hasta: Optional[str],
+    ultima: bool,
+    ventanas: bool = False
+) -> Tuple[List[str], List[Any]]:
+    # Corridas cuyos meses caen dentro de [desde, hasta] (por periodo_inicio/periodo_fin,
+    # "YYYY-MM"); solo mensuales salvo `ventanas`. Con `ultima`, solo la corrida más
+    # reciente de cada periodo
+    where: List[str] = [] if ventanas else [f"{alias}.ventana = 0"]
+    params: List[Any] = []
+    if desde:
+        where.append(f"{alias}.periodo_inicio >= ?")
+        params.append(resolve_periodo(desde)[0])
+    if hasta:
+        where.append(f"{alias}.periodo_fin <= ?")
+        params.append(resolve_periodo(hasta)[-1])
+    if ultima:
+        where.append(
+            f"{alias}.run_id IN (SELECT k.run_id FROM run_kpis k "
+            f"WHERE k.created_at = (SELECT MAX(created_at) FROM run_kpis WHERE periodo = k.periodo))"
+        )
+    return where, params
+
+def query_alerts(
+    db_path: str,
+    tipo: Optional[str] = None,
+    severidad: Optional[str] = None,
+    producto_id: Optional[str] = None,
+    desde: Optional[str] = None,
+    hasta: Optional[str] = None,
+    ultima: bool = True,
+    limit: int = 500,
+    ventanas: bool = False
+) -> List[Dict[str, Any]]:
+    """
+    Alertas de varias corridas (quién, tipo, severidad), más recientes primero. El detalle
+    (mensaje, recomendación, evidencia) está en GET /runs/{run_id}?sections=alerts.
+    """
+    where, params = _periodo_filter("a", desde, hasta, ultima, ventanas)
+    for col, value in (("tipo", tipo), ("severidad", severidad), ("producto_id", producto_id)):
+        if value:
+            where.append(f"a.{col} = ?")
+            params.append(value)
+    sql = "SELECT a.periodo, a.run_id, a.alert_id, a.producto_id, a.nombre_producto, a.tipo, a.severidad " \
+          "FROM run_alerts a"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY a.periodo_fin DESC, a.periodo_inicio DESC, a.created_at DESC, a.alert_id LIMIT ?"
+    params.append(limit)
+    with _read(db_path) as conn:
+        rows = conn.execute(sql, params).fetchall()
+    return [dict(r) for r in rows]
+
+def alert_counts(
+    db_path: str,
+    desde: Optional[str] = None,
+    hasta: Optional[str] = None,
+    ultima: bool = True,
+    ventanas: bool = False
+) -> List[Dict[str, Any]]:
+    # Alertas y productos distintos por periodo, tipo y severidad
+    where, params = _periodo_filter("a", desde, hasta, ultima, ventanas)
+    sql = "SELECT a.periodo, a.tipo, a.severidad, COUNT(*) AS alertas, " \
+          "COUNT(DISTINCT a.producto_id) AS productos FROM run_alerts a"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " GROUP BY a.periodo, a.tipo, a.severidad " \
+           "ORDER BY MAX(a.periodo_fin) DESC, MAX(a.periodo_inicio) DESC, a.periodo, a.tipo, a.severidad"
+    with _read(db_path) as conn:
+        rows = conn.execute(sql, params).fetchall()
+    return [dict(r) for r in rows]
+
+def kpi_series(
+    db_path: str,
+    desde: Optional[str] = None,
+    hasta: Optional[str] = None,
+    ultima: bool = True,
+    ventanas: bool = False
+) -> List[Dict[str, Any]]:
+    # KPIs por corrida (con `ultima`, uno por periodo), ordenados por periodo
+    where, params = _periodo_filter("k0", desde, hasta, ultima, ventanas)
+    sql = f"SELECT k0.periodo, k0.run_id, k0.created_at, {', '.join('k0.' + c for c in KPI_COLUMNS)} FROM run_kpis k0"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY k0.periodo_fin, k0.periodo_inicio DESC, k0.periodo, k0.created_at"
+    with _read(db_path) as conn:
+        rows = conn.execute(sql, params).fetchall()
+    return [dict(r) for r in rows]
+
+# Tablas con filas por corrida; la retención las poda junto con runs
+_RUN_DETAIL_TABLES = ("run_alerts", "run_diagnostics")
+_RETENTION_BATCH = 500
+
+@_timed_write
+def apply_retention(
+    db_path: str,
+    full_runs: int = 5,
+    max_runs: int = 0,
+    jobs_days: float = 30
+) -> Dict[str, int]:
+    """
+    Retención por periodo: las `full_runs` corridas más recientes quedan completas; las
+    anteriores se compactan a meta + kpis (run_kpis se conserva, el resto del detalle se
+    borra) y, con `max_runs` > 0, las que exceden ese total se eliminan. También borra
+    los jobs terminados hace más de `jobs_days` días y los payloads que ninguna corrida
+    referencia. Trabaja en lotes para no retener el escritor mucho tiempo.
+    """
+    full_runs = max(1, full_runs)
+    with _read(db_path) as conn:
+        rows = conn.execute(
+            "SELECT run_id, compacted, ROW_NUMBER() OVER "
+            "(PARTITION BY periodo ORDER BY created_at DESC, run_id DESC) AS n FROM runs"
+        ).fetchall()
+    tope = max(max_runs, full_runs) if max_runs > 0 else None
+    borrar = [r["run_id"] for r in rows if tope is not None and r["n"] > tope]
+    compactar = [
+        r["run_id"] for r in rows
+        if r["n"] > full_runs and not r["compacted"] and (tope is None or r["n"] <= tope)
+    ]
+
+    for i in range(0, len(compactar), _RETENTION_BATCH):
+        ids = [(run_id,) for run_id in compactar[i:i + _RETENTION_BATCH]]
+        with _write(db_path) as conn:
+            conn.executemany("DELETE FROM run_sections WHERE run_id = ? AND section NOT IN ('meta', 'kpis')", ids)
+            for table in _RUN_DETAIL_TABLES:
+                conn.executemany(f"DELETE FROM {table} WHERE run_id = ?", ids)
+            # Sin alertas ya no sirve como resultado cacheado de run_all
+            conn.executemany("UPDATE runs SET compacted = 1, cache_key = NULL WHERE run_id = ?", ids)
+    for i in range(0, len(borrar), _RETENTION_BATCH):
+        ids = [(run_id,) for run_id in borrar[i:i + _RETENTION_BATCH]]
+        with _write(db_path) as conn:
+            for table in ("runs", "run_sections", "run_kpis") + _RUN_DETAIL_TABLES:
+                conn.executemany(f"DELETE FROM {table} WHERE run_id = ?", ids)
+
+    limite = (datetime.utcnow() - timedelta(days=jobs_days)).isoformat() + "Z"
+    with _write(db_path) as conn:
+        jobs = conn.execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (limite,)
+        ).rowcount
+        payloads = conn.execute(
+            "DELETE FROM payloads WHERE NOT EXISTS (SELECT 1 FROM run_sections s WHERE s.hash = payloads.hash)"
+        ).rowcount
+    return {"compactadas": len(compactar), "eliminadas": len(borrar), "jobs_eliminados": jobs, "payloads_eliminados": payloads}
 
+@_timed_write
+def vacuum_db(db_path: str, full_ratio: float = 0.25) -> Dict[str, Any]:
+    """
+    Devuelve al sistema las páginas libres: incremental_vacuum si la base tiene
+    auto_vacuum=INCREMENTAL; VACUUM completo (que además la pasa a ese modo) si no lo
+    tiene o si las páginas libres superan `full_ratio` del total. Después trunca el WAL.
+    """
+    with _write(db_path) as conn:
+        # Sin DML previo no hay transacción abierta: VACUUM y los PRAGMA corren sueltos
+        paginas = conn.execute("PRAGMA page_count").fetchone()[0]
+        libres = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        incremental = conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+        completo = not incremental or (paginas and libres / paginas > full_ratio)
+        if completo:
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("VACUUM")
+        else:
+            conn.execute("PRAGMA incremental_vacuum").fetchall()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+        despues = conn.execute("PRAGMA page_count").fetchone()[0]
+    return {"modo": "full" if completo else "incremental", "paginas_antes": paginas, "paginas_despues": despues}
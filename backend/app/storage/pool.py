@@ -0,0 +1,123 @@
+"""
+Conexiones SQLite persistentes: un escritor + N lectores por archivo de base.
+
+La base se abre en modo WAL con synchronous=NORMAL: los lectores leen el último commit
+sin bloquearse detrás de una escritura en curso, y solo hay un escritor a la vez (el
+de este pool, serializado con un lock). Cada conexión vive lo que el proceso, así que
+su caché de sentencias preparadas (`cached_statements`) se reutiliza entre llamadas.
+
+    with get_pool(db_path).writer() as conn:   # transacción: commit o rollback al salir
+        conn.execute("INSERT ...")
+    with get_pool(db_path).reader() as conn:
+        conn.execute("SELECT ...").fetchall()
+"""
+
+from typing import Dict, Iterator, List
+from contextlib import contextmanager
+import os
+import queue
+import sqlite3
+import threading
+
+_CACHED_STATEMENTS = 256
+_BUSY_TIMEOUT_MS = 5000
+
+def _connect(db_path: str, readonly: bool = False) -> sqlite3.Connection:
+    conn = sqlite3.connect(
+        db_path,
+        check_same_thread=False,
+        cached_statements=_CACHED_STATEMENTS,
+        timeout=_BUSY_TIMEOUT_MS / 1000.0,
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={_BUSY_TIMEOUT_MS}")
+    if readonly:
+        conn.execute("PRAGMA query_only=ON")
+    return conn
+
+class ConnectionPool:
+    def __init__(self, db_path: str, readers: int = 4) -> None:
+        self.db_path = db_path
+        self.size = max(1, readers)
+        self._write_lock = threading.Lock()
+        self._writer = _connect(db_path)
+        # Antes de WAL, que ya crea el archivo: en una base nueva deja el espacio liberado
+        # recuperable con incremental_vacuum (las existentes cambian con VACUUM)
+        self._writer.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        # WAL es persistente en el archivo: basta con activarlo desde el escritor
+        self._writer.execute("PRAGMA journal_mode=WAL")
+        self._readers: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._all: List[sqlite3.Connection] = [self._writer]
+        self._created = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    @contextmanager
+    def writer(self) -> Iterator[sqlite3.Connection]:
+        with self._write_lock:
+            if self._closed:
+                raise RuntimeError("Pool SQLite cerrado")
+            with self._writer:
+                yield self._writer
+
+    @contextmanager
+    def reader(self) -> Iterator[sqlite3.Connection]:
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            if self._closed:
+                conn.close()
+            else:
+                self._readers.put(conn)
+
+    def _acquire(self) -> sqlite3.Connection:
+        if self._closed:
+            raise RuntimeError("Pool SQLite cerrado")
+        try:
+            return self._readers.get_nowait()
+        except queue.Empty:
+            pass
+        # Los lectores se abren a demanda hasta `size`; después se espera uno libre
+        with self._lock:
+            crear = self._created < self.size
+            if crear:
+                self._created += 1
+        if crear:
+            conn = _connect(self.db_path, readonly=True)
+            with self._lock:
+                self._all.append(conn)
+            return conn
+        return self._readers.get()
+
+    def stats(self) -> Dict[str, int]:
+        return {"readers": self._created, "readers_idle": self._readers.qsize(), "readers_max": self.size}
+
+    def close(self) -> None:
+        with self._write_lock:
+            self._closed = True
+            with self._lock:
+                conns, self._all = self._all, []
+            for conn in conns:
+                # Un lector en uso se cierra al devolverlo
+                if conn is self._writer or conn in self._readers.queue:
+                    conn.close()
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+def get_pool(db_path: str, readers: int = 4) -> ConnectionPool:
+    key = os.path.abspath(db_path)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(db_path, readers=readers)
+        return pool
+
+def close_pools() -> None:
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
@@ -0,0 +1,34 @@
+"""
+Benchmark de derive_margins (vectorizado) contra la versión anterior por fila.
+
+    cd backend && python benchmarks/bench_metrics.py [productos]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests"))
+
+from app.compute.metrics import derive_margins
+from test_metrics import catalogo, derive_margins_por_fila
+
+def _mejor(fn, m, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        frame = m.copy()
+        t0 = time.perf_counter()
+        fn(frame)
+        tiempos.append(time.perf_counter() - t0)
+    return min(tiempos)
+
+def main(n: int) -> None:
+    m = catalogo(n)
+    por_fila = _mejor(derive_margins_por_fila, m, 1)
+    vectorizado = _mejor(derive_margins, m, 5)
+    print(f"{n} productos: por fila {por_fila * 1000:.1f} ms, vectorizado {vectorizado * 1000:.2f} ms "
+          f"({por_fila / vectorizado:.0f}x)")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
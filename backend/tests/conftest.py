@@ -0,0 +1,52 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+@pytest.fixture(autouse=True)
+def _caches_limpias():
+    # run_cache / cost_states son globales del módulo: cada test parte sin corridas en memoria
+    from app.jobs.pipeline import run_cache, cost_states
+    run_cache.clear()
+    cost_states.clear()
+    yield
+
+@pytest.fixture
+def data_dir(tmp_path):
+    # Copia de los datos demo (sin la base), para poder modificar los CSV
+    dst = tmp_path / "data"
+    shutil.copytree(
+        os.path.join(BACKEND, "app", "data"), dst,
+        ignore=shutil.ignore_patterns("*.sqlite*", ".cache")
+    )
+    return str(dst)
+
+@pytest.fixture
+def db_path(tmp_path):
+    from app.storage.db import init_db
+    path = str(tmp_path / "sabia.sqlite")
+    init_db(path)
+    return path
+
+@pytest.fixture
+def client(data_dir, db_path):
+    # API sobre los datos de data_dir (Settings es frozen: se parchea y se restaura)
+    from fastapi.testclient import TestClient
+    from app.core.config import settings
+    from app.main import app
+    from app.api.routes import job_queue
+    previos = {k: getattr(settings, k) for k in ("DATA_DIR", "DB_PATH", "RETENTION_ENABLED")}
+    for k, v in {"DATA_DIR": data_dir, "DB_PATH": db_path, "RETENTION_ENABLED": False}.items():
+        object.__setattr__(settings, k, v)
+    db_previo, job_queue.db_path = job_queue.db_path, db_path
+    try:
+        with TestClient(app) as c:
+            yield c
+    finally:
+        job_queue.db_path = db_previo
+        for k, v in previos.items():
+            object.__setattr__(settings, k, v)
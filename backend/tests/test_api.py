@@ -0,0 +1,39 @@
+import os
+
+import pandas as pd
+
+def _receta_ciclica(data_dir):
+    # P01 -> P02 -> P01
+    path = os.path.join(data_dir, "recetas.csv")
+    recetas = pd.read_csv(path)
+    extra = pd.DataFrame([
+        {"producto_id": "P01", "insumo_id": "P02", "cantidad": 1},
+        {"producto_id": "P02", "insumo_id": "P01", "cantidad": 1},
+    ])
+    pd.concat([recetas, extra]).to_csv(path, index=False)
+
+def test_run_con_ciclo_en_recetas_es_400(client, data_dir):
+    _receta_ciclica(data_dir)
+    r = client.post("/run", json={"periodo": "2024-01"})
+    assert r.status_code == 400
+    assert "Ciclo en recetas" in r.json()["detail"]
+
+def test_scenarios_con_ciclo_en_recetas_es_400(client, data_dir):
+    _receta_ciclica(data_dir)
+    r = client.post("/scenarios", json={"periodo": "2024-01", "escenarios": [{"nombre": "x", "precio_pct": 0.1}]})
+    assert r.status_code == 400
+    assert "Ciclo en recetas" in r.json()["detail"]
+
+def test_batch_con_rango_excesivo_es_400(client):
+    from app.core.config import settings
+    r = client.post("/run/batch", json={"inicio": "2000-01", "fin": "2024-01"})
+    assert r.status_code == 400
+    assert str(settings.BATCH_MAX_PERIODOS) in r.json()["detail"]
+
+def test_batch_guarda_diagnosticos_por_corrida(client):
+    r = client.post("/run/batch", json={"inicio": "2024-01", "fin": "2024-02"})
+    assert r.status_code == 200
+    for run in r.json()["runs"]:
+        stages = [s["stage"] for s in client.get(f"/runs/{run['run_id']}/diagnostics").json()["stages"]]
+        assert "batch_compute_costs" in stages and "batch_save_runs" in stages
+        assert stages[-2:] == ["attach_evidence", "kpis"]
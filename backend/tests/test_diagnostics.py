@@ -0,0 +1,31 @@
+import threading
+import time
+
+from app.core.diagnostics import Diagnostics
+
+def test_pico_de_memoria_no_lo_pisa_otra_corrida():
+    # B hace reset_peak mientras A sigue en su etapa: el pico de A no debe perderse
+    liberado = threading.Event()
+    picos = {}
+
+    def corrida_a():
+        with Diagnostics(memory=True) as diag:
+            with diag.stage("a"):
+                bloque = bytearray(20 * 1024 * 1024)
+                del bloque
+                liberado.set()
+                time.sleep(0.2)
+            picos["a"] = diag.stages[0]["peak_mem_kb"]
+
+    def corrida_b():
+        liberado.wait(5)
+        with Diagnostics(memory=True) as diag:
+            with diag.stage("b"):
+                pass
+
+    hilos = [threading.Thread(target=corrida_a), threading.Thread(target=corrida_b)]
+    for t in hilos:
+        t.start()
+    for t in hilos:
+        t.join(10)
+    assert picos["a"] >= 19 * 1024
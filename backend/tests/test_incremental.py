@@ -0,0 +1,53 @@
+import json
+import os
+import time
+
+import pandas as pd
+
+from app.jobs.pipeline import run_all
+
+PARAMS = dict(valor_minuto=1.0, margen_critico_pct=0.10, margen_objetivo_pct=0.30, esfuerzo_alto_min=90, top_drivers=3)
+
+def _sin_run_id(output):
+    return json.dumps({k: v for k, v in output.items() if k != "run_id"}, sort_keys=True, default=str)
+
+def _escalar_insumo(data_dir, insumo_id, factor):
+    path = os.path.join(data_dir, "insumos.csv")
+    ins = pd.read_csv(path)
+    ins.loc[ins["insumo_id"] == insumo_id, "costo_unitario"] *= factor
+    ins.to_csv(path, index=False)
+    time.sleep(0.01)  # mtime distinto: huella nueva del archivo
+
+def test_cambios_sucesivos_de_insumos(data_dir, db_path):
+    # I06 y I07 los usa un solo producto cada uno, con la misma cantidad de filas de receta:
+    # los subconjuntos de update_costs no deben compartir matriz cacheada
+    run_all(data_dir=data_dir, db_path=db_path, periodo="2024-01", **PARAMS)
+    for insumo_id in ("I06", "I07", "I01"):
+        _escalar_insumo(data_dir, insumo_id, 50)
+        inc = run_all(data_dir=data_dir, db_path=db_path, periodo="2024-01", diagnostics=True, **PARAMS)
+        etapas = [d["stage"] for d in inc.pop("diagnostics")]
+        full = run_all(data_dir=data_dir, db_path=db_path, periodo="2024-01", force=True, **PARAMS)
+        assert "incremental_costs" in etapas
+        assert _sin_run_id(inc) == _sin_run_id(full), insumo_id
+
+def test_cambios_sucesivos_con_subproductos(data_dir, db_path):
+    # P02 usa P01 como subproducto: un cambio en I07 recalcula P02 con la receta de P01
+    path = os.path.join(data_dir, "recetas.csv")
+    recetas = pd.read_csv(path)
+    pd.concat([recetas, pd.DataFrame([{"producto_id": "P02", "insumo_id": "P01", "cantidad": 0.25}])]).to_csv(path, index=False)
+    run_all(data_dir=data_dir, db_path=db_path, periodo="2024-01", **PARAMS)
+    for insumo_id in ("I06", "I07"):
+        _escalar_insumo(data_dir, insumo_id, 50)
+        inc = run_all(data_dir=data_dir, db_path=db_path, periodo="2024-01", **PARAMS)
+        full = run_all(data_dir=data_dir, db_path=db_path, periodo="2024-01", force=True, **PARAMS)
+        assert _sin_run_id(inc) == _sin_run_id(full), insumo_id
+
+def test_mutar_el_output_no_altera_el_estado_incremental(data_dir, db_path):
+    # CostState.evidence no comparte los dicts `evidencia` con el output entregado
+    out = run_all(data_dir=data_dir, db_path=db_path, periodo="2024-01", **PARAMS)
+    for a in out["alerts"]:
+        a["evidencia"].clear()
+    _escalar_insumo(data_dir, "I06", 50)
+    inc = run_all(data_dir=data_dir, db_path=db_path, periodo="2024-01", **PARAMS)
+    full = run_all(data_dir=data_dir, db_path=db_path, periodo="2024-01", force=True, **PARAMS)
+    assert _sin_run_id(inc) == _sin_run_id(full)
@@ -0,0 +1,36 @@
+import sqlite3
+import time
+
+from app.jobs import job_queue as jq
+from app.storage.db import get_job
+
+def _esperar(db_path, job_id, timeout=5.0):
+    fin = time.monotonic() + timeout
+    while time.monotonic() < fin:
+        job = get_job(db_path, job_id)
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"Job {job_id} sigue '{job['status']}'")
+
+def test_error_de_sqlite_al_marcar_running_no_mata_al_worker(db_path, monkeypatch):
+    update_job = jq.update_job
+    fallas = []
+
+    def update_con_falla(path, job_id, status, **kw):
+        if status == "running" and not fallas:
+            fallas.append(job_id)
+            raise sqlite3.OperationalError("database is locked")
+        return update_job(path, job_id, status, **kw)
+
+    monkeypatch.setattr(jq, "update_job", update_con_falla)
+    q = jq.JobQueue(db_path, handler=lambda req: {"run_id": req["periodo"]}, workers=1)
+    q.start()
+    try:
+        primero = q.submit({"periodo": "2024-01"})
+        segundo = q.submit({"periodo": "2024-02"})
+        job = _esperar(db_path, primero)
+        assert job["status"] == "failed" and "database is locked" in job["error"]
+        assert _esperar(db_path, segundo)["status"] == "done"
+    finally:
+        q.stop(timeout=5)
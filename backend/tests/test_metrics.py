@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pandas.testing as pdt
+
+from app.compute.metrics import derive_margins
+
+def derive_margins_por_fila(m: pd.DataFrame) -> pd.DataFrame:
+    # Versión anterior (DataFrame.apply por fila), como referencia de semántica
+    m["margen_pct"] = m.apply(lambda r: (r["margen_abs_unit"] / r["precio"]) if r["precio"] else 0.0, axis=1)
+    m["contribucion_total"] = m["margen_abs_unit"] * m["unidades_periodo"]
+    m["perdida_total"] = m.apply(lambda r: (-r["margen_abs_unit"] * r["unidades_periodo"]) if r["margen_abs_unit"] < 0 else 0.0, axis=1)
+
+    def eff(r):
+        if r["margen_abs_unit"] <= 0:
+            return None
+        return float(r["tiempo_total_min"]) / float(r["margen_abs_unit"]) if r["margen_abs_unit"] else None
+
+    m["eficiencia_min_por_margen"] = m.apply(eff, axis=1).astype(float)
+    return m
+
+def catalogo(n: int, seed: int = 0) -> pd.DataFrame:
+    # Precios y costos aleatorios con precio 0, NaN, margen 0 y margen negativo
+    rng = np.random.default_rng(seed)
+    precio = rng.uniform(500, 20000, n).round(0)
+    costo = precio * rng.uniform(0.3, 1.4, n)
+    precio[rng.random(n) < 0.05] = 0.0
+    precio[rng.random(n) < 0.03] = np.nan
+    costo[rng.random(n) < 0.03] = np.nan
+    margen = precio - costo
+    margen[rng.random(n) < 0.05] = 0.0
+    tiempo = rng.uniform(0, 240, n)
+    tiempo[rng.random(n) < 0.02] = np.nan
+    return pd.DataFrame({
+        "producto_id": [f"P{i:06d}" for i in range(n)],
+        "precio": precio,
+        "costo_total_unit": costo,
+        "margen_abs_unit": margen,
+        "unidades_periodo": rng.integers(0, 500, n).astype(float),
+        "tiempo_total_min": tiempo,
+    })
+
+def test_derive_margins_equivale_a_version_por_fila():
+    m = catalogo(5000)
+    pdt.assert_frame_equal(derive_margins(m.copy()), derive_margins_por_fila(m.copy()))
+
+def test_derive_margins_casos_borde():
+    m = pd.DataFrame({
+        "precio": [0.0, np.nan, 1000.0, 1000.0, 1000.0],
+        "margen_abs_unit": [-50.0, 10.0, 0.0, -200.0, 250.0],
+        "unidades_periodo": [3.0, 1.0, 5.0, 4.0, 2.0],
+        "tiempo_total_min": [10.0, 10.0, 10.0, 10.0, 50.0],
+    })
+    out = derive_margins(m.copy())
+    pdt.assert_frame_equal(out, derive_margins_por_fila(m.copy()))
+    assert out["margen_pct"].iloc[0] == 0.0
+    assert np.isnan(out["margen_pct"].iloc[1])
+    assert out["perdida_total"].tolist() == [150.0, 0.0, 0.0, 800.0, 0.0]
+    # margen <= 0 -> sin eficiencia
+    assert out["eficiencia_min_por_margen"].iloc[[0, 2, 3]].isna().all()
+    assert out["eficiencia_min_por_margen"].iloc[[1, 4]].tolist() == [1.0, 0.2]
@@ -0,0 +1,36 @@
+from app.storage import db
+
+def _guardar(db_path, run_id, periodo, productos):
+    db.save_run(db_path, run_id, periodo, {
+        "run_id": run_id,
+        "periodo": periodo,
+        "kpis": {"total_productos": len(productos), "contribucion_total": 100.0},
+        "alerts": [
+            {"alert_id": f"A-{i:04d}", "producto_id": p, "tipo": "margen_negativo", "severidad": "alta"}
+            for i, p in enumerate(productos, start=1)
+        ],
+    })
+
+def test_rangos_de_meses_excluyen_ventanas(db_path):
+    _guardar(db_path, "m02", "2024-02", ["P01"])
+    _guardar(db_path, "m07", "2024-07", ["P02"])
+    _guardar(db_path, "q1", "2024-Q1", ["P03", "P04"])
+    _guardar(db_path, "ytd", "2024-12:YTD", ["P05"])
+
+    alertas = db.query_alerts(db_path, desde="2024-01", hasta="2024-12")
+    assert [a["run_id"] for a in alertas] == ["m07", "m02"]
+    resumen = db.alert_counts(db_path, desde="2024-01", hasta="2024-12")
+    assert [(r["periodo"], r["alertas"]) for r in resumen] == [("2024-07", 1), ("2024-02", 1)]
+    assert [k["periodo"] for k in db.kpi_series(db_path, desde="2024-01", hasta="2024-12")] == ["2024-02", "2024-07"]
+
+def test_ventanas_a_pedido_y_por_meses_cubiertos(db_path):
+    _guardar(db_path, "m02", "2024-02", ["P01"])
+    _guardar(db_path, "q1", "2024-Q1", ["P03", "P04"])
+    _guardar(db_path, "ytd", "2024-12:YTD", ["P05"])
+
+    # Solo las corridas cuyos meses caen dentro del rango
+    serie = db.kpi_series(db_path, desde="2024-01", hasta="2024-06", ventanas=True)
+    assert [k["periodo"] for k in serie] == ["2024-02", "2024-Q1"]
+    assert len(db.kpi_series(db_path, ventanas=True)) == 3
+    alertas = db.query_alerts(db_path, desde="2024-Q1", hasta="2024-Q1", ventanas=True)
+    assert [a["run_id"] for a in alertas] == ["q1", "q1", "m02"]
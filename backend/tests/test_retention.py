@@ -0,0 +1,63 @@
+from app.storage import db
+
+def _output(i: int, periodo: str, alertas: int) -> dict:
+    return {
+        "run_id": f"{periodo}-{i:02d}",
+        "periodo": periodo,
+        "executive_report_md": "reporte",
+        "report_status": "ready",
+        "kpis": {"total_productos": 15, "contribucion_total": 1000.0 + i},
+        "alerts": [
+            {"alert_id": f"A-{k:04d}", "producto_id": f"P{k:02d}", "tipo": "margen_negativo", "severidad": "alta"}
+            for k in range(alertas)
+        ],
+    }
+
+def _guardar(db_path, periodo, n):
+    for i in range(n):
+        out = _output(i, periodo, alertas=3)
+        db.save_run(db_path, out["run_id"], periodo, out, cache_key=f"k-{out['run_id']}")
+
+def test_retencion_compacta_y_conserva_resumenes(db_path):
+    _guardar(db_path, "2024-01", 8)
+    res = db.apply_retention(db_path, full_runs=3)
+    assert res["compactadas"] == 5 and res["eliminadas"] == 0
+
+    completa = db.get_run(db_path, "2024-01-07")
+    assert len(completa["alerts"]) == 3 and "compacted" not in completa
+    resumida = db.get_run(db_path, "2024-01-00")
+    assert resumida == {"run_id": "2024-01-00", "periodo": "2024-01",
+                        "kpis": {"total_productos": 15, "contribucion_total": 1000.0}, "compacted": True}
+    # Sin alertas ya no sirve como caché de run_all; el resumen de KPIs sigue consultable
+    assert db.get_run_by_cache_key(db_path, "k-2024-01-00") is None
+    assert len(db.kpi_series(db_path, ultima=False)) == 8
+    assert {a["run_id"] for a in db.query_alerts(db_path, ultima=False)} == {"2024-01-05", "2024-01-06", "2024-01-07"}
+    assert db.apply_retention(db_path, full_runs=3)["compactadas"] == 0
+
+def test_retencion_con_tope_elimina(db_path):
+    _guardar(db_path, "2024-02", 6)
+    res = db.apply_retention(db_path, full_runs=2, max_runs=4)
+    assert res["compactadas"] == 2 and res["eliminadas"] == 2
+    assert db.get_run(db_path, "2024-02-00") is None
+    assert [r["run_id"] for r in db.list_runs(db_path, 10)] == ["2024-02-05", "2024-02-04", "2024-02-03", "2024-02-02"]
+
+def test_outputs_identicos_comparten_payloads(db_path):
+    for i in range(5):
+        out = {**_output(0, "2024-03", alertas=50), "run_id": f"r{i}"}
+        db.save_run(db_path, f"r{i}", "2024-03", out)
+    with db._read(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM payloads").fetchone()[0] == 4
+    assert db.get_run(db_path, "r3")["run_id"] == "r3"
+
+def test_vacuum(db_path):
+    _guardar(db_path, "2024-04", 10)
+    db.apply_retention(db_path, full_runs=1, max_runs=1)
+    res = db.vacuum_db(db_path)
+    assert res["paginas_despues"] <= res["paginas_antes"]
+    assert db.vacuum_db(db_path)["modo"] == "incremental"
+
+def test_kpis_conteos_enteros(db_path):
+    _guardar(db_path, "2024-05", 1)
+    (fila,) = db.kpi_series(db_path)
+    assert fila["total_productos"] == 15 and isinstance(fila["total_productos"], int)
+    assert isinstance(fila["contribucion_total"], float)
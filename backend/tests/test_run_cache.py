@@ -0,0 +1,50 @@
+import time
+
+from app.jobs.pipeline import run_all
+from app.jobs.run_cache import RunCache
+
+PARAMS = dict(valor_minuto=1.0, margen_critico_pct=0.10, margen_objetivo_pct=0.30, esfuerzo_alto_min=90, top_drivers=3)
+
+def test_cache_entrega_copias():
+    cache = RunCache(4, 60)
+    output = {"kpis": {"total_productos": 15}, "alerts": [{"alert_id": "A-0001"}]}
+    cache.put("k", output)
+    output["alerts"].clear()
+    hit = cache.get("k")
+    hit["kpis"]["total_productos"] = 0
+    assert cache.get("k") == {"kpis": {"total_productos": 15}, "alerts": [{"alert_id": "A-0001"}]}
+
+class LLMIntermitente:
+    model_name = "fake"
+
+    def __init__(self):
+        self.llamadas = 0
+
+    def generate_executive_report(self, payload):
+        self.llamadas += 1
+        if self.llamadas == 1:
+            raise RuntimeError("timeout")
+        return "reporte LLM"
+
+def _esperar(fn, timeout=5.0):
+    fin = time.time() + timeout
+    while time.time() < fin:
+        out = fn()
+        if out:
+            return out
+        time.sleep(0.02)
+    raise AssertionError("timeout")
+
+def test_reporte_llm_fallido_se_reintenta(data_dir, db_path):
+    from app.storage.db import get_run
+    llm = LLMIntermitente()
+    kw = dict(data_dir=data_dir, db_path=db_path, periodo="2024-01", llm_provider=llm, **PARAMS)
+    primera = run_all(**kw)
+    _esperar(lambda: get_run(db_path, primera["run_id"])["report_status"] == "failed")
+
+    # Acierto de caché: el mismo run_id, con el reporte reintentado en segundo plano
+    segunda = run_all(**kw)
+    assert segunda["run_id"] == primera["run_id"] and segunda["report_status"] == "pending"
+    _esperar(lambda: get_run(db_path, primera["run_id"])["report_status"] == "ready")
+    tercera = _esperar(lambda: (lambda o: o if o["report_status"] == "ready" else None)(run_all(**kw)))
+    assert tercera["executive_report_md"] == "reporte LLM" and llm.llamadas == 2
@@ -0,0 +1,35 @@
+import threading
+
+from app.jobs.singleflight import SingleFlight
+
+def test_cada_llamador_recibe_su_copia():
+    sf = SingleFlight()
+    entrar, soltar = threading.Event(), threading.Event()
+
+    def calcular():
+        entrar.set()
+        soltar.wait(5)
+        return {"alerts": [{"evidencia": {"margen": 1.0}}]}
+
+    resultados = []
+    lider = threading.Thread(target=lambda: resultados.append(sf.do("k", calcular)))
+    lider.start()
+    entrar.wait(5)
+    esperas = [threading.Thread(target=lambda: resultados.append(sf.do("k", calcular))) for _ in range(3)]
+    for t in esperas:
+        t.start()
+    while sf.stats()["coalesced"] < 3:
+        pass
+    soltar.set()
+    for t in [lider, *esperas]:
+        t.join(5)
+
+    assert sf.stats()["executed"] == 1 and len(resultados) == 4
+    resultados[0]["alerts"][0]["evidencia"]["margen"] = -99.0
+    assert [r["alerts"][0]["evidencia"]["margen"] for r in resultados[1:]] == [1.0, 1.0, 1.0]
+    assert len({id(r["alerts"][0]["evidencia"]) for r in resultados}) == 4
+
+def test_sin_esperas_el_lider_recibe_el_original():
+    sf = SingleFlight()
+    valor = {"a": [1]}
+    assert sf.do("k", lambda: valor) is valor
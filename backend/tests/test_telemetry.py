@@ -0,0 +1,20 @@
+import logging
+
+import pytest
+
+from app.core.telemetry import Registry, _Metric
+
+def test_metric_base_es_abstracta():
+    with pytest.raises(TypeError):
+        _Metric("x", "x")
+
+def test_render_omite_y_registra_metricas_rotas(caplog):
+    reg = Registry()
+    reg.counter("ok_total", "ok").inc(2)
+    reg.callback("rota", "falla", lambda: 1 / 0)
+    reg.callback("cola", "profundidad", lambda: {("a",): 3}, labelnames=("q",))
+    with caplog.at_level(logging.ERROR, logger="app.core.telemetry"):
+        out = reg.render()
+    assert "ok_total 2" in out and 'cola{q="a"} 3' in out
+    assert "rota" not in out
+    assert any("rota" in r.getMessage() and r.exc_info for r in caplog.records)
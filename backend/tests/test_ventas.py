@@ -0,0 +1,52 @@
+import os
+
+import pandas as pd
+import pytest
+
+from app.ingest import sales_store
+from app.ingest.loaders import append_ventas, default_cache_dir
+
+def _snapshot(data_dir):
+    # Contenido del CSV y de todo el store de ventas (ruta -> bytes)
+    root = os.path.join(default_cache_dir(data_dir), "ventas")
+    files = {}
+    for base, _, names in os.walk(root):
+        for n in names:
+            if n != "_manifest.json":
+                with open(os.path.join(base, n), "rb") as f:
+                    files[os.path.relpath(os.path.join(base, n), root)] = f.read()
+    with open(os.path.join(data_dir, "ventas.csv"), "rb") as f:
+        return f.read(), files
+
+def test_lote_con_filas_invalidas_es_400_y_no_escribe(client, data_dir):
+    client.post("/ventas", json={"rows": [{"fecha": "2024-01-05", "producto_id": "P01", "cantidad_vendida": 1}]})
+    antes = _snapshot(data_dir)
+    r = client.post("/ventas", json={"rows": [
+        {"fecha": "2024-01-05", "producto_id": "P01", "cantidad_vendida": 2},
+        {"fecha": "2024-13-45", "producto_id": "P01", "cantidad_vendida": 2},
+        {"fecha": "2024-01-06", "producto_id": "P02", "cantidad_vendida": -3},
+    ]})
+    assert r.status_code == 400
+    detail = r.json()["detail"]
+    assert "fila 1: fecha inválida" in detail and "fila 2: cantidad_vendida inválida" in detail
+    assert "fila 0" not in detail
+    assert _snapshot(data_dir) == antes
+
+def test_append_fallido_revierte_store_y_csv(data_dir, monkeypatch):
+    rows = pd.DataFrame([{"fecha": "2024-01-05", "producto_id": "P01", "cantidad_vendida": 1}])
+    append_ventas(data_dir, rows)
+    antes = _snapshot(data_dir)
+
+    def falla(csv_path, raw_batch):
+        with open(csv_path, "a", encoding="utf-8") as f:
+            f.write("2024-02-01,P0")
+        raise OSError("disco lleno")
+
+    monkeypatch.setattr(sales_store, "_append_csv", falla)
+    nuevas = pd.DataFrame([
+        {"fecha": "2024-01-07", "producto_id": "P01", "cantidad_vendida": 4},
+        {"fecha": "2031-05-01", "producto_id": "P02", "cantidad_vendida": 1},
+    ])
+    with pytest.raises(OSError):
+        append_ventas(data_dir, nuevas)
+    assert _snapshot(data_dir) == antes